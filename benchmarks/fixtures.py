@@ -0,0 +1,297 @@
+"""
+Synthetic fixtures for benchmarks and offline load tests.
+假的交易所、Discord 物件與 OHLCV 產生器，讓 cog 可以在沒有網路的情況下被直接呼叫。
+"""
+
+import os
+import math
+import random
+import asyncio
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+
+import ccxt.async_support as ccxt
+import discord
+from discord.ext import commands
+
+HOUR_MS = 3_600_000
+
+DEFAULT_SYMBOLS = {
+    "BTC/USDT": 65_000.0,
+    "ETH/USDT": 3_200.0,
+    "BNB/USDT": 580.0,
+    "SOL/USDT": 150.0,
+    "DOGE/USDT": 0.15,
+    "XRP/USDT": 0.55,
+}
+
+
+def synthetic_ohlcv(
+    n: int,
+    start_price: float = 100.0,
+    seed: int = 0,
+    timeframe_ms: int = HOUR_MS,
+    end_ms: int | None = None,
+) -> list[list[float]]:
+    """Geometric random-walk candles ``[ts, open, high, low, close, volume]``."""
+    rng = random.Random(seed)
+    if end_ms is None:
+        end_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000) // timeframe_ms * timeframe_ms
+    ts = end_ms - (n - 1) * timeframe_ms
+    price = start_price
+    candles = []
+    for _ in range(n):
+        o = price
+        c = o * math.exp(rng.gauss(0, 0.01))
+        h = max(o, c) * (1 + abs(rng.gauss(0, 0.004)))
+        l = min(o, c) * (1 - abs(rng.gauss(0, 0.004)))
+        v = abs(rng.gauss(1_000, 300))
+        candles.append([ts, o, h, l, c, v])
+        price = c
+        ts += timeframe_ms
+    return candles
+
+
+# ── Fake exchange ────────────────────────────────────────────────────
+class FakeExchange:
+    """Stand-in for ``ccxt.async_support.binance`` with random-walk prices.
+
+    ``latency`` (seconds) is awaited on every call to mimic network round trips;
+    a ``tail_rate`` share of calls takes ``tail_latency`` instead. Several fake
+    venues can quote one market by sharing a ``prices`` dict; ``bias``
+    skews this venue's tickers (for outlier checks).
+    """
+
+    def __init__(
+        self,
+        symbols: dict[str, float] | None = None,
+        seed: int = 7,
+        latency: float = 0.0,
+        volatility: float = 0.002,
+        exchange_id: str = "fake",
+        prices: dict[str, float] | None = None,
+        tail_rate: float = 0.0,
+        tail_latency: float = 1.0,
+        bias: float = 1.0,
+    ) -> None:
+        self.id = exchange_id
+        self.prices = prices if prices is not None else dict(symbols or DEFAULT_SYMBOLS)
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.volatility = volatility
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.bias = bias
+        self._latency_rng = random.Random(seed + 1)
+        self.calls: Counter[str] = Counter()
+
+    async def _delay(self, method: str) -> None:
+        self.calls[method] += 1
+        latency = self.latency
+        if self.tail_rate and self._latency_rng.random() < self.tail_rate:
+            latency = self.tail_latency
+        if latency:
+            await asyncio.sleep(latency)
+
+    def _tick(self, symbol: str) -> float:
+        if symbol not in self.prices:
+            raise ccxt.BadSymbol(f"binance does not have market symbol {symbol}")
+        self.prices[symbol] *= math.exp(self.rng.gauss(0, self.volatility))
+        return self.prices[symbol]
+
+    def _ticker(self, symbol: str) -> dict:
+        price = self._tick(symbol) * self.bias
+        now = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
+        return {"symbol": symbol, "last": price, "bid": price, "ask": price, "timestamp": now}
+
+    async def fetch_ticker(self, symbol: str, params: dict | None = None) -> dict:
+        await self._delay("fetch_ticker")
+        return self._ticker(symbol)
+
+    async def fetch_tickers(self, symbols: list[str] | None = None, params: dict | None = None) -> dict:
+        await self._delay("fetch_tickers")
+        return {s: self._ticker(s) for s in (symbols or self.prices)}
+
+    async def fetch_ohlcv(
+        self, symbol: str, timeframe: str = "1h", since: int | None = None,
+        limit: int | None = None, params: dict | None = None,
+    ) -> list:
+        await self._delay("fetch_ohlcv")
+        price = self._tick(symbol)
+        tf_ms = int(ccxt.Exchange.parse_timeframe(timeframe) * 1000)
+        limit = limit or 500
+        end_ms = None
+        if since is not None:
+            end_ms = since + (limit - 1) * tf_ms
+        candles = synthetic_ohlcv(limit, price, seed=zlib.crc32(f"{symbol}|{since}|{limit}".encode()),
+                                  timeframe_ms=tf_ms, end_ms=end_ms)
+        now = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
+        return [c for c in candles if c[0] <= now]
+
+    async def load_markets(self, reload: bool = False, params: dict | None = None) -> dict:
+        await self._delay("load_markets")
+        return {
+            s: {
+                "symbol": s, "base": s.split("/")[0], "quote": s.split("/")[1],
+                "active": True, "spot": True, "type": "spot",
+                "precision": {"amount": 1e-6, "price": 1e-8},
+                "limits": {"amount": {"min": 1e-6}, "cost": {"min": 1.0}},
+            }
+            for s in self.prices
+        }
+
+    async def close(self) -> None:
+        pass
+
+
+def fake_venues(n: int, seed: int = 7, **kwargs) -> list[FakeExchange]:
+    """*n* fake venues quoting the same random-walk market (``venue0`` is the primary)."""
+    prices = dict(DEFAULT_SYMBOLS)
+    return [FakeExchange(seed=seed + 10 * i, exchange_id=f"venue{i}", prices=prices, **kwargs) for i in range(n)]
+
+
+# ── Fake LLM ─────────────────────────────────────────────────────────
+class _FakeResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class _FakeModels:
+    def __init__(self, client: "FakeLLMClient") -> None:
+        self._client = client
+
+    async def generate_content(self, model: str, contents: str, config=None) -> _FakeResponse:
+        client = self._client
+        client.calls += 1
+        if client.latency:
+            await asyncio.sleep(client.rng.expovariate(1 / client.latency))
+        if client.error_rate and client.rng.random() < client.error_rate:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED (simulated)")
+        trend = client.rng.choice(["Bullish 🟢", "Bearish 🔴", "Sideways ⚪"])
+        return _FakeResponse(
+            f"Trend: {trend}\n"
+            "Analysis: Synthetic candles, synthetic conviction. The chart is a random walk and so is your strategy.\n"
+            "Advice: Touch grass before touching leverage."
+        )
+
+
+class _FakeAio:
+    def __init__(self, client: "FakeLLMClient") -> None:
+        self.models = _FakeModels(client)
+
+
+class FakeLLMClient:
+    """Stand-in for ``genai.Client``: ``client.aio.models.generate_content(...)``.
+
+    Latency is exponentially distributed around ``latency`` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 11) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.aio = _FakeAio(self)
+
+
+# ── Fake Discord objects ─────────────────────────────────────────────
+class _AsyncNull:
+    """``async with ctx.typing():`` placeholder."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str | None = None) -> None:
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+
+class FakeChannel:
+    """Records how many messages were sent; keeps only the last one to bound memory."""
+
+    def __init__(self, channel_id: int) -> None:
+        self.id = channel_id
+        self.sent = 0
+        self.last: tuple[tuple, dict] | None = None
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        self.last = (args, kwargs)
+        return None
+
+    def typing(self):
+        return _AsyncNull()
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, name: str = "Bench Guild") -> None:
+        self.id = guild_id
+        self.name = name
+        self.members: list[FakeUser] = []
+
+
+class FakeContext:
+    """Just enough of ``commands.Context`` for cog command callbacks."""
+
+    def __init__(self, bot: commands.Bot, author: FakeUser, channel: FakeChannel,
+                 guild: FakeGuild | None = None, command_name: str | None = None) -> None:
+        self.bot = bot
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.interaction = None
+        self.command = None
+        self.command_name = command_name
+        self.replies: list[str | None] = []  # 每次回覆的文字內容（只有 embed 時為 None）
+
+    async def send(self, content=None, *args, **kwargs):
+        self.replies.append(content)
+        return await self.channel.send(content, *args, **kwargs)
+
+    async def reply(self, content=None, *args, **kwargs):
+        return await self.send(content, *args, **kwargs)
+
+    async def defer(self, *args, **kwargs) -> None:
+        return None
+
+    def typing(self):
+        return _AsyncNull()
+
+
+class FakeBot(commands.Bot):
+    """A never-connected Bot whose channel / user lookups return fakes."""
+
+    def __init__(self) -> None:
+        super().__init__(command_prefix="!", intents=discord.Intents.default())
+        self.channels: dict[int, FakeChannel] = {}
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        if channel_id not in self.channels:
+            self.channels[channel_id] = FakeChannel(channel_id)
+        return self.channels[channel_id]
+
+    def get_partial_messageable(self, channel_id: int, **kwargs) -> FakeChannel:
+        return self.get_channel(channel_id)
+
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        return FakeUser(user_id)
+
+    async def wait_until_ready(self) -> None:
+        return None
+
+
+def use_temp_db(tmp_dir: str) -> str:
+    """Point ``TradingDB`` (and the markets cache) at scratch files; must run before the cogs are imported."""
+    path = os.path.join(tmp_dir, "trading.db")
+    os.environ["TRADING_DB_PATH"] = path
+    os.environ["MARKETS_CACHE_PATH"] = os.path.join(tmp_dir, "markets.json")
+    return path
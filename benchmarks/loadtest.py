@@ -0,0 +1,333 @@
+"""
+Offline load-test harness — drive the cogs with thousands of virtual users.
+
+Commands are invoked directly on the cogs with fake ``commands.Context``
+objects, a stubbed exchange and a stubbed LLM client; the on-chain commands
+run against a local EVM node when ``--chain-rpc`` is given. Arrivals are an
+open-loop Poisson process, so a saturated cog shows up as growing latency
+rather than as a slower request rate.
+
+    python -m benchmarks.loadtest --users 1000 --rate 200 --duration 30
+    python -m benchmarks.loadtest --mix buy=5,chart=1 --exchange-latency 0.08
+    python -m benchmarks.loadtest --mix buy=1 --exchange-tail 0.03:0.8 --venues 3
+    python -m benchmarks.loadtest --replay tape.jsonl.gz --replay-speed 60
+    python -m benchmarks.loadtest --chain-rpc http://127.0.0.1:8545 --mix submit=1,leaderboard=3
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import warnings
+import statistics
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("GEMINI_API_KEY", "loadtest-dummy-key")
+warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+from benchmarks.fixtures import (  # noqa: E402
+    DEFAULT_SYMBOLS, FakeBot, FakeChannel, FakeContext, FakeGuild,
+    FakeLLMClient, FakeUser, fake_venues, use_temp_db,
+)
+
+use_temp_db(tempfile.mkdtemp(prefix="paper_degen_load_"))
+
+DEFAULT_MIX = "buy=30,sell=10,portfolio=20,analyze=8,chart=5,alert=12,alerts=5,leaderboard=0,submit=0"
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if float(weight or 1) > 0:
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Harness:
+    """Builds the cogs on a fake bot and fires commands at them."""
+
+    def __init__(self, args) -> None:
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.bot = FakeBot()
+        self.guilds = [FakeGuild(900_000 + g, f"Guild {g}") for g in range(args.guilds)]
+        self.users = [FakeUser(1_000_000 + i) for i in range(args.users)]
+        self.channels = [FakeChannel(500_000 + c) for c in range(args.guilds * 3)]
+        for i, user in enumerate(self.users):
+            self.guilds[i % len(self.guilds)].members.append(user)
+
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.rejected: dict[str, int] = defaultdict(int)
+        self.shed: dict[str, int] = defaultdict(int)  # 被排程器擋下（🚦）的次數
+        self.loop_lag: list[float] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    # -- setup --
+    async def setup(self) -> None:
+        from cogs.alert import Alert
+        from cogs.game import Game
+        from cogs.market import Market
+        from core.exchange import release_exchange
+        from core.venues import Venue, VenueRouter
+
+        tail_rate, _, tail_latency = self.args.exchange_tail.partition(":")
+        if self.args.replay:
+            from benchmarks.replay import ReplayExchange
+            # 錄到的行情與延遲；多個 venue 時每家都播同一卷
+            self.venues = [
+                ReplayExchange(self.args.replay, speed=self.args.replay_speed, latency=self.args.replay_latency,
+                               exchange_id=f"venue{i}" if self.args.venues > 1 else None)
+                for i in range(self.args.venues)
+            ]
+        else:
+            self.venues = fake_venues(
+                self.args.venues, seed=self.args.seed, latency=self.args.exchange_latency,
+                tail_rate=float(tail_rate), tail_latency=float(tail_latency or 1.0),
+            )
+        self.exchange = self.venues[0]
+        if len(self.venues) > 1:
+            self.exchange = VenueRouter([Venue(v.id, v) for v in self.venues])
+        self.symbols = [s for s in DEFAULT_SYMBOLS if s in self.exchange.prices] or list(self.exchange.prices)
+        self.llm = FakeLLMClient(latency=self.args.llm_latency, error_rate=self.args.llm_error_rate)
+
+        self.market = Market(self.bot)
+        self.game = Game(self.bot)
+        self.alert = Alert(self.bot)
+        for cog in (self.market, self.game, self.alert):
+            real, cog.exchange = cog.exchange, self.exchange
+            await release_exchange(real)
+        self.market.client = self.llm
+        self.alert.check_alerts.change_interval(seconds=self.args.alert_interval)
+        for cog in (self.market, self.game, self.alert):
+            await self.bot.add_cog(cog)
+
+        self.chain = None
+        if self.args.chain_rpc:
+            await self._setup_chain()
+
+        self.commands = {
+            "buy": (self.game, self.game.buy, self._buy_args),
+            "sell": (self.game, self.game.sell, self._sell_args),
+            "portfolio": (self.game, self.game.portfolio, lambda u: ()),
+            "analyze": (self.market, self.market.analyze, lambda u: (self._symbol(),)),
+            "chart": (self.market, self.market.chart, lambda u: (self._symbol(),)),
+            "alert": (self.alert, self.alert.set_alert, self._alert_args),
+            "alerts": (self.alert, self.alert.list_alerts, lambda u: ()),
+        }
+        if self.chain is not None:
+            self.commands.update({
+                "submit": (self.chain, self.chain.submit, lambda u: ()),
+                "leaderboard": (self.chain, self.chain.leaderboard, lambda u: ()),
+                "standings": (self.chain, self.chain.standings, lambda u: ()),
+            })
+
+    async def _setup_chain(self) -> None:
+        from web3 import Web3
+        from cogs.chain import Chain
+        from core.artifacts import load_abi
+        from core.multicall import BatchReader
+        from core.rpc import make_web3
+        from generate_tx import LOCAL_DEV_KEY, deploy_contract
+
+        chain = Chain(self.bot)
+        chain.rpc_health.cancel()
+        chain.w3 = make_web3("local", self.args.chain_rpc.split(","))
+        chain.network_name = "Local EVM"
+        chain.private_key = os.getenv("LOCAL_PRIVATE_KEY", LOCAL_DEV_KEY)
+        chain.bot_account = chain.w3.eth.account.from_key(chain.private_key)
+        address = self.args.contract or await asyncio.to_thread(
+            deploy_contract, chain.w3, chain.bot_account, chain.private_key
+        )
+        chain.contract = chain.w3.eth.contract(
+            address=Web3.to_checksum_address(address), abi=load_abi("Leaderboard")
+        )
+        chain.batch_reader = BatchReader(chain.w3)
+        await self.bot.add_cog(chain)
+        self.chain = chain
+
+    # -- argument generators --
+    def _symbol(self) -> str:
+        return self.rng.choice(self.symbols)
+
+    def _buy_args(self, user: FakeUser) -> tuple:
+        return (self._symbol(), round(self.rng.uniform(5, 200), 2))
+
+    def _sell_args(self, user: FakeUser) -> tuple:
+        holdings = self.game.db.get_all_holdings(str(user.id))
+        if not holdings:
+            return (self._symbol(), 0.001)
+        h = self.rng.choice(holdings)
+        return (h["symbol"], h["quantity"] * self.rng.uniform(0.1, 0.5))
+
+    def _alert_args(self, user: FakeUser) -> tuple:
+        symbol = self._symbol()
+        return (symbol, self.exchange.prices[symbol] * self.rng.uniform(0.97, 1.03))
+
+    # -- execution --
+    async def invoke(self, name: str) -> None:
+        cog, command, make_args = self.commands[name]
+        idx = self.rng.randrange(len(self.users))
+        user = self.users[idx]
+        guild = self.guilds[idx % len(self.guilds)]
+        channel = self.channels[idx % len(self.channels)]
+        ctx = FakeContext(self.bot, user, channel, guild, command_name=name)
+        args = make_args(user)
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            await command.callback(cog, ctx, *args)
+        except Exception:
+            self.errors[name] += 1
+        else:
+            # 指令自己回覆 ❌ 代表被拒絕（餘額不足、找不到交易對…），不算崩潰
+            if any(r and str(r).startswith("❌") for r in ctx.replies):
+                self.rejected[name] += 1
+            if any(r and "🚦" in str(r) for r in ctx.replies):
+                self.shed[name] += 1
+        finally:
+            self.latencies[name].append(time.perf_counter() - start)
+            self.in_flight -= 1
+
+    async def monitor_loop_lag(self, interval: float = 0.05) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, time.perf_counter() - start - interval))
+
+    async def run(self) -> dict:
+        await self.setup()
+        mix = {k: v for k, v in parse_mix(self.args.mix).items() if k in self.commands}
+        skipped = set(parse_mix(self.args.mix)) - set(mix)
+        if skipped:
+            print(f"Skipping commands without a backend: {', '.join(sorted(skipped))}")
+        names, weights = list(mix), list(mix.values())
+
+        monitor = asyncio.create_task(self.monitor_loop_lag())
+        tasks: set[asyncio.Task] = set()
+        start = time.perf_counter()
+        deadline = start + self.args.duration
+        issued = 0
+        next_at = start
+        while next_at < deadline:
+            # 以絕對時間排程：event loop 被卡住時，醒來後把積欠的到達一次補發
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = self.rng.choices(names, weights)[0]
+            task = asyncio.create_task(self.invoke(name))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            issued += 1
+            next_at += self.rng.expovariate(self.args.rate)
+        issue_elapsed = time.perf_counter() - start
+
+        # 等尚未完成的指令收尾（上限 drain 秒數）
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.args.drain)
+        elapsed = time.perf_counter() - start
+        monitor.cancel()
+        self.alert.check_alerts.cancel()
+
+        return self.report(issued, issue_elapsed, elapsed, len(tasks))
+
+    def report(self, issued: int, issue_elapsed: float, elapsed: float, unfinished: int) -> dict:
+        commands = {}
+        for name, samples in sorted(self.latencies.items()):
+            commands[name] = {
+                "count": len(samples),
+                "errors": self.errors[name],
+                "rejected": self.rejected[name],
+                "shed": self.shed[name],
+                "error_rate": round(self.errors[name] / len(samples), 4),
+                "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+                "max_ms": round(max(samples) * 1000, 2),
+                "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+            }
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "json"},
+            "issued": issued,
+            "completed": sum(len(s) for s in self.latencies.values()),
+            "unfinished": unfinished,
+            "offered_rate": round(issued / max(issue_elapsed, self.args.duration), 2),
+            "achieved_rate": round(sum(len(s) for s in self.latencies.values()) / elapsed, 2),
+            "max_in_flight": self.max_in_flight,
+            "loop_lag_ms": {
+                "p50": round(percentile(self.loop_lag, 0.50) * 1000, 2),
+                "p99": round(percentile(self.loop_lag, 0.99) * 1000, 2),
+                "max": round(max(self.loop_lag, default=0.0) * 1000, 2),
+            },
+            "exchange_calls": dict(self.venues[0].calls),
+            "venue_calls": {v.id: sum(v.calls.values()) for v in self.venues},
+            "llm_calls": self.llm.calls,
+            "commands": commands,
+        }
+
+
+def print_report(report: dict) -> None:
+    print(f"\nissued {report['issued']} · completed {report['completed']} · unfinished {report['unfinished']}"
+          f" · offered {report['offered_rate']}/s · achieved {report['achieved_rate']}/s"
+          f" · max in-flight {report['max_in_flight']}")
+    lag = report["loop_lag_ms"]
+    print(f"event-loop lag: p50 {lag['p50']} ms · p99 {lag['p99']} ms · max {lag['max']} ms")
+    print(f"\n{'command':<12} {'count':>7} {'err%':>7} {'rej':>6} {'shed':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    by_p99 = sorted(report["commands"].items(), key=lambda kv: kv[1]["p99_ms"], reverse=True)
+    for name, c in by_p99:
+        print(f"{name:<12} {c['count']:>7} {c['error_rate']:>7.2%} {c['rejected']:>6} {c['shed']:>6} "
+              f"{c['p50_ms']:>8.1f}ms {c['p95_ms']:>8.1f}ms {c['p99_ms']:>8.1f}ms {c['max_ms']:>8.1f}ms")
+    if by_p99:
+        print(f"\nSlowest under load: {by_p99[0][0]} (p99 {by_p99[0][1]['p99_ms']} ms)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Paper Degen offline load test")
+    parser.add_argument("--users", type=int, default=1000, help="virtual users")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=100.0, help="command arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of arrivals")
+    parser.add_argument("--drain", type=float, default=30.0, help="max seconds to wait for stragglers")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command=weight,… (e.g. buy=3,chart=1)")
+    parser.add_argument("--exchange-latency", type=float, default=0.05, help="seconds per exchange call")
+    parser.add_argument("--exchange-tail", default="0:1", help="RATE:SECONDS — share of exchange calls that are slow")
+    parser.add_argument("--venues", type=int, default=1, help="fake venues behind a hedging VenueRouter")
+    parser.add_argument("--replay", type=Path, help="serve a tape recorded by benchmarks.replay instead of fake prices")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="replay clock speed-up (0 freezes it)")
+    parser.add_argument("--replay-latency", type=float, help="fixed seconds per call (default: recorded latency)")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="mean seconds per LLM call")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--alert-interval", type=float, default=5.0, help="check_alerts period")
+    parser.add_argument("--chain-rpc", help="local EVM node URL(s) for /submit, /leaderboard, /standings")
+    parser.add_argument("--contract", help="existing Leaderboard on the local node (default: deploy one)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(Harness(args).run())
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Record live exchange responses once, replay them offline.
+
+``RecordingExchange`` wraps a ccxt client (or anything shaped like one) and
+appends every ``fetch_ticker`` / ``fetch_tickers`` / ``fetch_ohlcv`` /
+``load_markets`` answer to a gzip'd JSON-lines tape, with the time it
+arrived, how long the call took, and the error if there was one. Tickers
+are trimmed to the fields the bot reads, and ``info`` is dropped.
+
+``ReplayExchange`` serves a tape as a stand-in client. Its clock starts at
+the beginning of the recording on the first call and runs ``speed`` times
+faster than real time (``speed=0`` freezes it at ``start`` seconds in, for
+fully deterministic runs). Each call returns what the exchange last
+answered for that symbol at or before the replay clock:
+
+* recorded errors are raised again, so outages replay too;
+* candles from every snapshot up to the clock are merged, and the
+  ``since`` / ``limit`` arguments are applied to the result;
+* each call sleeps for its recorded latency, or for a fixed ``latency``.
+
+Timestamps are shifted by whole hours so the tape looks recent. Stored
+candles and quote ages then behave as they would live.
+
+    python -m benchmarks.replay record tape.jsonl.gz --minutes 30 --interval 5
+    python -m benchmarks.replay info tape.jsonl.gz
+    python -m benchmarks.loadtest --replay tape.jsonl.gz --replay-speed 60
+"""
+
+import sys
+import gzip
+import json
+import time
+import asyncio
+import argparse
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import ccxt.async_support as ccxt
+
+HOUR_MS = 3_600_000
+FORMAT_VERSION = 1
+RECORDED_METHODS = ("fetch_ticker", "fetch_tickers", "fetch_ohlcv", "load_markets")
+TICKER_FIELDS = ("symbol", "timestamp", "last", "bid", "ask", "high", "low", "open", "close",
+                 "baseVolume", "quoteVolume", "change", "percentage")
+MARKET_FIELDS = ("symbol", "base", "quote", "active", "spot", "type", "precision", "limits")
+
+
+def _compact_ticker(ticker: dict) -> dict:
+    return {k: ticker[k] for k in TICKER_FIELDS if ticker.get(k) is not None}
+
+
+def _compact(method: str, result):
+    if method == "fetch_ticker":
+        return _compact_ticker(result)
+    if method == "fetch_tickers":
+        return {s: _compact_ticker(t) for s, t in result.items()}
+    if method == "load_markets":
+        return {s: {k: m.get(k) for k in MARKET_FIELDS} for s, m in result.items()}
+    return result
+
+
+# ── Recording ────────────────────────────────────────────────────────
+class RecordingExchange:
+    """Transparent proxy that appends every recorded call to *path*; other attributes pass through."""
+
+    def __init__(self, exchange, path: str | Path) -> None:
+        self._exchange = exchange
+        self.path = Path(path)
+        self.records = 0
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._write({"v": FORMAT_VERSION, "exchange": getattr(exchange, "id", "exchange"),
+                     "start": round(time.time(), 3)})
+
+    def _write(self, obj: dict) -> None:
+        self._file.write(json.dumps(obj, separators=(",", ":")) + "\n")
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._exchange, name)
+        if name not in RECORDED_METHODS:
+            return attr
+
+        async def recorded(*args, **kwargs):
+            start = time.perf_counter()
+            entry = {"t": 0.0, "m": name, "a": self._key(name, args, kwargs)}
+            try:
+                result = await attr(*args, **kwargs)
+            except ccxt.BaseError as exc:
+                entry["e"] = [type(exc).__name__, str(exc)[:200]]
+                raise
+            else:
+                entry["r"] = _compact(name, result)
+                return result
+            finally:
+                entry["t"] = round(time.time(), 3)
+                entry["l"] = round((time.perf_counter() - start) * 1000, 1)
+                self._write(entry)
+                self.records += 1
+
+        return recorded
+
+    @staticmethod
+    def _key(method: str, args: tuple, kwargs: dict) -> list:
+        names = {"fetch_ticker": ("symbol",), "fetch_tickers": ("symbols",),
+                 "fetch_ohlcv": ("symbol", "timeframe", "since", "limit")}.get(method, ())
+        key = [args[i] if i < len(args) else kwargs.get(n) for i, n in enumerate(names)]
+        if method == "fetch_ohlcv" and key[1] is None:
+            key[1] = "1m"  # ccxt 的預設 timeframe
+        return key
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    async def close(self) -> None:
+        self._file.close()
+        await self._exchange.close()
+
+
+# ── Replay ───────────────────────────────────────────────────────────
+class _Tape:
+    """One key's recorded answers, oldest first: arrival ``times`` and ``(latency, result_or_error)``."""
+
+    def __init__(self) -> None:
+        self.times: list[float] = []
+        self.entries: list[tuple[float, object]] = []
+
+    def add(self, at: float, latency: float, value) -> None:
+        self.times.append(at)
+        self.entries.append((latency, value))
+
+    def index(self, clock: float) -> int:
+        """Latest entry at or before *clock*; the first one if the clock is earlier."""
+        return max(0, bisect_right(self.times, clock) - 1)
+
+
+class ReplayExchange:
+    """Stand-in for a ccxt async client that serves a tape recorded by ``RecordingExchange``.
+
+    ``latency=None`` sleeps for each answer's recorded latency; a number
+    sleeps that long on every call instead.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        speed: float = 1.0,
+        latency: float | None = None,
+        start: float = 0.0,
+        rebase: bool = True,
+        exchange_id: str | None = None,
+    ) -> None:
+        self.speed = speed
+        self.latency = latency
+        self.offset = start
+        self.calls: Counter[str] = Counter()
+        self._tickers: dict[str, _Tape] = defaultdict(_Tape)
+        self._bulk = _Tape()          # 每次 fetch_tickers 的延遲與成敗（成功時值為 None）
+        self._ohlcv: dict[tuple[str, str], _Tape] = defaultdict(_Tape)
+        # (symbol, timeframe) -> (已合併到第幾個快照, ts -> candle)
+        self._merged: dict[tuple[str, str], tuple[int, dict[int, list]]] = {}
+        self._markets: dict | None = None
+        self._t0: float | None = None
+        self._load(Path(path), rebase)
+        if exchange_id:
+            self.id = exchange_id
+
+    # -- loading --
+    def _load(self, path: Path, rebase: bool) -> None:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("v") != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported tape version {header.get('v')}")
+            entries = [json.loads(line) for line in f if line.strip()]
+        self.id = header["exchange"]
+        # 整數小時的平移：K 線仍對齊整點，錄到的資料看起來像剛剛發生
+        shift_ms = (int(time.time() * 1000) - int(header["start"] * 1000)) // HOUR_MS * HOUR_MS if rebase else 0
+        shift = shift_ms / 1000
+        self.started = header["start"] + shift
+        self.ended = self.started
+        for e in entries:
+            at, latency, method, key = e["t"] + shift, e["l"] / 1000, e["m"], e["a"]
+            self.ended = max(self.ended, at)
+            error = tuple(e["e"]) if "e" in e else None
+            if method == "fetch_ticker":
+                self._tickers[key[0]].add(at, latency, error or self._shift_ticker(e["r"], shift_ms))
+            elif method == "fetch_tickers":
+                self._bulk.add(at, latency, error)
+                for symbol, ticker in ({} if error else e["r"]).items():
+                    self._tickers[symbol].add(at, latency, self._shift_ticker(ticker, shift_ms))
+            elif method == "fetch_ohlcv":
+                candles = error or [[c[0] + shift_ms, *c[1:]] for c in e["r"]]
+                self._ohlcv[(key[0], key[1])].add(at, latency, candles)
+            elif method == "load_markets" and not error:
+                self._markets = e["r"]
+        for tape in (*self._tickers.values(), *self._ohlcv.values(), self._bulk):
+            order = sorted(range(len(tape.times)), key=tape.times.__getitem__)
+            tape.times = [tape.times[i] for i in order]
+            tape.entries = [tape.entries[i] for i in order]
+
+    @staticmethod
+    def _shift_ticker(ticker: dict, shift_ms: int) -> dict:
+        if ticker.get("timestamp") is not None:
+            ticker = dict(ticker, timestamp=ticker["timestamp"] + shift_ms)
+        return ticker
+
+    # -- clock --
+    def clock(self) -> float:
+        """Replay time (unix seconds on the shifted tape); starts on the first call."""
+        if self._t0 is None:
+            self._t0 = time.monotonic()
+        return min(self.ended, self.started + self.offset + (time.monotonic() - self._t0) * self.speed)
+
+    def rewind(self, start: float = 0.0) -> None:
+        self.offset, self._t0 = start, None
+        self._merged.clear()
+
+    @property
+    def prices(self) -> dict[str, float]:
+        """Last traded price of every recorded symbol at the replay clock."""
+        clock = self.clock()
+        prices = {}
+        for symbol, tape in self._tickers.items():
+            for i in range(tape.index(clock), -1, -1):
+                value = tape.entries[i][1]
+                if isinstance(value, dict):
+                    prices[symbol] = value["last"]
+                    break
+        return prices
+
+    async def _delay(self, method: str, recorded: float) -> None:
+        self.calls[method] += 1
+        latency = recorded if self.latency is None else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+    @staticmethod
+    def _raise(error: tuple) -> None:
+        name, message = error
+        raise getattr(ccxt, name, ccxt.ExchangeError)(message)
+
+    def _ticker_at(self, symbol: str, clock: float) -> tuple[float, dict | tuple]:
+        tape = self._tickers.get(symbol)
+        if tape is None:
+            raise ccxt.BadSymbol(f"{self.id} replay has no ticker for {symbol}")
+        return tape.entries[tape.index(clock)]
+
+    # -- ccxt surface --
+    async def fetch_ticker(self, symbol: str, params: dict | None = None) -> dict:
+        latency, value = self._ticker_at(symbol, self.clock())
+        await self._delay("fetch_ticker", latency)
+        if isinstance(value, tuple):
+            self._raise(value)
+        return dict(value)
+
+    async def fetch_tickers(self, symbols: list[str] | None = None, params: dict | None = None) -> dict:
+        clock = self.clock()
+        picked = {s: self._ticker_at(s, clock) for s in (symbols or self._tickers)}
+        latency, error = self._bulk.entries[self._bulk.index(clock)] if self._bulk.times else (0.0, None)
+        if error:
+            await self._delay("fetch_tickers", latency)
+            self._raise(error)
+        await self._delay("fetch_tickers", latency)
+        tickers = {}
+        for symbol, (_, value) in picked.items():
+            if isinstance(value, dict):
+                tickers[symbol] = dict(value)
+        return tickers
+
+    async def fetch_ohlcv(
+        self, symbol: str, timeframe: str = "1m", since: int | None = None,
+        limit: int | None = None, params: dict | None = None,
+    ) -> list:
+        tape = self._ohlcv.get((symbol, timeframe))
+        if tape is None:
+            raise ccxt.BadSymbol(f"{self.id} replay has no {timeframe} candles for {symbol}")
+        clock = self.clock()
+        idx = tape.index(clock)
+        latency, value = tape.entries[idx]
+        await self._delay("fetch_ohlcv", latency)
+        if isinstance(value, tuple):
+            self._raise(value)
+        candles = self._candles((symbol, timeframe), tape, idx)
+        if since is not None:
+            candles = [c for c in candles if c[0] >= since]
+            return candles[:limit] if limit else candles
+        return candles[-limit:] if limit else candles
+
+    def _candles(self, key: tuple[str, str], tape: _Tape, idx: int) -> list[list]:
+        """Every candle recorded up to snapshot *idx*, later snapshots overriding (the forming bar changes)."""
+        upto, merged = self._merged.get(key, (-1, {}))
+        if idx < upto:
+            upto, merged = -1, {}  # rewind 之後時鐘倒退，重新合併
+        for _, value in tape.entries[upto + 1:idx + 1]:
+            if isinstance(value, list):
+                for c in value:
+                    merged[c[0]] = c
+        self._merged[key] = (idx, merged)
+        return [list(merged[ts]) for ts in sorted(merged)]
+
+    async def load_markets(self, reload: bool = False, params: dict | None = None) -> dict:
+        await self._delay("load_markets", 0.0)
+        if self._markets is not None:
+            return self._markets
+        # 錄製時沒有呼叫 load_markets：以有報價的交易對推出最基本的市場資料
+        return {
+            s: {"symbol": s, "base": s.split("/")[0], "quote": s.split("/")[1],
+                "active": True, "spot": True, "type": "spot", "precision": {}, "limits": {}}
+            for s in self._tickers
+        }
+
+    async def close(self) -> None:
+        pass
+
+    def describe(self) -> dict:
+        return {
+            "exchange": self.id,
+            "seconds": round(self.ended - self.started, 1),
+            "tickers": {s: len(t.times) for s, t in sorted(self._tickers.items())},
+            "ohlcv": {f"{s} {tf}": len(t.times) for (s, tf), t in sorted(self._ohlcv.items())},
+            "markets": len(self._markets or {}),
+        }
+
+
+# ── CLI ──────────────────────────────────────────────────────────────
+async def record(args) -> None:
+    exchange = RecordingExchange(getattr(ccxt, args.exchange)({"enableRateLimit": True}), args.out)
+    symbols = args.symbols.split(",")
+    try:
+        await exchange.load_markets()
+        start_ms = int(time.time() * 1000) - args.history_days * 24 * HOUR_MS
+        for symbol in symbols:
+            # 先錄一段 1h 歷史，replay 時 CandleStore 冷啟動也有資料可補
+            since = start_ms
+            while True:
+                batch = await exchange.fetch_ohlcv(symbol, "1h", since=since, limit=1000)
+                if len(batch) < 1000:
+                    break
+                since = batch[-1][0] + HOUR_MS
+        deadline = time.monotonic() + args.minutes * 60
+        turn = 0
+        while time.monotonic() < deadline:
+            # 和 bot 的迴圈一樣：整批報價 + 單一報價 + 最新 K 線
+            for call in (exchange.fetch_tickers(symbols),
+                         exchange.fetch_ticker(symbols[turn % len(symbols)]),
+                         exchange.fetch_ohlcv(symbols[turn % len(symbols)], "1h", limit=3)):
+                try:
+                    await call
+                except ccxt.BaseError as exc:
+                    print(f"recorded error: {type(exc).__name__}: {exc}", file=sys.stderr)
+            turn += 1
+            exchange.flush()
+            print(f"\r{exchange.records} records", end="", flush=True)
+            await asyncio.sleep(args.interval)
+        print()
+    finally:
+        await exchange.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record or inspect exchange replay tapes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="poll a live exchange into a tape")
+    rec.add_argument("out", type=Path)
+    rec.add_argument("--exchange", default="binance")
+    rec.add_argument("--symbols", default="BTC/USDT,ETH/USDT,BNB/USDT,SOL/USDT,DOGE/USDT,XRP/USDT")
+    rec.add_argument("--minutes", type=float, default=10.0)
+    rec.add_argument("--interval", type=float, default=5.0, help="seconds between polls")
+    rec.add_argument("--history-days", type=int, default=30, help="1h candles recorded up front")
+    info = sub.add_parser("info", help="summarize a tape")
+    info.add_argument("tape", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        asyncio.run(record(args))
+    else:
+        print(json.dumps(ReplayExchange(args.tape, rebase=False).describe(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+Benchmark suite for the bot's hot paths, on synthetic data.
+
+    python -m benchmarks.run                      # quick sizes, writes benchmarks/results/<ts>.json
+    python -m benchmarks.run --full               # adds the large cases (e.g. 1M alerts)
+    python -m benchmarks.run -k alert             # only benchmarks whose name contains "alert"
+    python -m benchmarks.run --save-baseline      # also store as benchmarks/results/baseline.json
+    python -m benchmarks.run --compare benchmarks/results/baseline.json --threshold 0.15
+
+With --compare the process exits non-zero if any benchmark's median got slower
+than the baseline by more than the threshold.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import warnings
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+sys.path.insert(0, str(ROOT))
+
+# cogs 在 import 時就會讀環境變數，先把它們指到假的設定
+_TMP = tempfile.mkdtemp(prefix="paper_degen_bench_")
+os.environ.setdefault("GEMINI_API_KEY", "bench-dummy-key")
+# 圖表標題含 emoji / 中文，CI 機器通常沒有對應字型
+warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+from benchmarks.fixtures import (  # noqa: E402
+    DEFAULT_SYMBOLS, FakeBot, FakeChannel, FakeContext, FakeExchange, FakeGuild, FakeUser,
+    fake_venues, synthetic_ohlcv, use_temp_db,
+)
+
+use_temp_db(_TMP)
+
+BENCHMARKS: list[tuple[str, object, bool]] = []
+
+
+def bench(name: str, full_only: bool = False):
+    """Register an async benchmark factory.
+
+    The decorated coroutine does any setup and returns a zero-arg callable
+    (sync or async) that is the timed body.
+    """
+    def decorator(fn):
+        BENCHMARKS.append((name, fn, full_only))
+        return fn
+    return decorator
+
+
+# ── Helpers ──────────────────────────────────────────────────────────
+async def _make_cog(cog_cls, bot):
+    from core.exchange import release_exchange
+    cog = cog_cls(bot)
+    # 把真的 ccxt client 換成假的，不發出任何網路請求
+    real = getattr(cog, "exchange", None)
+    if real is not None and not isinstance(real, FakeExchange):
+        cog.exchange = FakeExchange()
+        await release_exchange(real)
+    return cog
+
+
+# ── Market ───────────────────────────────────────────────────────────
+for _n in (72, 1_000, 10_000):
+    def _register(n=_n):
+        @bench(f"market.calc_sma[n={n}]")
+        async def _sma():
+            from cogs.market import Market
+            closes = [c[4] for c in synthetic_ohlcv(n, seed=1)]
+            return lambda: Market._calc_sma(closes, 20)
+
+        @bench(f"market.calc_rsi[n={n}]")
+        async def _rsi():
+            from cogs.market import Market
+            closes = [c[4] for c in synthetic_ohlcv(n, seed=2)]
+            return lambda: Market._calc_rsi(closes, 14)
+    _register()
+
+for _n in (24, 1_000):
+    def _register(n=_n):
+        @bench(f"market.format_ohlcv[n={n}]")
+        async def _fmt():
+            from cogs.market import Market
+            ohlcv = synthetic_ohlcv(n, seed=3)
+            return lambda: Market._format_ohlcv(ohlcv, "BNB/USDT")
+    _register()
+
+
+async def _markets_index():
+    from core.markets import MarketIndex
+    # 大約是 Binance 現貨的規模
+    symbols = dict(DEFAULT_SYMBOLS)
+    symbols.update({f"T{i:04d}/USDT": 1.0 for i in range(2_000)})
+    index = MarketIndex(Path(_TMP) / "bench_markets.json")
+    await index.refresh(FakeExchange(symbols))
+    return index
+
+
+for _strategy in ("sma", "rsi", "breakout"):
+    def _register(strategy=_strategy):
+        @bench(f"backtest.run[{strategy},4320x1h]")
+        async def _backtest():
+            from core import backtest
+            candles = synthetic_ohlcv(4_320 + backtest.WARMUP, 580.0, seed=9)  # 180 天
+            return lambda: backtest.run(strategy, candles)
+    _register()
+
+
+@bench("markets.normalize[hit]")
+async def _normalize_hit():
+    index = await _markets_index()
+    return lambda: index.normalize("bnbusdt")
+
+
+@bench("markets.normalize[typo]")
+async def _normalize_typo():
+    from core.markets import UnknownSymbol
+    index = await _markets_index()
+
+    def body():
+        try:
+            index.normalize("BNBB")
+        except UnknownSymbol:
+            pass
+    return body
+
+
+@bench("market.chart[72x1h]")
+async def _chart():
+    from cogs.market import Market
+    bot = FakeBot()
+    cog = await _make_cog(Market, bot)
+    ctx = FakeContext(bot, FakeUser(1), FakeChannel(1))
+    return lambda: Market.chart.callback(cog, ctx, "BNB/USDT")
+
+
+@bench("charts.render_candles[72x1h]")
+async def _render_candles():
+    from cogs.market import Market
+    from core import charts
+    ohlcv = synthetic_ohlcv(72, 580.0, seed=12)
+    closes = [c[4] for c in ohlcv]
+    sma, rsi = Market._calc_sma(closes, 20), Market._calc_rsi(closes, 14)
+    charts.warm_up()  # 量的是套用模板之後的繪製，不含第一次建立 figure
+    return lambda: charts.render_candles("BNB/USDT", ohlcv, sma, rsi)
+
+
+for _tf in ("1h", "1w"):
+    def _register(timeframe=_tf):
+        @bench(f"candles.fetch[72x{timeframe}]")
+        async def _fetch():
+            from cogs.market import Market
+            bot = FakeBot()
+            cog = await _make_cog(Market, bot)
+            cog.refresh_markets.cancel()
+            await cog._fetch_ohlcv("BNB/USDT", 72, timeframe)  # 先把歷史存進本地，之後只剩補尾巴的那一次呼叫
+            return lambda: cog._fetch_ohlcv("BNB/USDT", 72, timeframe)
+    _register()
+
+
+@bench("candles.resample[1w,12000x1h]")
+async def _resample():
+    from core.candles import resample
+    candles = synthetic_ohlcv(12_000, 580.0, seed=10)
+    return lambda: resample(candles, "1w")
+
+
+@bench("venues.fetch_ticker[3 venues]")
+async def _venues():
+    from core.venues import Venue, VenueRouter
+    # 假交易所沒有延遲：量的是 hedge 路由與離群檢查本身的開銷
+    router = VenueRouter([Venue(v.id, v) for v in fake_venues(3)])
+    return lambda: router.fetch_ticker("BNB/USDT")
+
+
+# ── Game (TradingDB) ─────────────────────────────────────────────────
+@bench("game.buy")
+async def _buy():
+    from cogs.game import Game
+    bot = FakeBot()
+    cog = await _make_cog(Game, bot)
+    users = [FakeUser(10_000 + i) for i in range(100)]
+    ctx_iter = iter(range(10**9))
+
+    async def body():
+        user = users[next(ctx_iter) % len(users)]
+        await Game.buy.callback(cog, FakeContext(bot, user, FakeChannel(2)), "BNB", 10.0)
+    return body
+
+
+@bench("game.sell")
+async def _sell():
+    from cogs.game import Game
+    bot = FakeBot()
+    cog = await _make_cog(Game, bot)
+    user = FakeUser(20_000)
+    ctx = FakeContext(bot, user, FakeChannel(3))
+    await Game.buy.callback(cog, ctx, "BNB", 9_000.0)
+    qty = cog.db.get_holding(str(user.id), "BNB/USDT")["quantity"] / 10_000
+    return lambda: Game.sell.callback(cog, ctx, "BNB", qty)
+
+
+@bench("game.portfolio[6 holdings]")
+async def _portfolio():
+    from cogs.game import Game
+    bot = FakeBot()
+    cog = await _make_cog(Game, bot)
+    user = FakeUser(30_000)
+    ctx = FakeContext(bot, user, FakeChannel(4))
+    for symbol in DEFAULT_SYMBOLS:
+        await Game.buy.callback(cog, ctx, symbol, 100.0)
+    return lambda: Game.portfolio.callback(cog, ctx)
+
+
+for _n, _full in ((10_000, False), (300_000, False), (1_000_000, True)):
+    def _register(n=_n, full=_full):
+        @bench(f"orderbook.tick[n={n}]", full_only=full)
+        async def _tick():
+            import random
+            from core.orderbook import MatchingEngine
+            rng = random.Random(5)
+            engine = MatchingEngine()
+            # 掛單價分布在 ±30%；價格在 ±0.3% 內來回時每一輪只會穿過少數價位
+            rows = []
+            for i in range(n):
+                direction = "below" if i % 2 else "above"
+                offset = rng.uniform(0.001, 0.3)
+                rows.append((i, "BTC/USDT", direction, 65_000 * (1 - offset if direction == "below" else 1 + offset)))
+            engine.add_many(rows)
+            by_id = {r[0]: r for r in rows}
+            prices = iter(65_000 * (1 + 0.003 * ((k % 3) - 1)) for k in range(10**9))
+
+            def body():
+                crossed = engine.crossed("BTC/USDT", next(prices))
+                engine.add_many([by_id[i] for i in crossed])  # 放回去，每一輪條件相同
+            return body
+    _register()
+
+
+for _n in (10_000, 100_000):
+    def _register(n=_n):
+        @bench(f"valuation.value_portfolios[users={n}]")
+        async def _value():
+            import numpy as np
+            from core.valuation import Inputs, value_portfolios
+            rng = np.random.default_rng(6)
+            symbols = list(DEFAULT_SYMBOLS)
+            m = 3 * n  # 平均每人 3 個部位
+            positions = np.column_stack([
+                rng.integers(1, n + 1, m), rng.integers(0, len(symbols), m),
+                rng.uniform(0.01, 5, m), rng.uniform(1, 1_000, m),
+            ]).astype(np.float64)
+            inputs = Inputs([f"u{i}" for i in range(1, n + 1)], np.arange(1, n + 1),
+                            rng.uniform(0, 10_000, n), symbols, positions, time.time())
+            return lambda: value_portfolios(inputs, DEFAULT_SYMBOLS, 10_000.0)
+    _register()
+
+
+@bench("game.rank[users=100000]")
+async def _rank_window():
+    import random
+    from cogs.game import Game
+    bot = FakeBot()
+    cog = await _make_cog(Game, bot)
+    rng = random.Random(8)
+    now = time.time()
+    rows = []
+    for i in range(100_000):
+        equity = round(rng.uniform(2_000, 30_000), 2)
+        rows.append((str(10**17 + i), equity, 0.0, equity, round((equity / 10_000 - 1) * 10_000), now))
+    with cog.db.conn:
+        cog.db.conn.executemany(
+            "INSERT OR REPLACE INTO equity_snapshots VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+    guild = FakeGuild(1)
+    user = FakeUser(10**17 + 50_000)  # 排在中間：名次計數要掃過一半的索引
+    ctx = FakeContext(bot, user, FakeChannel(6), guild)
+    await cog.cog_before_invoke(ctx)
+    return lambda: Game.rank.callback(cog, ctx, "global")
+
+
+@bench("timeseries.read_curve[365d]")
+async def _equity_curve():
+    from cogs.game import TradingDB
+    from core.timeseries import EquitySampler, read_curve
+    db = TradingDB()
+    sampler = EquitySampler()
+    now = time.time()
+    # 一年份、每 5 分鐘一次的取樣，讀取時只應該碰到每日那一層
+    for i in range(365 * 288):
+        sampler.sample(db.conn, [1], [10_000.0 + i % 997], now - 365 * 86400 + i * 300)
+    return lambda: read_curve(db.conn, 1, now - 365 * 86400, now)
+
+
+# ── Alert ────────────────────────────────────────────────────────────
+for _n, _full in ((10_000, False), (100_000, False), (1_000_000, True)):
+    def _register(n=_n, full=_full):
+        @bench(f"alert.check_alerts[n={n}]", full_only=full)
+        async def _alerts():
+            from cogs.alert import Alert, PriceAlert
+            from core.notify import SendQueue
+            bot = FakeBot()
+            cog = await _make_cog(Alert, bot)
+            cog.check_alerts.cancel()
+            # 不限速：量的是分組、排版和送出本身，不是 Discord 的速率限制
+            cog.notifier = SendQueue(bot, channel_per_sec=1e9, global_per_sec=1e9)
+            symbols = list(DEFAULT_SYMBOLS)
+            # 約 1% 的警報會被觸發，其餘留在資料庫裡
+            template = []
+            hits = []
+            for i in range(n):
+                symbol = symbols[i % len(symbols)]
+                base = DEFAULT_SYMBOLS[symbol]
+                hit = i % 100 == 0
+                direction = "above" if i % 2 else "below"
+                if direction == "above":
+                    target = base * (0.5 if hit else 2.0)
+                else:
+                    target = base * (2.0 if hit else 0.5)
+                template.append(PriceAlert(1_000 + i % 5_000, 100 + i % 50, symbol, target, direction))
+                if hit:
+                    hits.append(template[-1])
+            with cog.db.conn:
+                cog.db.conn.execute("DELETE FROM alerts")
+            cog.db.add_many(template)
+
+            async def body():
+                await cog.check_alerts.coro(cog)
+                await cog.notifier.join()
+                cog.db.add_many(hits)  # 放回被觸發的那 1%，每一輪條件相同
+            return body
+    _register()
+
+
+@bench("alert.notify[crash,5000x50ch]")
+async def _notify():
+    from cogs.alert import PriceAlert, build_notifications
+    from core.notify import SendQueue
+    bot = FakeBot()
+    queue = SendQueue(bot, channel_per_sec=1e9, global_per_sec=1e9)
+    symbols = list(DEFAULT_SYMBOLS)
+    # 全市場急跌：所有「跌破」警報同時觸發
+    alerts = [PriceAlert(1_000 + i % 2_000, 100 + i % 50, symbols[i % len(symbols)], 1.0 + i, "below")
+              for i in range(5_000)]
+    prices = {s: 0.5 for s in symbols}
+
+    async def body():
+        by_channel: dict[int, list] = {}
+        for alert in alerts:
+            by_channel.setdefault(alert.channel_id, []).append(alert)
+        for channel_id, group in by_channel.items():
+            for message in build_notifications(group, prices):
+                queue.enqueue(channel_id, **message)
+        await queue.join()
+    return body
+
+
+# ── Chain ────────────────────────────────────────────────────────────
+for _n in (1_000, 100_000):
+    def _register(n=_n):
+        @bench(f"chain.rank_players[n={n}]")
+        async def _rank():
+            import random
+            from cogs.chain import Chain
+            rng = random.Random(5)
+            players = [
+                ("0x" + "00" * 20, str(10**17 + i), rng.randint(-10_000, 50_000), 1_700_000_000 + i)
+                for i in range(n)
+            ]
+            return lambda: Chain._rank_players(players)
+    _register()
+
+
+# ── Runner ───────────────────────────────────────────────────────────
+async def _time(body, min_time: float, max_rounds: int) -> list[float]:
+    is_async = asyncio.iscoroutinefunction(body)
+
+    async def once() -> float:
+        start = time.perf_counter()
+        result = body()
+        if is_async or asyncio.iscoroutine(result):
+            await result
+        return time.perf_counter() - start
+
+    await once()  # warm-up（import、快取暖機）
+    samples = []
+    gc.collect()
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_rounds and (len(samples) < 3 or time.perf_counter() < deadline):
+        samples.append(await once())
+    return samples
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+async def run(args) -> dict:
+    results = {}
+    for name, factory, full_only in BENCHMARKS:
+        if full_only and not args.full:
+            continue
+        if args.k and args.k not in name:
+            continue
+        body = await factory()
+        samples = await _time(body, args.min_time, args.max_rounds)
+        results[name] = {
+            "rounds": len(samples),
+            "median_ms": statistics.median(samples) * 1000,
+            "min_ms": min(samples) * 1000,
+            "mean_ms": statistics.fmean(samples) * 1000,
+            "stdev_ms": (statistics.stdev(samples) * 1000) if len(samples) > 1 else 0.0,
+        }
+        r = results[name]
+        print(f"{name:<36} median {r['median_ms']:>10.3f} ms   min {r['min_ms']:>10.3f} ms   ({r['rounds']} rounds)")
+
+    return {
+        "meta": {
+            "created_at": datetime.now(tz=timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "full": args.full,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return a line per benchmark that regressed beyond *threshold* (e.g. 0.15 = +15%)."""
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"{name:<36} {'—':>12} {cur['median_ms']:>10.3f}ms {'new':>8}")
+            continue
+        change = cur["median_ms"] / base["median_ms"] - 1
+        flag = " ❌" if change > threshold else ""
+        print(f"{name:<36} {base['median_ms']:>10.3f}ms {cur['median_ms']:>10.3f}ms {change:>+7.1%}{flag}")
+        if change > threshold:
+            regressions.append(f"{name}: {base['median_ms']:.3f}ms → {cur['median_ms']:.3f}ms ({change:+.1%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Paper Degen hot-path benchmarks")
+    parser.add_argument("--full", action="store_true", help="include the large cases")
+    parser.add_argument("-k", help="only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per benchmark")
+    parser.add_argument("--max-rounds", type=int, default=200)
+    parser.add_argument("--out", type=Path, help="result file (default: benchmarks/results/<ts>.json)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", type=Path, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown ratio")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = args.out or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {out}")
+    if args.save_baseline:
+        (RESULTS_DIR / "baseline.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {RESULTS_DIR / 'baseline.json'}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions beyond threshold:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Admin Cog — !profile [seconds]
+Owner-only tools for diagnosing the live bot without restarting it.
+"""
+
+import io
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from core.profiler import profile
+
+logger = logging.getLogger("quant_sniper.admin")
+
+MAX_PROFILE_SECONDS = 120
+
+
+class Admin(commands.Cog, name="🛠️ 管理"):
+    """Owner-only diagnostics."""
+
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+        self._profile_lock = asyncio.Lock()
+
+    # ── Command: /profile ────────────────────────────────────────────
+    @commands.hybrid_command(name="profile", aliases=["效能分析"])
+    @commands.is_owner()
+    @app_commands.describe(seconds=f"取樣秒數（1–{MAX_PROFILE_SECONDS}）")
+    async def profile(self, ctx: commands.Context, seconds: int = 10) -> None:
+        """取樣 bot 的執行堆疊並回傳 flamegraph 檔（僅限擁有者）。"""
+        if self._profile_lock.locked():
+            await ctx.send("⏳ 已經有一個 profile 在跑了，請稍後再試。")
+            return
+        seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+
+        async with self._profile_lock:
+            if ctx.interaction is not None:
+                await ctx.defer(ephemeral=True)
+            logger.info("Profiling for %ds (requested by %s)", seconds, ctx.author)
+            profiler = await profile(seconds)
+
+        embed = discord.Embed(
+            title=f"🔬 Profile — {seconds}s",
+            color=0x7C4DFF,
+            timestamp=datetime.now(tz=timezone.utc),
+        )
+        embed.add_field(name="🧮 取樣數", value=f"`{profiler.samples:,}`", inline=True)
+        embed.add_field(name="🔁 Event loop 忙碌", value=f"`{profiler.loop_busy_ratio:.1%}`", inline=True)
+        embed.add_field(name="🧵 堆疊種類", value=f"`{len(profiler.stacks):,}`", inline=True)
+
+        top = profiler.top_callbacks(10)
+        if top:
+            lines = [f"`{secs * 1000:>8.1f} ms` {label[:80]}" for label, _, secs in top]
+            embed.add_field(name="🐢 最佔用 loop 的協程 / 回呼", value="\n".join(lines)[:1024], inline=False)
+        embed.set_footer(text="附件為 collapsed stacks，可用 speedscope / flamegraph.pl 開啟")
+
+        filename = f"profile-{datetime.now(tz=timezone.utc):%Y%m%d-%H%M%S}.collapsed.txt"
+        file = discord.File(io.BytesIO(profiler.collapsed().encode("utf-8")), filename=filename)
+        await ctx.send(embed=embed, file=file)
+
+    @profile.error
+    async def profile_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
+        if isinstance(getattr(error, "original", error), commands.NotOwner):
+            await ctx.send("🚫 這個指令只有 bot 擁有者可以使用。")
+            return
+        logger.error("Profile command error: %s", error)
+        await ctx.send("❌ Profile 失敗，請查看 log。")
+
+
+async def setup(bot: commands.Bot) -> None:
+    await bot.add_cog(Admin(bot))
@@ -3,16 +3,33 @@ Price Alert Cog — !alert [symbol] [price]
 Allows users to set price alerts and get notified when conditions are met.
 """
 
+import asyncio
 import logging
 from datetime import datetime, timezone
+from pathlib import Path
 
 import ccxt.async_support as ccxt
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
+from core.exchange import CircuitOpen, acquire_exchange, release_exchange
+from core.markets import MARKETS, UnknownSymbol
+from core.metrics import ALERT_CYCLE_LATENCY, ALERTS_ACTIVE
+from core.notify import SendQueue
+from core.quotes import QUOTES
+from core.scheduler import SCHEDULER, Overloaded, Priority
+from core.state import DB_PATH, LeaderLease, connect
+
 logger = logging.getLogger("quant_sniper.alert")
 
+# Discord 的訊息上限
+CONTENT_LIMIT = 2000
+MESSAGE_EMBEDS = 10
+MESSAGE_EMBED_CHARS = 6000
+PAGE_LINES = 40       # 每頁（一個 embed）最多列幾個警報
+FOOTER_RESERVE = 40   # 頁碼在排版後才知道，先預留 footer 的字數
+
 
 class PriceAlert:
     """A single price alert."""
@@ -34,96 +51,210 @@ class PriceAlert:
         self.direction = direction
         self.created_at = datetime.now(tz=timezone.utc)
 
+    @classmethod
+    def from_row(cls, row) -> "PriceAlert":
+        alert = cls(row["user_id"], row["channel_id"], row["symbol"], row["target_price"], row["direction"])
+        alert.created_at = datetime.fromisoformat(row["created_at"])
+        return alert
+
+
+def build_notifications(alerts: list[PriceAlert], prices: dict[str, float]) -> list[dict]:
+    """``channel.send`` kwargs announcing *alerts*, all triggered in one channel.
+
+    Alerts are grouped by symbol and direction into pages of at most
+    ``PAGE_LINES`` lines, one embed per page, and the pages are packed into as
+    few messages as Discord's size limits allow. Users are mentioned as
+    ``<@id>`` in the message content, so nobody has to be fetched first.
+    """
+    groups: dict[tuple[str, str], list[PriceAlert]] = {}
+    for alert in sorted(alerts, key=lambda a: (a.symbol, a.direction, a.target_price)):
+        groups.setdefault((alert.symbol, alert.direction), []).append(alert)
+
+    now = datetime.now(tz=timezone.utc)
+    pages: list[tuple[discord.Embed, list[int]]] = []
+    for (symbol, direction), group in groups.items():
+        direction_text = "突破 ⬆️" if direction == "above" else "跌破 ⬇️"
+        emoji = "🟢" if direction == "above" else "🔴"
+        for start in range(0, len(group), PAGE_LINES):
+            chunk = group[start:start + PAGE_LINES]
+            embed = discord.Embed(
+                title=f"{emoji} {symbol} {direction_text} — 現價 ${prices[symbol]:,.4f}",
+                description="\n".join(f"<@{a.user_id}> 目標 `${a.target_price:,.4f}`" for a in chunk),
+                color=0x00E676 if direction == "above" else 0xFF1744,
+                timestamp=now,
+            )
+            pages.append((embed, [a.user_id for a in chunk]))
+
+    # [embeds, 要提及的使用者（保序去重）, embed 字數]
+    messages: list[list] = []
+    for embed, user_ids in pages:
+        page_size = len(embed) + FOOTER_RESERVE
+        if messages:
+            embeds, users, size = messages[-1]
+            fits = (len(embeds) < MESSAGE_EMBEDS
+                    and size + page_size <= MESSAGE_EMBED_CHARS
+                    and len(_content({**users, **dict.fromkeys(user_ids)})) <= CONTENT_LIMIT)
+        if not messages or not fits:
+            messages.append([[], {}, 0])
+        message = messages[-1]
+        message[0].append(embed)
+        message[1].update(dict.fromkeys(user_ids))
+        message[2] += page_size
+
+    for number, (embed, _) in enumerate(pages, 1):
+        embed.set_footer(text=f"Paper Degen — 價格警報 · 第 {number}/{len(pages)} 頁")
+    mentions = discord.AllowedMentions(everyone=False, roles=False, users=True)
+    return [{"content": _content(users), "embeds": embeds, "allowed_mentions": mentions}
+            for embeds, users, _ in messages]
+
+
+def _content(user_ids) -> str:
+    return "🔔 " + " ".join(f"<@{u}>" for u in user_ids) + " 你的警報響了！"
+
+
+class AlertDB:
+    """SQLite-backed alert store shared by every worker process."""
+
+    def __init__(self, db_path: Path = DB_PATH) -> None:
+        self.conn = connect(db_path)
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id           INTEGER PRIMARY KEY,
+                    user_id      INTEGER NOT NULL,
+                    channel_id   INTEGER NOT NULL,
+                    symbol       TEXT NOT NULL,
+                    target_price REAL NOT NULL,
+                    direction    TEXT NOT NULL,
+                    created_at   TEXT NOT NULL
+                );
+                -- 觸發檢查是「某交易對、某方向、目標價越過現價」的範圍查詢
+                CREATE INDEX IF NOT EXISTS idx_alerts_trigger ON alerts (symbol, direction, target_price);
+                CREATE INDEX IF NOT EXISTS idx_alerts_user ON alerts (user_id);
+                """
+            )
+
+    def add(self, alert: PriceAlert) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO alerts (user_id, channel_id, symbol, target_price, direction, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (alert.user_id, alert.channel_id, alert.symbol, alert.target_price,
+                 alert.direction, alert.created_at.isoformat()),
+            )
+
+    def add_many(self, alerts: list[PriceAlert]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO alerts (user_id, channel_id, symbol, target_price, direction, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(a.user_id, a.channel_id, a.symbol, a.target_price, a.direction, a.created_at.isoformat())
+                 for a in alerts],
+            )
+
+    def for_user(self, user_id: int) -> list[PriceAlert]:
+        rows = self.conn.execute(
+            "SELECT * FROM alerts WHERE user_id = ? ORDER BY id", (user_id,)
+        ).fetchall()
+        return [PriceAlert.from_row(r) for r in rows]
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+
+    def symbols(self) -> list[str]:
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT symbol FROM alerts")]
+
+    def pop_triggered(self, prices: dict[str, float]) -> list[PriceAlert]:
+        """Delete and return every alert crossed by *prices*, atomically.
+
+        DELETE … RETURNING 讓「取出」和「刪除」是同一個動作，不會重複通知。
+        """
+        triggered = []
+        with self.conn:
+            for symbol, price in prices.items():
+                for direction, op in (("above", "<="), ("below", ">=")):
+                    rows = self.conn.execute(
+                        f"DELETE FROM alerts WHERE symbol = ? AND direction = ? AND target_price {op} ? "
+                        "RETURNING *",
+                        (symbol, direction, price),
+                    ).fetchall()
+                    triggered.extend(PriceAlert.from_row(r) for r in rows)
+        return triggered
+
+    def clear_user(self, user_id: int) -> int:
+        with self.conn:
+            return self.conn.execute("DELETE FROM alerts WHERE user_id = ?", (user_id,)).rowcount
+
 
 class Alert(commands.Cog, name="🔔 價格警報"):
     """Set price alerts and get notified in Discord."""
 
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.exchange = ccxt.binance({"enableRateLimit": True})
-        self.alerts: list[PriceAlert] = []
+        self.exchange = acquire_exchange()
+        self.db = AlertDB()
+        # 分片部署時每個程序都會載入這個 cog，只有持有 lease 的那個跑 check_alerts
+        self.lease = LeaderLease("check_alerts", ttl=90)
+        self.notifier = SendQueue(bot)
         self.check_alerts.start()
 
     async def cog_unload(self) -> None:
         self.check_alerts.cancel()
-        await self.exchange.close()
+        if self.lease.is_leader:
+            self.lease.release()
+        # 觸發的警報已經從資料庫刪掉了，卸載前盡量把通知送完
+        try:
+            await asyncio.wait_for(self.notifier.join(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %d unsent alert notifications", self.notifier.depth)
+        await self.notifier.close()
+        await release_exchange(self.exchange)
 
     # ── Background task: check alerts every 30 seconds ───────────────
     @tasks.loop(seconds=30)
     async def check_alerts(self) -> None:
-        if not self.alerts:
-            return
+        # 任何例外都會讓 tasks.loop 永久停止；多程序共用 SQLite 時 database is locked 並不少見
+        try:
+            if not self.lease.try_acquire():
+                return
+            with ALERT_CYCLE_LATENCY.time():
+                await self._check_alerts_once()
+            ALERTS_ACTIVE.set(self.db.count())
+        except Exception as exc:
+            logger.error("Alert check error: %s", exc, exc_info=True)
 
+    async def _check_alerts_once(self) -> None:
         # Group alerts by symbol to minimize API calls
-        symbols = set(a.symbol for a in self.alerts)
+        symbols = self.db.symbols()
+        if not symbols:
+            return
         prices: dict[str, float] = {}
 
         for symbol in symbols:
             try:
-                ticker = await self.exchange.fetch_ticker(symbol)
+                ticker = await SCHEDULER.run(
+                    "exchange", self.exchange.fetch_ticker, symbol, priority=Priority.HIGH
+                )
                 prices[symbol] = ticker["last"]
+                QUOTES.record(symbol, ticker["last"])
+            except CircuitOpen:
+                break  # 交易所斷線中，剩下的幣種這一輪不檢查（不拿舊價格觸發警報）
             except Exception as exc:
                 logger.error("Alert price fetch error for %s: %s", symbol, exc)
 
-        triggered: list[PriceAlert] = []
-        remaining: list[PriceAlert] = []
-
-        for alert in self.alerts:
-            price = prices.get(alert.symbol)
-            if price is None:
-                remaining.append(alert)
-                continue
-
-            hit = False
-            if alert.direction == "above" and price >= alert.target_price:
-                hit = True
-            elif alert.direction == "below" and price <= alert.target_price:
-                hit = True
-
-            if hit:
-                triggered.append(alert)
-            else:
-                remaining.append(alert)
-
-        self.alerts = remaining
+        triggered = self.db.pop_triggered(prices)
+        if not triggered:
+            return
 
-        # Send notifications
+        # 同一頻道的警報併成幾則摘要訊息，不再一個警報打一次 REST
+        by_channel: dict[int, list[PriceAlert]] = {}
         for alert in triggered:
-            try:
-                channel = self.bot.get_channel(alert.channel_id)
-                if channel is None:
-                    continue
-
-                price = prices[alert.symbol]
-                direction_text = "突破 ⬆️" if alert.direction == "above" else "跌破 ⬇️"
-                emoji = "🟢" if alert.direction == "above" else "🔴"
-
-                embed = discord.Embed(
-                    title=f"🔔 價格警報觸發！",
-                    color=0x00E676 if alert.direction == "above" else 0xFF1744,
-                    timestamp=datetime.now(tz=timezone.utc),
-                )
-                embed.add_field(
-                    name="📊 交易對",
-                    value=f"`{alert.symbol}`",
-                    inline=True,
-                )
-                embed.add_field(
-                    name=f"{emoji} 條件",
-                    value=f"{direction_text} `${alert.target_price:,.4f}`",
-                    inline=True,
-                )
-                embed.add_field(
-                    name="💰 當前價格",
-                    value=f"`${price:,.4f}`",
-                    inline=True,
-                )
-                embed.set_footer(text="Paper Degen — 價格警報")
-
-                user = await self.bot.fetch_user(alert.user_id)
-                await channel.send(f"{user.mention} 你的警報響了！", embed=embed)
-            except Exception as exc:
-                logger.error("Failed to send alert notification: %s", exc)
+            by_channel.setdefault(alert.channel_id, []).append(alert)
+        for channel_id, alerts in by_channel.items():
+            for message in build_notifications(alerts, prices):
+                self.notifier.enqueue(channel_id, **message)
+        logger.info("%d alerts triggered in %d channels", len(triggered), len(by_channel))
 
     @check_alerts.before_loop
     async def before_check(self) -> None:
@@ -149,16 +280,21 @@ class Alert(commands.Cog, name="🔔 價格警報"):
             )
             return
 
-        symbol = symbol.upper()
-        if "/" not in symbol:
-            symbol = f"{symbol}/USDT"
+        try:
+            symbol = MARKETS.normalize(symbol)
+        except UnknownSymbol as exc:
+            await ctx.send(exc.message)
+            return
 
         try:
-            ticker = await self.exchange.fetch_ticker(symbol)
+            ticker = await SCHEDULER.run("exchange", self.exchange.fetch_ticker, symbol)
             current_price = ticker["last"]
         except ccxt.BadSymbol:
             await ctx.send(f"❌ 找不到交易對 `{symbol}`，請確認格式（例：BNB/USDT）。")
             return
+        except (Overloaded, CircuitOpen) as exc:
+            await ctx.send(exc.message)
+            return
         except Exception as exc:
             logger.error("Alert ticker fetch error: %s", exc)
             await ctx.send("❌ 無法取得當前價格，請稍後再試。")
@@ -183,7 +319,7 @@ class Alert(commands.Cog, name="🔔 價格警報"):
             target_price=target_price,
             direction=direction,
         )
-        self.alerts.append(alert)
+        self.db.add(alert)
 
         embed = discord.Embed(
             title="🔔 價格警報已設定！",
@@ -197,7 +333,7 @@ class Alert(commands.Cog, name="🔔 價格警報"):
             value=f"{direction_text} `${target_price:,.4f}`",
             inline=True,
         )
-        embed.set_footer(text=f"每 30 秒檢查一次 | 你目前有 {len([a for a in self.alerts if a.user_id == ctx.author.id])} 個警報")
+        embed.set_footer(text=f"每 30 秒檢查一次 | 你目前有 {len(self.db.for_user(ctx.author.id))} 個警報")
 
         await ctx.send(embed=embed)
 
@@ -205,7 +341,7 @@ class Alert(commands.Cog, name="🔔 價格警報"):
     @commands.hybrid_command(name="alerts", aliases=["我的警報"])
     async def list_alerts(self, ctx: commands.Context) -> None:
         """查看你設定的所有價格警報。"""
-        user_alerts = [a for a in self.alerts if a.user_id == ctx.author.id]
+        user_alerts = self.db.for_user(ctx.author.id)
 
         if not user_alerts:
             await ctx.send("📭 你目前沒有設定任何價格警報。用 `!alert <交易對> <價格>` 來設定！")
@@ -233,9 +369,7 @@ class Alert(commands.Cog, name="🔔 價格警報"):
     @commands.hybrid_command(name="clearalerts", aliases=["清除警報"])
     async def clear_alerts(self, ctx: commands.Context) -> None:
         """清除你所有的價格警報。"""
-        before = len(self.alerts)
-        self.alerts = [a for a in self.alerts if a.user_id != ctx.author.id]
-        removed = before - len(self.alerts)
+        removed = self.db.clear_user(ctx.author.id)
 
         if removed == 0:
             await ctx.send("📭 你沒有任何警報可以清除。")
@@ -4,51 +4,20 @@ BNB Chain Cog — !leaderboard, !submit
 """
 
 import os
-import json
+import asyncio
 import logging
 from datetime import datetime, timezone
-from pathlib import Path
 
 import discord
-from discord.ext import commands
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
+from discord.ext import commands, tasks
+
+from core.artifacts import load_abi
+from core.scheduler import SCHEDULER, Overloaded
 
 logger = logging.getLogger("quant_sniper.chain")
 
-# ── 合約 ABI（僅包含需要的函式） ─────────────────────────────────
-LEADERBOARD_ABI = json.loads("""
-[
-    {
-        "inputs": [{"internalType": "string", "name": "discordId", "type": "string"}, {"internalType": "int256", "name": "roiBps", "type": "int256"}],
-        "name": "submitScore",
-        "outputs": [],
-        "stateMutability": "nonpayable",
-        "type": "function"
-    },
-    {
-        "inputs": [],
-        "name": "getAllPlayers",
-        "outputs": [{"components": [{"internalType": "address", "name": "wallet", "type": "address"}, {"internalType": "string", "name": "discordId", "type": "string"}, {"internalType": "int256", "name": "roiBps", "type": "int256"}, {"internalType": "uint256", "name": "timestamp", "type": "uint256"}], "internalType": "struct Leaderboard.Player[]", "name": "", "type": "tuple[]"}],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [],
-        "name": "getPlayerCount",
-        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [{"internalType": "string", "name": "discordId", "type": "string"}],
-        "name": "getScoreByDiscordId",
-        "outputs": [{"internalType": "int256", "name": "roiBps", "type": "int256"}, {"internalType": "uint256", "name": "timestamp", "type": "uint256"}],
-        "stateMutability": "view",
-        "type": "function"
-    }
-]
-""")
+# ── 合約 ABI（來自編譯產物快取，見 core/artifacts.py） ─────────
+LEADERBOARD_ABI = load_abi("Leaderboard")
 
 INITIAL_BALANCE = 10_000.0
 
@@ -59,67 +28,148 @@ class Chain(commands.Cog, name="⛓️ 鏈上功能"):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
 
-        # Web3 setup - 優先使用 opBNB
-        opbnb_rpc = os.getenv("OPBNB_RPC_URL")
-        bsc_rpc = os.getenv("BSC_RPC_URL", "https://data-seed-prebsc-1-s1.bnbchain.org:8545")
-        
-        if opbnb_rpc:
-            self.network_name = "opBNB Testnet"
-            rpc_url = opbnb_rpc
-            contract_addr = os.getenv("OPBNB_CONTRACT_ADDRESS", os.getenv("LEADERBOARD_CONTRACT_ADDRESS", ""))
+        # 優先使用 opBNB（每個網路可設定多個 RPC，由 PooledProvider 路由）
+        if os.getenv("OPBNB_RPC_URLS") or os.getenv("OPBNB_RPC_URL"):
+            self.network = "opbnb"
+            self.contract_addr = os.getenv("OPBNB_CONTRACT_ADDRESS", os.getenv("LEADERBOARD_CONTRACT_ADDRESS", ""))
         else:
-            self.network_name = "BSC Testnet"
-            rpc_url = bsc_rpc
-            contract_addr = os.getenv("LEADERBOARD_CONTRACT_ADDRESS", "")
+            self.network = "bsc"
+            self.contract_addr = os.getenv("LEADERBOARD_CONTRACT_ADDRESS", "")
+        self.private_key = os.getenv("BOT_WALLET_PRIVATE_KEY", "")
 
-        logger.info(f"Connecting to {self.network_name}...")
-        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
-        self.w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+        # web3 很重，連線物件在 cog_load 時於背景執行緒建立（見 _connect）
+        self.network_name = self.network
+        self.w3 = None
+        self.contract = None
+        self.batch_reader = None
+        self.bot_account = None
+        self._connecting: asyncio.Task | None = None
+
+        self.rpc_health.start()
+
+    async def cog_load(self) -> None:
+        if self.w3 is None:
+            self._connecting = asyncio.create_task(asyncio.to_thread(self._connect))
 
-        if not self.w3.is_connected():
-            logger.warning("無法連線到 RPC: %s", rpc_url)
+    async def cog_unload(self) -> None:
+        self.rpc_health.cancel()
+
+    async def cog_before_invoke(self, ctx: commands.Context) -> None:
+        await self._wait_connected()
+
+    def _connect(self) -> None:
+        """Import web3 and build the provider / contract; runs in a worker thread."""
+        from web3 import Web3
+        from core.multicall import BatchReader
+        from core.rpc import NETWORKS, make_web3
+
+        self.network_name = NETWORKS[self.network]["name"]
+        logger.info(f"Connecting to {self.network_name}...")
+        w3 = make_web3(self.network)
 
         # 合約
-        if contract_addr:
-            self.contract = self.w3.eth.contract(
-                address=Web3.to_checksum_address(contract_addr),
+        if self.contract_addr:
+            self.contract = w3.eth.contract(
+                address=Web3.to_checksum_address(self.contract_addr),
                 abi=LEADERBOARD_ABI,
             )
-            logger.info(f"Loaded Leaderboard contract at {contract_addr}")
+            logger.info(f"Loaded Leaderboard contract at {self.contract_addr}")
         else:
-            self.contract = None
             logger.warning("CONTRACT_ADDRESS 未設定，鏈上功能將無法使用")
 
+        # 批次讀取（Multicall3 / JSON-RPC batch）
+        self.batch_reader = BatchReader(w3)
+
         # Bot 錢包（用於發送交易）
-        self.private_key = os.getenv("BOT_WALLET_PRIVATE_KEY", "")
         if self.private_key:
-            self.bot_account = self.w3.eth.account.from_key(self.private_key)
+            self.bot_account = w3.eth.account.from_key(self.private_key)
         else:
-            self.bot_account = None
             logger.warning("BOT_WALLET_PRIVATE_KEY 未設定，無法提交鏈上交易")
+        self.w3 = w3
+
+    async def _wait_connected(self) -> None:
+        if self._connecting is None:
+            return
+        try:
+            await self._connecting
+        except Exception as exc:
+            logger.error("Web3 初始化失敗: %s", exc)
+        finally:
+            self._connecting = None
+
+    # ── Background task: RPC health checks ───────────────────────────
+    @tasks.loop(seconds=60)
+    async def rpc_health(self) -> None:
+        await self._wait_connected()
+        if self.w3 is None:
+            return
+        report = await asyncio.to_thread(self.w3.provider.check_health)
+        if not any(r["healthy"] and r["block_number"] is not None for r in report):
+            logger.warning("所有 RPC 節點都無法連線: %s", [r["endpoint"] for r in report])
 
     def _get_game_cog(self):
         """取得 Game cog 以讀取使用者資料。"""
         return self.bot.get_cog("🎮 模擬交易")
 
     def _calculate_roi_bps(self, user_id: str) -> int | None:
-        """計算使用者的 ROI（基點）。"""
+        """計算使用者的 ROI（基點）：優先用定期市值估值的結果。"""
         game = self._get_game_cog()
         if not game:
             return None
 
         game.db.ensure_user(user_id)
+        snapshot = game.db.get_snapshot(user_id)
+        if snapshot is not None:
+            return snapshot["roi_bps"]
+
+        # 還沒被估值過（新玩家、估值工作剛啟動）：用均價估算
         balance = game.db.get_balance(user_id)
         holdings = game.db.get_all_holdings(user_id)
 
         total_value = balance
         for h in holdings:
-            # 用均價估算（鏈上提交不需要即時價格的精確度）
             total_value += h["quantity"] * h["avg_price"]
+        for o in game.db.get_open_orders(user_id):
+            total_value += game.db.order_value(o)
 
         roi = ((total_value / INITIAL_BALANCE) - 1) * 100
         return int(roi * 100)  # 轉為基點
 
+    @staticmethod
+    def _rank_players(players: list) -> list:
+        """Sort ``getAllPlayers()`` tuples by ROI, best first."""
+        return sorted(players, key=lambda p: p[2], reverse=True)
+
+    def _get_scores(self, discord_ids: list[str]) -> dict[str, tuple[int, int]]:
+        """批次查詢多位使用者的鏈上分數，回傳 {discord_id: (roi_bps, timestamp)}。
+
+        沒有提交過分數的使用者（合約 revert）不會出現在結果中。
+        """
+        results = self.batch_reader.call_many(
+            self.contract, "getScoreByDiscordId", [(d,) for d in discord_ids]
+        )
+        return {d: r for d, r in zip(discord_ids, results) if r is not None}
+
+    def _send_score(self, user_id: str, roi_bps: int):
+        """Build, sign and send ``submitScore``; blocks until the receipt arrives."""
+        # 建構交易
+        nonce = self.w3.eth.get_transaction_count(self.bot_account.address)
+        tx = self.contract.functions.submitScore(
+            user_id, roi_bps
+        ).build_transaction({
+            "from": self.bot_account.address,
+            "nonce": nonce,
+            "gas": 200_000,
+            "gasPrice": self.w3.eth.gas_price,
+            "chainId": self.w3.eth.chain_id,
+        })
+
+        # 簽名並發送
+        signed = self.w3.eth.account.sign_transaction(tx, self.private_key)
+        tx_hash = self.w3.eth.send_raw_transaction(signed.raw_transaction)
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
+        return tx_hash, receipt
+
     # ── Command: /submit ─────────────────────────────────────────────
     @commands.hybrid_command(name="submit", aliases=["提交"])
     async def submit(self, ctx: commands.Context) -> None:
@@ -137,22 +187,8 @@ class Chain(commands.Cog, name="⛓️ 鏈上功能"):
 
         async with ctx.typing():
             try:
-                # 建構交易
-                nonce = self.w3.eth.get_transaction_count(self.bot_account.address)
-                tx = self.contract.functions.submitScore(
-                    user_id, roi_bps
-                ).build_transaction({
-                    "from": self.bot_account.address,
-                    "nonce": nonce,
-                    "gas": 200_000,
-                    "gasPrice": self.w3.eth.gas_price,
-                    "chainId": self.w3.eth.chain_id,
-                })
-
-                # 簽名並發送
-                signed = self.w3.eth.account.sign_transaction(tx, self.private_key)
-                tx_hash = self.w3.eth.send_raw_transaction(signed.raw_transaction)
-                receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
+                # web3 是同步 API，交給 chain 執行緒池，不卡 event loop
+                tx_hash, receipt = await SCHEDULER.run_in_thread("chain", self._send_score, user_id, roi_bps)
 
                 roi_pct = roi_bps / 100
 
@@ -180,6 +216,8 @@ class Chain(commands.Cog, name="⛓️ 鏈上功能"):
                 else:
                     await ctx.send("❌ 鏈上交易失敗，請稍後再試。")
 
+            except Overloaded as exc:
+                await ctx.send(exc.message)
             except Exception as exc:
                 logger.error("鏈上提交失敗: %s", exc)
                 await ctx.send(f"❌ 鏈上提交失敗：`{exc}`")
@@ -194,7 +232,10 @@ class Chain(commands.Cog, name="⛓️ 鏈上功能"):
 
         async with ctx.typing():
             try:
-                players = self.contract.functions.getAllPlayers().call()
+                players = await SCHEDULER.run_in_thread("chain", self.contract.functions.getAllPlayers().call)
+            except Overloaded as exc:
+                await ctx.send(exc.message)
+                return
             except Exception as exc:
                 logger.error("讀取排行榜失敗: %s", exc)
                 await ctx.send("❌ 無法讀取鏈上排行榜。")
@@ -205,7 +246,7 @@ class Chain(commands.Cog, name="⛓️ 鏈上功能"):
                 return
 
             # 按 ROI 降序排列
-            sorted_players = sorted(players, key=lambda p: p[2], reverse=True)
+            sorted_players = self._rank_players(players)
 
             embed = discord.Embed(
                 title="🏆 On-Chain Mock Trading Leaderboard",
@@ -236,6 +277,73 @@ class Chain(commands.Cog, name="⛓️ 鏈上功能"):
 
             await ctx.send(embed=embed)
 
+    # ── Command: /standings ──────────────────────────────────────────
+    @commands.hybrid_command(name="standings", aliases=["myrank", "伺服器排名"])
+    async def standings(self, ctx: commands.Context) -> None:
+        """顯示本伺服器玩家的鏈上排名，以及你自己的名次。"""
+        if not self.contract:
+            await ctx.send("❌ 鏈上功能尚未設定，請聯繫管理員。")
+            return
+
+        # 有 members intent 時以伺服器成員為準，否則用所有在本 bot 交易過的玩家
+        if ctx.guild and self.bot.intents.members:
+            candidates = [str(m.id) for m in ctx.guild.members if not m.bot]
+            scope = ctx.guild.name
+        else:
+            game = self._get_game_cog()
+            candidates = game.db.get_all_user_ids() if game else []
+            scope = "All Traders"
+
+        user_id = str(ctx.author.id)
+        if user_id not in candidates:
+            candidates.append(user_id)
+
+        async with ctx.typing():
+            try:
+                scores = await SCHEDULER.run_in_thread("chain", self._get_scores, candidates)
+            except Overloaded as exc:
+                await ctx.send(exc.message)
+                return
+            except Exception as exc:
+                logger.error("批次讀取分數失敗: %s", exc)
+                await ctx.send("❌ 無法讀取鏈上分數。")
+                return
+
+        if not scores:
+            await ctx.send("📭 這裡還沒有人提交過分數，快用 `!submit` 成為第一位！")
+            return
+
+        ranked = sorted(scores.items(), key=lambda kv: kv[1][0], reverse=True)
+
+        embed = discord.Embed(
+            title=f"🏅 On-Chain Standings — {scope}",
+            description=f"{len(ranked)} player(s) · {len(candidates)} lookup(s) batched",
+            color=0xF0B90B,
+            timestamp=datetime.now(tz=timezone.utc),
+        )
+
+        medals = ["🥇", "🥈", "🥉"]
+        lines = []
+        for i, (discord_id, (roi_bps, _ts)) in enumerate(ranked[:10]):
+            medal = medals[i] if i < 3 else f"`#{i+1}`"
+            emoji = "📈" if roi_bps >= 0 else "📉"
+            lines.append(f"{medal} <@{discord_id}> — {emoji} `{roi_bps / 100:+.2f}%`")
+        embed.add_field(name="Rankings", value="\n".join(lines), inline=False)
+
+        my_rank = next((i for i, (d, _) in enumerate(ranked, 1) if d == user_id), None)
+        if my_rank is not None:
+            my_roi = scores[user_id][0] / 100
+            embed.add_field(
+                name="📍 Your Rank",
+                value=f"`#{my_rank}` / {len(ranked)} — `{my_roi:+.2f}%`",
+                inline=False,
+            )
+        else:
+            embed.add_field(name="📍 Your Rank", value="尚未提交，使用 `!submit` 上榜！", inline=False)
+
+        embed.set_footer(text="Paper Degen — Batched on-chain reads")
+        await ctx.send(embed=embed)
+
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(Chain(bot))
@@ -4,32 +4,86 @@ Paper trading system backed by SQLite with real-time ccxt prices.
 """
 
 import os
+import time
+import asyncio
 import logging
-import sqlite3
+from contextlib import closing, contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Literal
 
 import ccxt.async_support as ccxt
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from core import charts
+from core.exchange import CircuitOpen, acquire_exchange, release_exchange
+from core.markets import MARKETS, UnknownSymbol
+from core.metrics import SQLITE_TX_LATENCY, VALUATION_CYCLE_LATENCY
+from core.orderbook import MatchingEngine
+from core.quotes import QUOTES, Quote, format_age
+from core.scheduler import SCHEDULER, Overloaded, Priority
+from core.state import DB_PATH, LeaderLease, connect
+from core.timeseries import DAILY_RETENTION_DAYS, SAMPLE_SECONDS, EquitySampler, read_curve
 
 logger = logging.getLogger("quant_sniper.game")
 
 INITIAL_BALANCE = 10_000.0  # USDT
-DB_DIR = Path(__file__).resolve().parent.parent / "data"
-DB_PATH = DB_DIR / "trading.db"
+MAX_OPEN_ORDERS = 50        # 每位使用者
+HISTORY_PAGE_SIZE = 10
+MAX_EQUITY_DAYS = int(DAILY_RETENTION_DAYS)
+VALUATION_INTERVAL = float(os.getenv("VALUATION_INTERVAL_SECONDS", "60"))
+# 交易所異常時可接受的最後已知報價年齡（秒）；成交用的要新，估值顯示可以舊一點
+TRADE_MAX_STALENESS = float(os.getenv("TRADE_MAX_STALENESS_SECONDS", "15"))
+PORTFOLIO_MAX_STALENESS = float(os.getenv("PORTFOLIO_MAX_STALENESS_SECONDS", "3600"))
+
+# kind -> (side, direction, label)；direction 是觸發條件：below = 價格 <= 掛單價
+ORDER_KINDS = {
+    "limit_buy": ("buy", "below", "限價買入"),
+    "limit_sell": ("sell", "above", "限價賣出"),
+    "stop_loss": ("sell", "below", "停損"),
+    "take_profit": ("sell", "above", "停利"),
+}
 
 
 class TradingDB:
     """Thin wrapper around SQLite for the paper trading ledger."""
 
     def __init__(self, db_path: Path = DB_PATH) -> None:
-        db_path.parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(str(db_path))
-        self.conn.row_factory = sqlite3.Row
+        # WAL + busy_timeout：多個分片程序可以共用同一個帳本檔案
+        self.db_path = db_path
+        self.conn = connect(db_path)
+        self._depth = 0
         self._init_tables()
 
+    @contextmanager
+    def _transaction(self, op: str, immediate: bool = False):
+        """``with self.conn`` plus commit-time accounting for /metrics.
+
+        Nested calls join the outermost transaction. ``immediate=True`` takes
+        the write lock up front so a read-check-write sequence can't race a
+        writer in another process.
+        """
+        if self._depth:
+            self._depth += 1
+            try:
+                yield self.conn
+            finally:
+                self._depth -= 1
+            return
+
+        start = time.perf_counter()
+        self._depth = 1
+        try:
+            with self.conn:
+                if immediate:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                yield self.conn
+        finally:
+            self._depth = 0
+            SQLITE_TX_LATENCY.observe(time.perf_counter() - start, op=op)
+
     def _init_tables(self) -> None:
         with self.conn:
             self.conn.executescript(
@@ -47,6 +101,82 @@ class TradingDB:
                     PRIMARY KEY (user_id, symbol),
                     FOREIGN KEY (user_id) REFERENCES users(user_id)
                 );
+                -- 掛單：買單凍結 USDT（reserved），賣單凍結部位（quantity + 當時均價）
+                -- AUTOINCREMENT 讓 id 永不重複使用，撮合引擎才能用「最大 id」增量同步
+                CREATE TABLE IF NOT EXISTS orders (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id    TEXT NOT NULL,
+                    channel_id INTEGER NOT NULL,
+                    symbol     TEXT NOT NULL,
+                    kind       TEXT NOT NULL,
+                    side       TEXT NOT NULL,
+                    direction  TEXT NOT NULL,
+                    price      REAL NOT NULL,
+                    quantity   REAL NOT NULL,
+                    reserved   REAL NOT NULL DEFAULT 0.0,
+                    avg_price  REAL NOT NULL DEFAULT 0.0,
+                    created_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_orders_user ON orders (user_id);
+                -- 成交紀錄只增不改；(user_id, id) 索引讓 /history 以 keyset 分頁
+                CREATE TABLE IF NOT EXISTS trades (
+                    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id      TEXT NOT NULL,
+                    symbol       TEXT NOT NULL,
+                    side         TEXT NOT NULL,
+                    kind         TEXT NOT NULL,
+                    quantity     REAL NOT NULL,
+                    price        REAL NOT NULL,
+                    realized_pnl REAL NOT NULL DEFAULT 0.0,
+                    order_id     INTEGER,
+                    executed_at  TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_trades_user ON trades (user_id, id);
+                -- 與 trades 在同一個交易裡增量更新，統計不必掃描整本帳
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id      TEXT PRIMARY KEY,
+                    trade_count  INTEGER NOT NULL DEFAULT 0,
+                    sell_count   INTEGER NOT NULL DEFAULT 0,
+                    win_count    INTEGER NOT NULL DEFAULT 0,
+                    volume       REAL NOT NULL DEFAULT 0.0,
+                    realized_pnl REAL NOT NULL DEFAULT 0.0,
+                    last_trade_at TEXT
+                );
+                -- 定期估值（core/valuation.py）的結果：每位使用者最新的權益與 ROI
+                CREATE TABLE IF NOT EXISTS equity_snapshots (
+                    user_id   TEXT PRIMARY KEY,
+                    cash      REAL NOT NULL,
+                    positions REAL NOT NULL,
+                    equity    REAL NOT NULL,
+                    roi_bps   INTEGER NOT NULL,
+                    valued_at REAL NOT NULL
+                );
+                -- /rank：前 N 名與「我附近」都是這個索引上的範圍掃描
+                CREATE INDEX IF NOT EXISTS idx_equity_rank ON equity_snapshots (equity DESC, user_id);
+                -- 在伺服器裡用過遊戲指令的玩家；equity / roi_bps 複製自 equity_snapshots，
+                -- 伺服器排名才能只掃描 (guild_id, equity) 索引
+                CREATE TABLE IF NOT EXISTS guild_members (
+                    guild_id INTEGER NOT NULL,
+                    user_id  TEXT NOT NULL,
+                    equity   REAL NOT NULL,
+                    roi_bps  INTEGER NOT NULL,
+                    PRIMARY KEY (guild_id, user_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_guild_rank ON guild_members (guild_id, equity DESC, user_id);
+                CREATE INDEX IF NOT EXISTS idx_guild_members_user ON guild_members (user_id);
+                -- 權益時間序列（core/timeseries.py）：raw / 每小時 / 每日三層，各自有保留期限
+                CREATE TABLE IF NOT EXISTS equity_history (
+                    tier       INTEGER NOT NULL,
+                    user_rowid INTEGER NOT NULL,
+                    bucket     INTEGER NOT NULL,
+                    equity     REAL NOT NULL,
+                    PRIMARY KEY (tier, user_rowid, bucket)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS mark_prices (
+                    symbol     TEXT PRIMARY KEY,
+                    price      REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
                 """
             )
 
@@ -58,11 +188,19 @@ class TradingDB:
         if row:
             return dict(row)
         now = datetime.now(tz=timezone.utc).isoformat()
-        with self.conn:
+        with self._transaction("ensure_user"):
             self.conn.execute(
                 "INSERT INTO users (user_id, balance, created_at) VALUES (?, ?, ?)",
                 (user_id, INITIAL_BALANCE, now),
             )
+            # 新玩家馬上出現在 /rank 上，不必等下一輪估值
+            self.conn.execute(
+                """
+                INSERT INTO equity_snapshots (user_id, cash, positions, equity, roi_bps, valued_at)
+                VALUES (?, ?, 0.0, ?, 0, ?) ON CONFLICT(user_id) DO NOTHING
+                """,
+                (user_id, INITIAL_BALANCE, INITIAL_BALANCE, time.time()),
+            )
         return {"user_id": user_id, "balance": INITIAL_BALANCE, "created_at": now}
 
     def get_balance(self, user_id: str) -> float:
@@ -72,12 +210,16 @@ class TradingDB:
         return row["balance"] if row else 0.0
 
     def update_balance(self, user_id: str, delta: float) -> None:
-        with self.conn:
+        with self._transaction("update_balance"):
             self.conn.execute(
                 "UPDATE users SET balance = balance + ? WHERE user_id = ?",
                 (delta, user_id),
             )
 
+    def get_all_user_ids(self) -> list[str]:
+        rows = self.conn.execute("SELECT user_id FROM users").fetchall()
+        return [r["user_id"] for r in rows]
+
     # ── Holdings helpers ─────────────────────────────────────────────
     def get_holding(self, user_id: str, symbol: str) -> dict | None:
         row = self.conn.execute(
@@ -96,7 +238,7 @@ class TradingDB:
     def upsert_holding(
         self, user_id: str, symbol: str, quantity: float, avg_price: float
     ) -> None:
-        with self.conn:
+        with self._transaction("upsert_holding"):
             self.conn.execute(
                 """
                 INSERT INTO holdings (user_id, symbol, quantity, avg_price)
@@ -108,12 +250,327 @@ class TradingDB:
             )
 
     def delete_holding(self, user_id: str, symbol: str) -> None:
-        with self.conn:
+        with self._transaction("delete_holding"):
             self.conn.execute(
                 "DELETE FROM holdings WHERE user_id = ? AND symbol = ?",
                 (user_id, symbol),
             )
 
+    # ── Trades ───────────────────────────────────────────────────────
+    def execute_buy(self, user_id: str, symbol: str, qty_bought: float, price: float) -> float | None:
+        """Buy *qty_bought* at *price*; returns the USDT spent, or None if the balance is short."""
+        with self._transaction("buy", immediate=True):
+            amount = qty_bought * price
+            if amount > self.get_balance(user_id):
+                return None
+
+            # Update holding (weighted average price)
+            self._add_to_holding(user_id, symbol, qty_bought, price)
+            self.update_balance(user_id, -amount)
+            self._record_trade(user_id, symbol, "buy", "market", qty_bought, price)
+            self._revalue_user(user_id, symbol, price)
+        return amount
+
+    def execute_sell(self, user_id: str, symbol: str, quantity: float, price: float) -> dict | None:
+        """Sell *quantity* at *price*; returns the holding as it was before the sale, or None if short."""
+        with self._transaction("sell", immediate=True):
+            holding = self.get_holding(user_id, symbol)
+            if not holding or holding["quantity"] < quantity:
+                return None
+
+            remaining_qty = holding["quantity"] - quantity
+            if remaining_qty < 1e-9:
+                self.delete_holding(user_id, symbol)
+            else:
+                self.upsert_holding(user_id, symbol, remaining_qty, holding["avg_price"])
+
+            self.update_balance(user_id, quantity * price)
+            self._record_trade(user_id, symbol, "sell", "market", quantity, price,
+                               (price - holding["avg_price"]) * quantity)
+            self._revalue_user(user_id, symbol, price)
+        return holding
+
+    def _add_to_holding(self, user_id: str, symbol: str, quantity: float, price: float) -> None:
+        existing = self.get_holding(user_id, symbol)
+        if existing:
+            new_qty = existing["quantity"] + quantity
+            new_avg = (existing["avg_price"] * existing["quantity"] + price * quantity) / new_qty
+        else:
+            new_qty, new_avg = quantity, price
+        self.upsert_holding(user_id, symbol, new_qty, new_avg)
+
+    # ── Trade ledger ─────────────────────────────────────────────────
+    def _record_trade(self, user_id: str, symbol: str, side: str, kind: str, quantity: float,
+                      price: float, realized_pnl: float = 0.0, order_id: int | None = None) -> None:
+        """Append a fill to ``trades`` and fold it into ``user_stats``; call inside the fill's transaction."""
+        now = datetime.now(tz=timezone.utc).isoformat()
+        is_sell = int(side == "sell")
+        self.conn.execute(
+            """
+            INSERT INTO trades (user_id, symbol, side, kind, quantity, price, realized_pnl, order_id, executed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (user_id, symbol, side, kind, quantity, price, realized_pnl, order_id, now),
+        )
+        self.conn.execute(
+            """
+            INSERT INTO user_stats (user_id, trade_count, sell_count, win_count, volume, realized_pnl, last_trade_at)
+            VALUES (?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                trade_count   = trade_count + 1,
+                sell_count    = sell_count + excluded.sell_count,
+                win_count     = win_count + excluded.win_count,
+                volume        = volume + excluded.volume,
+                realized_pnl  = realized_pnl + excluded.realized_pnl,
+                last_trade_at = excluded.last_trade_at
+            """,
+            (user_id, is_sell, int(is_sell and realized_pnl > 0), quantity * price, realized_pnl, now),
+        )
+
+    def get_trades(self, user_id: str, before_id: int | None = None, limit: int = 10) -> list[dict]:
+        """Newest-first page of the user's fills with ``id < before_id`` (keyset pagination)."""
+        rows = self.conn.execute(
+            "SELECT * FROM trades WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (user_id, before_id if before_id is not None else 2**63 - 1, limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def get_stats(self, user_id: str) -> dict:
+        row = self.conn.execute(
+            "SELECT * FROM user_stats WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row:
+            return dict(row)
+        return {"user_id": user_id, "trade_count": 0, "sell_count": 0, "win_count": 0,
+                "volume": 0.0, "realized_pnl": 0.0, "last_trade_at": None}
+
+    # ── Valuation snapshots ──────────────────────────────────────────
+    def get_snapshot(self, user_id: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT * FROM equity_snapshots WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def _revalue_user(self, user_id: str, symbol: str, price: float) -> None:
+        """Re-rank one user after a fill: *symbol* at the fill price, everything else at the last marks.
+
+        Call inside the fill's transaction. Symbols that were never marked fall
+        back to their average cost, same as the bulk valuation.
+        """
+        cash, positions = self.conn.execute(
+            """
+            SELECT
+                (SELECT balance FROM users WHERE user_id = :u)
+                    + (SELECT COALESCE(SUM(reserved), 0.0) FROM orders WHERE user_id = :u AND side = 'buy'),
+                (SELECT COALESCE(SUM(p.quantity * CASE WHEN p.symbol = :s THEN :px
+                                                      ELSE COALESCE(m.price, p.avg_price) END), 0.0)
+                 FROM (SELECT symbol, quantity, avg_price FROM holdings WHERE user_id = :u AND quantity > 0
+                       UNION ALL
+                       SELECT symbol, quantity, avg_price FROM orders WHERE user_id = :u AND side = 'sell') p
+                 LEFT JOIN mark_prices m ON m.symbol = p.symbol)
+            """,
+            {"u": user_id, "s": symbol, "px": price},
+        ).fetchone()
+        equity = cash + positions
+        roi_bps = round((equity / INITIAL_BALANCE - 1) * 10_000)
+        self.conn.execute(
+            """
+            INSERT INTO equity_snapshots (user_id, cash, positions, equity, roi_bps, valued_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                cash = excluded.cash, positions = excluded.positions, equity = excluded.equity,
+                roi_bps = excluded.roi_bps, valued_at = excluded.valued_at
+            """,
+            (user_id, cash, positions, equity, roi_bps, time.time()),
+        )
+        self.conn.execute(
+            "UPDATE guild_members SET equity = ?, roi_bps = ? WHERE user_id = ?",
+            (equity, roi_bps, user_id),
+        )
+
+    def get_equity_curve(self, user_id: str, since: float) -> tuple[str, list[tuple[float, float]]]:
+        """``(tier name, [(unix_ts, equity), ...])`` from the equity history, oldest first."""
+        row = self.conn.execute("SELECT rowid FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return "raw", []
+        tier, points = read_curve(self.conn, row[0], since)
+        return tier.name, points
+
+    def get_mark_prices(self, symbols: list[str]) -> dict[str, tuple[float, float]]:
+        """``{symbol: (price, updated_at)}`` from the last valuation run."""
+        if not symbols:
+            return {}
+        marks = ",".join("?" * len(symbols))
+        rows = self.conn.execute(
+            f"SELECT symbol, price, updated_at FROM mark_prices WHERE symbol IN ({marks})", symbols
+        ).fetchall()
+        return {r["symbol"]: (r["price"], r["updated_at"]) for r in rows}
+
+    # ── Rankings ─────────────────────────────────────────────────────
+    # 所有人的起始資金相同，ROI 與權益的排序一致，兩種排行共用同一個索引。
+    # 同分時以 user_id 決定先後，名次才是全序、前後視窗不會重複或漏人。
+    def join_guild(self, guild_id: int, user_id: str) -> None:
+        """Record that *user_id* plays in *guild_id*, carrying over their current equity."""
+        with self._transaction("join_guild"):
+            self.conn.execute(
+                """
+                INSERT INTO guild_members (guild_id, user_id, equity, roi_bps)
+                VALUES (:g, :u,
+                        COALESCE((SELECT equity FROM equity_snapshots WHERE user_id = :u), :initial),
+                        COALESCE((SELECT roi_bps FROM equity_snapshots WHERE user_id = :u), 0))
+                ON CONFLICT(guild_id, user_id) DO NOTHING
+                """,
+                {"g": guild_id, "u": user_id, "initial": INITIAL_BALANCE},
+            )
+
+    @staticmethod
+    def _rank_scope(guild_id: int | None) -> tuple[str, str, tuple]:
+        """``(table, "WHERE ..." prefix, params)`` for the global or a guild ranking."""
+        if guild_id is None:
+            return "equity_snapshots", "WHERE", ()
+        return "guild_members", "WHERE guild_id = ? AND", (guild_id,)
+
+    def rank_top(self, guild_id: int | None, limit: int = 10) -> list[dict]:
+        table, where, params = self._rank_scope(guild_id)
+        rows = self.conn.execute(
+            f"SELECT user_id, equity, roi_bps FROM {table} {where} 1 "
+            "ORDER BY equity DESC, user_id LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def rank_of(self, guild_id: int | None, user_id: str, window: int = 2) -> dict | None:
+        """The user's rank, the ranking's size and up to *window* neighbours on each side.
+
+        Returns ``{"rank", "total", "first", "rows"}`` (``first`` is the rank of
+        ``rows[0]``) or None if the user is not ranked in this scope. Every query is a range scan on the ranking index.
+        """
+        table, where, params = self._rank_scope(guild_id)
+        me = self.conn.execute(
+            f"SELECT user_id, equity, roi_bps FROM {table} {where} user_id = ?", (*params, user_id)
+        ).fetchone()
+        if me is None:
+            return None
+        e = me["equity"]
+        ahead = self.conn.execute(
+            f"SELECT (SELECT COUNT(*) FROM {table} {where} equity > ?)"
+            f"     + (SELECT COUNT(*) FROM {table} {where} equity = ? AND user_id < ?)",
+            (*params, e, *params, e, user_id),
+        ).fetchone()[0]
+        total = self.conn.execute(f"SELECT COUNT(*) FROM {table} {where} 1", params).fetchone()[0]
+        above = self.conn.execute(
+            f"SELECT user_id, equity, roi_bps FROM {table} {where} equity >= ? "
+            "AND NOT (equity = ? AND user_id >= ?) ORDER BY equity ASC, user_id DESC LIMIT ?",
+            (*params, e, e, user_id, window),
+        ).fetchall()
+        below = self.conn.execute(
+            f"SELECT user_id, equity, roi_bps FROM {table} {where} equity <= ? "
+            "AND NOT (equity = ? AND user_id <= ?) ORDER BY equity DESC, user_id LIMIT ?",
+            (*params, e, e, user_id, window),
+        ).fetchall()
+        rows = [dict(r) for r in reversed(above)] + [dict(me)] + [dict(r) for r in below]
+        return {"rank": ahead + 1, "total": total, "rows": rows, "first": ahead + 1 - len(above)}
+
+    # ── Resting orders ───────────────────────────────────────────────
+    def place_order(self, user_id: str, channel_id: int, symbol: str, kind: str,
+                    price: float, quantity: float) -> dict | None:
+        """Reserve funds / holdings and store the order; None if the balance or holding is short."""
+        side, direction, _ = ORDER_KINDS[kind]
+        now = datetime.now(tz=timezone.utc).isoformat()
+        with self._transaction("place_order", immediate=True):
+            reserved = avg_price = 0.0
+            if side == "buy":
+                reserved = quantity * price
+                if reserved > self.get_balance(user_id):
+                    return None
+                self.update_balance(user_id, -reserved)
+            else:
+                holding = self.get_holding(user_id, symbol)
+                if not holding or holding["quantity"] < quantity:
+                    return None
+                avg_price = holding["avg_price"]
+                remaining = holding["quantity"] - quantity
+                if remaining < 1e-9:
+                    self.delete_holding(user_id, symbol)
+                else:
+                    self.upsert_holding(user_id, symbol, remaining, avg_price)
+            row = self.conn.execute(
+                """
+                INSERT INTO orders (user_id, channel_id, symbol, kind, side, direction,
+                                    price, quantity, reserved, avg_price, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING *
+                """,
+                (user_id, channel_id, symbol, kind, side, direction,
+                 price, quantity, reserved, avg_price, now),
+            ).fetchone()
+        return dict(row)
+
+    def cancel_order(self, user_id: str, order_id: int) -> dict | None:
+        """Delete the user's order and release what it reserved; None if it is gone."""
+        with self._transaction("cancel_order", immediate=True):
+            row = self.conn.execute(
+                "DELETE FROM orders WHERE id = ? AND user_id = ? RETURNING *", (order_id, user_id)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["side"] == "buy":
+                self.update_balance(user_id, row["reserved"])
+            else:
+                self._add_to_holding(user_id, row["symbol"], row["quantity"], row["avg_price"])
+        return dict(row)
+
+    def fill_orders(self, order_ids: list[int], price: float) -> list[dict]:
+        """Fill the given orders at *price* in one transaction; returns the ones that still existed."""
+        filled = []
+        with self._transaction("fill_orders", immediate=True):
+            for start in range(0, len(order_ids), 500):
+                chunk = order_ids[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                # 另一個程序剛取消的單不會出現在 RETURNING 裡
+                filled += self.conn.execute(
+                    f"DELETE FROM orders WHERE id IN ({marks}) RETURNING *", chunk
+                ).fetchall()
+            for row in filled:
+                if row["side"] == "buy":
+                    # 成交價 <= 限價，多凍結的 USDT 退回
+                    self.update_balance(row["user_id"], row["reserved"] - row["quantity"] * price)
+                    self._add_to_holding(row["user_id"], row["symbol"], row["quantity"], price)
+                    pnl = 0.0
+                else:
+                    self.update_balance(row["user_id"], row["quantity"] * price)
+                    pnl = (price - row["avg_price"]) * row["quantity"]
+                self._record_trade(row["user_id"], row["symbol"], row["side"], row["kind"],
+                                   row["quantity"], price, pnl, order_id=row["id"])
+            for user_id in {row["user_id"] for row in filled}:
+                self._revalue_user(user_id, filled[0]["symbol"], price)
+        return [dict(r) for r in filled]
+
+    @staticmethod
+    def order_value(order: dict, price: float | None = None) -> float:
+        """USDT locked in *order*: the reserve of a buy, or a sell's quantity at *price* (default: cost basis)."""
+        if order["side"] == "buy":
+            return order["reserved"]
+        return order["quantity"] * (price if price is not None else order["avg_price"])
+
+    def get_open_orders(self, user_id: str) -> list[dict]:
+        rows = self.conn.execute(
+            "SELECT * FROM orders WHERE user_id = ? ORDER BY id", (user_id,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def count_open_orders(self, user_id: str) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM orders WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+    def orders_after(self, order_id: int) -> list[tuple[int, str, str, float]]:
+        """``(id, symbol, direction, price)`` of orders newer than *order_id*, for the engine."""
+        rows = self.conn.execute(
+            "SELECT id, symbol, direction, price FROM orders WHERE id > ? ORDER BY id", (order_id,)
+        ).fetchall()
+        return [tuple(r) for r in rows]
+
 
 class Game(commands.Cog, name="🎮 模擬交易"):
     """Paper trading game — start with $10,000 USDT and see how you do!"""
@@ -121,15 +578,176 @@ class Game(commands.Cog, name="🎮 模擬交易"):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         self.db = TradingDB()
-        self.exchange = ccxt.binance({"enableRateLimit": True})
+        self.exchange = acquire_exchange()
+        # 撮合引擎只在持有 lease 的程序裡維護；資料庫才是掛單的真實來源
+        self.engine = MatchingEngine()
+        self._order_cursor = 0
+        self._guild_members: set[tuple[int, str]] = set()  # 已寫進 guild_members 的 (guild, user)
+        self.lease = LeaderLease("match_orders", ttl=90)
+        self.valuation_lease = LeaderLease("mark_to_market", ttl=max(90, VALUATION_INTERVAL * 3))
+        self.sampler = EquitySampler()
+        self.match_orders.start()
+        self.mark_to_market.change_interval(seconds=VALUATION_INTERVAL)
+        self.mark_to_market.start()
 
     async def cog_unload(self) -> None:
-        await self.exchange.close()
+        self.match_orders.cancel()
+        self.mark_to_market.cancel()
+        for lease in (self.lease, self.valuation_lease):
+            if lease.is_leader:
+                lease.release()
+        await release_exchange(self.exchange)
+
+    async def cog_before_invoke(self, ctx: commands.Context) -> None:
+        # 沒有 members intent，伺服器排名以「在這裡玩過的人」為準
+        if ctx.guild is None:
+            return
+        key = (ctx.guild.id, str(ctx.author.id))
+        if key not in self._guild_members:
+            self.db.join_guild(*key)
+            self._guild_members.add(key)
+
+    # ── Background task: match resting orders every 10 seconds ───────
+    @tasks.loop(seconds=10)
+    async def match_orders(self) -> None:
+        try:
+            if not self.lease.try_acquire():
+                if self._order_cursor:
+                    # 失去 leader 身分：下次拿回來時從資料庫重建
+                    self.engine.clear()
+                    self._order_cursor = 0
+                return
+            await self._match_orders_once()
+        except (Overloaded, CircuitOpen):
+            pass  # 行情通道滿了或交易所暫時斷線，下一輪再撮合
+        except Exception as exc:
+            logger.error("Order matching error: %s", exc, exc_info=True)
+
+    def _sync_orders(self) -> None:
+        """Pull orders placed since the last cycle (by any process) into the engine."""
+        rows = self.db.orders_after(self._order_cursor)
+        if rows:
+            self.engine.add_many(rows)
+            self._order_cursor = rows[-1][0]
+
+    async def _match_orders_once(self) -> None:
+        self._sync_orders()
+        symbols = self.engine.symbols()
+        if not symbols:
+            return
+        tickers = await SCHEDULER.run(
+            "exchange", self.exchange.fetch_tickers, symbols, priority=Priority.HIGH
+        )
+        QUOTES.update(tickers)
+        fills = []
+        for symbol, ticker in tickers.items():
+            price = ticker.get("last")
+            if price is None:
+                continue
+            crossed = self.engine.crossed_orders(symbol, price)
+            if not crossed:
+                continue
+            try:
+                filled = self.db.fill_orders([row[0] for row in crossed], price)
+            except Exception as exc:
+                # 寫入失敗（例如 database is locked）：掛單放回引擎，下一輪再撮合；其他幣種照常處理
+                self.engine.add_many(crossed)
+                logger.error("Filling %d %s orders failed: %s", len(crossed), symbol, exc)
+                continue
+            fills += [(o, price) for o in filled]
+        if fills:
+            await self._notify_fills(fills)
+
+    async def _notify_fills(self, fills: list[tuple[dict, float]]) -> None:
+        by_channel: dict[int, list[str]] = {}
+        for order, price in fills:
+            label = ORDER_KINDS[order["kind"]][2]
+            by_channel.setdefault(order["channel_id"], []).append(
+                f"<@{order['user_id']}> 📝 **{label}** `{order['symbol']}` "
+                f"`{order['quantity']:,.6f}` 已成交 @ `${price:,.4f}`（掛單 #{order['id']}）"
+            )
+        for channel_id, lines in by_channel.items():
+            channel = self.bot.get_partial_messageable(channel_id)
+            # Discord 單則訊息上限 2000 字
+            chunk = ""
+            for line in lines:
+                if len(chunk) + len(line) + 1 > 2000:
+                    await self._send_quietly(channel, chunk)
+                    chunk = ""
+                chunk = f"{chunk}\n{line}" if chunk else line
+            if chunk:
+                await self._send_quietly(channel, chunk)
+
+    @staticmethod
+    async def _send_quietly(channel, content: str) -> None:
+        try:
+            await channel.send(content)
+        except Exception as exc:
+            logger.error("Failed to send fill notification: %s", exc)
+
+    @match_orders.before_loop
+    async def before_match(self) -> None:
+        await self.bot.wait_until_ready()
+
+    # ── Background task: mark every portfolio to market ──────────────
+    @tasks.loop(seconds=60)
+    async def mark_to_market(self) -> None:
+        try:
+            if not self.valuation_lease.try_acquire():
+                self.sampler.reset()  # 別的程序接手取樣，記住的「上次權益」不再可靠
+                return
+            with VALUATION_CYCLE_LATENCY.time():
+                await self._mark_to_market_once()
+        except (Overloaded, CircuitOpen):
+            pass  # 行情通道滿了或交易所暫時斷線，沿用上一輪的估值
+        except Exception as exc:
+            logger.error("Mark-to-market error: %s", exc, exc_info=True)
+
+    async def _mark_to_market_once(self) -> int:
+        """Value every user off one bulk quote; returns the number of users valued."""
+        from core import valuation  # numpy 載入要 ~0.1s，等第一次估值才 import
+
+        # 讀寫都在背景執行緒、用各自的連線，十萬個使用者也不卡 event loop
+        def read():
+            with closing(connect(self.db.db_path)) as conn:
+                return valuation.load_inputs(conn)
+
+        inputs = await asyncio.to_thread(read)
+        prices: dict[str, float] = {}
+        if inputs.symbols:
+            tickers = await SCHEDULER.run(
+                "exchange", self.exchange.fetch_tickers, inputs.symbols, priority=Priority.LOW
+            )
+            prices = {s: t["last"] for s, t in tickers.items() if t.get("last")}
+            QUOTES.update(tickers)
+
+        def value_and_write():
+            result = valuation.value_portfolios(inputs, prices, INITIAL_BALANCE)
+            with closing(connect(self.db.db_path)) as conn:
+                valuation.write_snapshot(conn, result, prices)
+                self.sampler.sample(conn, result.rowids.tolist(), result.equity.tolist(), result.as_of)
+            return len(result.user_ids)
+
+        return await asyncio.to_thread(value_and_write)
+
+    @mark_to_market.before_loop
+    async def before_mark(self) -> None:
+        await self.bot.wait_until_ready()
 
     # ── Price helper ─────────────────────────────────────────────────
-    async def _get_price(self, symbol: str) -> float:
-        ticker = await self.exchange.fetch_ticker(symbol)
-        return ticker["last"]
+    async def _get_price(self, symbol: str, max_age: float = TRADE_MAX_STALENESS) -> Quote:
+        """Live quote, or the last known one up to *max_age* seconds old when the exchange is down or slow."""
+        # 交易是互動操作，排在圖表 / 分析的行情請求前面
+        return await QUOTES.quote(self.exchange, symbol, max_age, priority=Priority.HIGH)
+
+    @staticmethod
+    def _add_staleness(embed: discord.Embed, quote: Quote) -> None:
+        if quote.stale:
+            embed.add_field(
+                name="⚠️ Delayed Quote",
+                value=f"交易所連線異常，使用 {format_age(quote.age)}前的最後報價",
+                inline=False,
+            )
 
     # ── Command: /buy ────────────────────────────────────────────────
     @commands.hybrid_command(name="buy", aliases=["買"])
@@ -138,9 +756,11 @@ class Game(commands.Cog, name="🎮 模擬交易"):
         self, ctx: commands.Context, symbol: str, amount: float
     ) -> None:
         """買入代幣。用法：/buy BNB/USDT 100（花 100 USDT 買入）"""
-        symbol = symbol.upper()
-        if "/" not in symbol:
-            symbol = f"{symbol}/USDT"
+        try:
+            symbol = MARKETS.normalize(symbol)
+        except UnknownSymbol as exc:
+            await ctx.send(exc.message)
+            return
         user_id = str(ctx.author.id)
         self.db.ensure_user(user_id)
 
@@ -151,40 +771,37 @@ class Game(commands.Cog, name="🎮 模擬交易"):
         async with ctx.typing():
             # Fetch real-time price
             try:
-                price = await self._get_price(symbol)
+                quote = await self._get_price(symbol)
             except ccxt.BadSymbol:
                 await ctx.send(f"❌ 找不到交易對 `{symbol}`，請確認格式（例：BNB/USDT）。")
                 return
+            except (Overloaded, CircuitOpen) as exc:
+                await ctx.send(exc.message)
+                return
             except Exception as exc:
                 logger.error("Price fetch error for %s: %s", symbol, exc)
                 await ctx.send("❌ 無法取得即時報價，請稍後再試。")
                 return
 
-            # Check balance
-            balance = self.db.get_balance(user_id)
-            if amount > balance:
+            price = quote.price
+
+            # 數量依交易對的最小單位無條件捨去，實際花費可能略少於輸入金額
+            qty_bought = MARKETS.amount_to_precision(symbol, amount / price)
+            reason = MARKETS.check_order(symbol, qty_bought, price)
+            if reason:
+                await ctx.send(reason)
+                return
+
+            # Check balance and fill in one transaction
+            cost = self.db.execute_buy(user_id, symbol, qty_bought, price)
+            if cost is None:
+                balance = self.db.get_balance(user_id)
                 await ctx.send(
                     f"❌ 餘額不足！目前餘額：`${balance:,.2f}` USDT，"
                     f"欲花費：`${amount:,.2f}` USDT。"
                 )
                 return
 
-            qty_bought = amount / price
-
-            # Update holding (weighted average price)
-            existing = self.db.get_holding(user_id, symbol)
-            if existing:
-                old_qty = existing["quantity"]
-                old_avg = existing["avg_price"]
-                new_qty = old_qty + qty_bought
-                new_avg = ((old_avg * old_qty) + (price * qty_bought)) / new_qty
-            else:
-                new_qty = qty_bought
-                new_avg = price
-
-            self.db.upsert_holding(user_id, symbol, new_qty, new_avg)
-            self.db.update_balance(user_id, -amount)
-
         embed = discord.Embed(
             title="✅ Buy Successful",
             color=0x00E676,
@@ -193,12 +810,13 @@ class Game(commands.Cog, name="🎮 模擬交易"):
         embed.add_field(name="Symbol", value=f"`{symbol}`", inline=True)
         embed.add_field(name="Execution Price", value=f"`${price:,.4f}`", inline=True)
         embed.add_field(name="Quantity", value=f"`{qty_bought:,.6f}`", inline=True)
-        embed.add_field(name="Cost", value=f"`${amount:,.2f}` USDT", inline=True)
+        embed.add_field(name="Cost", value=f"`${cost:,.2f}` USDT", inline=True)
         embed.add_field(
             name="Remaining Balance",
             value=f"`${self.db.get_balance(user_id):,.2f}` USDT",
             inline=True,
         )
+        self._add_staleness(embed, quote)
         embed.set_footer(text="Paper Degen — Mock Trading")
         await ctx.send(embed=embed)
 
@@ -209,9 +827,11 @@ class Game(commands.Cog, name="🎮 模擬交易"):
         self, ctx: commands.Context, symbol: str, quantity: float
     ) -> None:
         """賣出代幣。用法：/sell BNB/USDT 0.5（賣出 0.5 個代幣）"""
-        symbol = symbol.upper()
-        if "/" not in symbol:
-            symbol = f"{symbol}/USDT"
+        try:
+            symbol = MARKETS.normalize(symbol)
+        except UnknownSymbol as exc:
+            await ctx.send(exc.message)
+            return
         user_id = str(ctx.author.id)
         self.db.ensure_user(user_id)
 
@@ -220,6 +840,12 @@ class Game(commands.Cog, name="🎮 模擬交易"):
             return
 
         holding = self.db.get_holding(user_id, symbol)
+        if holding and abs(holding["quantity"] - quantity) > 1e-12:
+            # 全部賣出時保留原數量，避免捨去後留下一點賣不掉的零頭
+            quantity = MARKETS.amount_to_precision(symbol, quantity)
+            if quantity <= 0:
+                await ctx.send(f"❌ 數量小於 `{symbol}` 的最小單位。")
+                return
         if not holding or holding["quantity"] < quantity:
             held = holding["quantity"] if holding else 0
             await ctx.send(
@@ -230,26 +856,26 @@ class Game(commands.Cog, name="🎮 模擬交易"):
 
         async with ctx.typing():
             try:
-                price = await self._get_price(symbol)
+                quote = await self._get_price(symbol)
             except ccxt.BadSymbol:
                 await ctx.send(f"❌ 找不到交易對 `{symbol}`。")
                 return
+            except (Overloaded, CircuitOpen) as exc:
+                await ctx.send(exc.message)
+                return
             except Exception as exc:
                 logger.error("Price fetch error for %s: %s", symbol, exc)
                 await ctx.send("❌ 無法取得即時報價，請稍後再試。")
                 return
 
-            proceeds = quantity * price
-            remaining_qty = holding["quantity"] - quantity
-
-            if remaining_qty < 1e-9:
-                self.db.delete_holding(user_id, symbol)
-            else:
-                self.db.upsert_holding(
-                    user_id, symbol, remaining_qty, holding["avg_price"]
-                )
+            price = quote.price
 
-            self.db.update_balance(user_id, proceeds)
+            # 報價期間持倉可能已被其他程序賣掉，成交時再檢查一次
+            holding = self.db.execute_sell(user_id, symbol, quantity, price)
+            if holding is None:
+                await ctx.send(f"❌ 持倉不足！`{symbol}` 的持倉在成交前已變動，請重新確認。")
+                return
+            proceeds = quantity * price
 
         pnl = (price - holding["avg_price"]) * quantity
         pnl_pct = ((price / holding["avg_price"]) - 1) * 100 if holding["avg_price"] else 0
@@ -274,9 +900,317 @@ class Game(commands.Cog, name="🎮 模擬交易"):
             value=f"`${self.db.get_balance(user_id):,.2f}` USDT",
             inline=False,
         )
+        self._add_staleness(embed, quote)
         embed.set_footer(text="Paper Degen — Mock Trading")
         await ctx.send(embed=embed)
 
+    # ── Resting orders ───────────────────────────────────────────────
+    async def _place_order(self, ctx: commands.Context, kind: str, symbol: str,
+                           size: float, price: float) -> None:
+        """Shared body of /limitbuy, /limitsell, /stoploss, /takeprofit.
+
+        *size* is USDT to spend for limit buys and the token quantity otherwise.
+        """
+        side, direction, label = ORDER_KINDS[kind]
+        try:
+            symbol = MARKETS.normalize(symbol)
+        except UnknownSymbol as exc:
+            await ctx.send(exc.message)
+            return
+        user_id = str(ctx.author.id)
+        self.db.ensure_user(user_id)
+
+        if size <= 0 or price <= 0:
+            await ctx.send("❌ 數量與價格都必須大於 0。")
+            return
+        if self.db.count_open_orders(user_id) >= MAX_OPEN_ORDERS:
+            await ctx.send(f"❌ 最多只能同時掛 {MAX_OPEN_ORDERS} 張單，請先用 `/cancel` 取消一些。")
+            return
+
+        price = MARKETS.price_to_precision(symbol, price)
+        if price <= 0:
+            # 比最小跳動單位還小的價格會被捨入成 0
+            await ctx.send("❌ 數量與價格都必須大於 0。")
+            return
+        quantity = MARKETS.amount_to_precision(symbol, size / price if side == "buy" else size)
+        reason = MARKETS.check_order(symbol, quantity, price)
+        if reason:
+            await ctx.send(reason)
+            return
+
+        async with ctx.typing():
+            try:
+                quote = await self._get_price(symbol)
+            except ccxt.BadSymbol:
+                await ctx.send(f"❌ 找不到交易對 `{symbol}`，請確認格式（例：BNB/USDT）。")
+                return
+            except (Overloaded, CircuitOpen) as exc:
+                await ctx.send(exc.message)
+                return
+            except Exception as exc:
+                logger.error("Price fetch error for %s: %s", symbol, exc)
+                await ctx.send("❌ 無法取得即時報價，請稍後再試。")
+                return
+
+            current = quote.price
+
+        # 已經穿價的單等於市價單，請使用者直接 /buy、/sell
+        if (direction == "below") != (price < current):
+            where = "低於" if direction == "below" else "高於"
+            await ctx.send(
+                f"❌ {label}價必須{where}現價 `${current:,.4f}`，"
+                f"要立刻成交請直接用 `/{side}`。"
+            )
+            return
+
+        order = self.db.place_order(user_id, ctx.channel.id, symbol, kind, price, quantity)
+        if order is None:
+            if side == "buy":
+                await ctx.send(
+                    f"❌ 餘額不足！目前餘額：`${self.db.get_balance(user_id):,.2f}` USDT，"
+                    f"掛單需要：`${quantity * price:,.2f}` USDT。"
+                )
+            else:
+                holding = self.db.get_holding(user_id, symbol)
+                held = holding["quantity"] if holding else 0
+                await ctx.send(f"❌ 持倉不足！目前持有 `{symbol}`：`{held:,.6f}`，欲掛單：`{quantity:,.6f}`。")
+            return
+        if self.lease.is_leader:
+            self._sync_orders()
+
+        embed = discord.Embed(
+            title=f"📝 {label}掛單成功",
+            color=0x448AFF,
+            timestamp=datetime.now(tz=timezone.utc),
+        )
+        embed.add_field(name="Order", value=f"`#{order['id']}`", inline=True)
+        embed.add_field(name="Symbol", value=f"`{symbol}`", inline=True)
+        embed.add_field(name="Trigger Price", value=f"`${price:,.4f}`", inline=True)
+        embed.add_field(name="Quantity", value=f"`{quantity:,.6f}`", inline=True)
+        embed.add_field(name="Current Price", value=f"`${current:,.4f}`", inline=True)
+        if side == "buy":
+            embed.add_field(name="Reserved", value=f"`${order['reserved']:,.2f}` USDT", inline=True)
+        self._add_staleness(embed, quote)
+        embed.set_footer(text="Paper Degen — Mock Trading | /orders 查看、/cancel 取消")
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="limitbuy", aliases=["限價買"])
+    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT", amount="花費的 USDT 金額",
+                           price="價格跌到多少時買入")
+    async def limit_buy(self, ctx: commands.Context, symbol: str, amount: float, price: float) -> None:
+        """限價買入。用法：/limitbuy BNB 100 550（跌到 550 時花 100 USDT 買入）"""
+        await self._place_order(ctx, "limit_buy", symbol, amount, price)
+
+    @commands.hybrid_command(name="limitsell", aliases=["限價賣"])
+    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT", quantity="要賣出的數量",
+                           price="價格漲到多少時賣出")
+    async def limit_sell(self, ctx: commands.Context, symbol: str, quantity: float, price: float) -> None:
+        """限價賣出。用法：/limitsell BNB 0.5 650（漲到 650 時賣出 0.5 個）"""
+        await self._place_order(ctx, "limit_sell", symbol, quantity, price)
+
+    @commands.hybrid_command(name="stoploss", aliases=["停損"])
+    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT", quantity="要賣出的數量",
+                           price="價格跌到多少時賣出")
+    async def stop_loss(self, ctx: commands.Context, symbol: str, quantity: float, price: float) -> None:
+        """停損單。用法：/stoploss BNB 0.5 520（跌到 520 時賣出 0.5 個）"""
+        await self._place_order(ctx, "stop_loss", symbol, quantity, price)
+
+    @commands.hybrid_command(name="takeprofit", aliases=["停利"])
+    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT", quantity="要賣出的數量",
+                           price="價格漲到多少時賣出")
+    async def take_profit(self, ctx: commands.Context, symbol: str, quantity: float, price: float) -> None:
+        """停利單。用法：/takeprofit BNB 0.5 700（漲到 700 時賣出 0.5 個）"""
+        await self._place_order(ctx, "take_profit", symbol, quantity, price)
+
+    @commands.hybrid_command(name="orders", aliases=["掛單"])
+    async def orders(self, ctx: commands.Context) -> None:
+        """查看你目前的掛單。"""
+        orders = self.db.get_open_orders(str(ctx.author.id))
+        if not orders:
+            await ctx.send("📭 你目前沒有掛單。")
+            return
+
+        lines = []
+        for o in orders:
+            label = ORDER_KINDS[o["kind"]][2]
+            arrow = "⬇️" if o["direction"] == "below" else "⬆️"
+            lines.append(
+                f"`#{o['id']}` **{label}** `{o['symbol']}` `{o['quantity']:,.6f}` "
+                f"{arrow} `${o['price']:,.4f}`"
+            )
+        embed = discord.Embed(
+            title=f"📝 {ctx.author.display_name} 的掛單（{len(orders)}/{MAX_OPEN_ORDERS}）",
+            description="\n".join(lines),
+            color=0x448AFF,
+        )
+        embed.set_footer(text="用 /cancel <編號> 取消掛單")
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="cancel", aliases=["取消掛單"])
+    @app_commands.describe(order_id="掛單編號（見 /orders）")
+    async def cancel(self, ctx: commands.Context, order_id: int) -> None:
+        """取消掛單並退回凍結的資金或持倉。"""
+        order = self.db.cancel_order(str(ctx.author.id), order_id)
+        if order is None:
+            await ctx.send(f"❌ 找不到你的掛單 `#{order_id}`（可能已經成交或取消）。")
+            return
+        self.engine.remove(order_id)
+        label = ORDER_KINDS[order["kind"]][2]
+        released = (
+            f"`${order['reserved']:,.2f}` USDT" if order["side"] == "buy"
+            else f"`{order['quantity']:,.6f}` {order['symbol'].split('/')[0]}"
+        )
+        await ctx.send(f"✅ 已取消 {label}掛單 `#{order_id}`，退回 {released}。")
+
+    # ── Command: /history ────────────────────────────────────────────
+    @commands.hybrid_command(name="history", aliases=["h", "成交紀錄"])
+    @app_commands.describe(before="從這筆成交編號之前開始顯示（翻頁用，見頁尾）")
+    async def history(self, ctx: commands.Context, before: int | None = None) -> None:
+        """查看你的成交紀錄與已實現損益。"""
+        user_id = str(ctx.author.id)
+        trades = self.db.get_trades(user_id, before, HISTORY_PAGE_SIZE)
+        stats = self.db.get_stats(user_id)
+
+        if not trades:
+            await ctx.send("📭 沒有更早的成交紀錄了。" if before else "📭 你還沒有任何成交紀錄。")
+            return
+
+        lines = []
+        for t in trades:
+            when = datetime.fromisoformat(t["executed_at"]).strftime("%m/%d %H:%M")
+            emoji = "🟢" if t["side"] == "buy" else "🔴"
+            label = ORDER_KINDS[t["kind"]][2] if t["kind"] in ORDER_KINDS else t["side"].upper()
+            line = (
+                f"`#{t['id']}` {emoji} **{label}** `{t['symbol']}` "
+                f"`{t['quantity']:,.6f}` @ `${t['price']:,.4f}` · {when}"
+            )
+            if t["side"] == "sell":
+                line += f" · PNL `${t['realized_pnl']:+,.2f}`"
+            lines.append(line)
+
+        win_rate = stats["win_count"] / stats["sell_count"] * 100 if stats["sell_count"] else 0.0
+        pnl_emoji = "📈" if stats["realized_pnl"] >= 0 else "📉"
+        embed = discord.Embed(
+            title=f"🧾 {ctx.author.display_name}'s Trade History",
+            description="\n".join(lines),
+            color=0x448AFF,
+            timestamp=datetime.now(tz=timezone.utc),
+        )
+        embed.add_field(name=f"{pnl_emoji} Realized PNL", value=f"`${stats['realized_pnl']:+,.2f}`", inline=True)
+        embed.add_field(name="🔁 Trades", value=f"`{stats['trade_count']:,}`", inline=True)
+        embed.add_field(name="💰 Volume", value=f"`${stats['volume']:,.2f}`", inline=True)
+        embed.add_field(name="🎯 Win Rate", value=f"`{win_rate:.1f}%`（{stats['sell_count']:,} 筆賣出）", inline=True)
+        if len(trades) == HISTORY_PAGE_SIZE:
+            embed.set_footer(text=f"下一頁：/history before:{trades[-1]['id']}")
+        else:
+            embed.set_footer(text="Paper Degen — Mock Trading")
+        await ctx.send(embed=embed)
+
+    # ── Command: /rank ───────────────────────────────────────────────
+    @commands.hybrid_command(name="rank", aliases=["名次", "資產排行"])
+    @app_commands.describe(scope="guild：本伺服器；global：所有玩家", metric="equity：總資產；roi：報酬率")
+    async def rank(
+        self,
+        ctx: commands.Context,
+        scope: Literal["guild", "global"] = "guild",
+        metric: Literal["equity", "roi"] = "equity",
+    ) -> None:
+        """模擬交易資產排行榜（依最新估值），以及你的名次。"""
+        user_id = str(ctx.author.id)
+        self.db.ensure_user(user_id)
+        guild_id = ctx.guild.id if ctx.guild and scope == "guild" else None
+
+        top = self.db.rank_top(guild_id, 10)
+        mine = self.db.rank_of(guild_id, user_id)
+
+        def fmt(row: dict) -> str:
+            if metric == "roi":
+                return f"`{row['roi_bps'] / 100:+.2f}%`"
+            return f"`${row['equity']:,.2f}`"
+
+        medals = ["🥇", "🥈", "🥉"]
+        lines = []
+        for i, row in enumerate(top):
+            medal = medals[i] if i < 3 else f"`#{i + 1}`"
+            emoji = "📈" if row["roi_bps"] >= 0 else "📉"
+            me = " ⬅️" if row["user_id"] == user_id else ""
+            lines.append(f"{medal} <@{row['user_id']}> — {emoji} {fmt(row)}{me}")
+
+        where = ctx.guild.name if guild_id is not None else "All Traders"
+        title = "Total Equity" if metric == "equity" else "ROI"
+        embed = discord.Embed(
+            title=f"🏆 Paper Trading Rank — {where}",
+            description=f"依 {title} 排序 · {mine['total']:,} 位玩家" if mine else None,
+            color=0xF0B90B,
+            timestamp=datetime.now(tz=timezone.utc),
+        )
+        embed.add_field(name="Top 10", value="\n".join(lines) or "（還沒有人）", inline=False)
+
+        if mine and mine["rank"] > len(top):
+            # 前後各兩名，讓名次不在前十的人也看得到自己離上一名多遠
+            window = []
+            for i, row in enumerate(mine["rows"], mine["first"]):
+                text = f"`#{i}` <@{row['user_id']}> — {fmt(row)}"
+                window.append(f"**{text}** ⬅️" if row["user_id"] == user_id else text)
+            embed.add_field(name=f"📍 Your Rank: #{mine['rank']:,} / {mine['total']:,}",
+                            value="\n".join(window), inline=False)
+        elif mine:
+            embed.add_field(name="📍 Your Rank", value=f"`#{mine['rank']}` / {mine['total']:,}", inline=False)
+
+        snapshot = self.db.get_snapshot(user_id)
+        footer = "Paper Degen — Mock Trading"
+        if snapshot:
+            as_of = datetime.fromtimestamp(snapshot["valued_at"], tz=timezone.utc)
+            footer += f" | Your equity as of {as_of:%H:%M:%S} UTC"
+        embed.set_footer(text=footer)
+        await ctx.send(embed=embed)
+
+    # ── Command: /equity ─────────────────────────────────────────────
+    @commands.hybrid_command(name="equity", aliases=["淨值", "資產曲線"])
+    @app_commands.describe(days=f"顯示最近幾天（1–{MAX_EQUITY_DAYS}，預設 30）")
+    async def equity(self, ctx: commands.Context, days: int = 30) -> None:
+        """畫出你的總資產曲線（來自定期估值的紀錄）。"""
+        days = max(1, min(days, MAX_EQUITY_DAYS))
+        user_id = str(ctx.author.id)
+        self.db.ensure_user(user_id)
+
+        now = time.time()
+        tier, points = self.db.get_equity_curve(user_id, now - days * 86400)
+        snapshot = self.db.get_snapshot(user_id)
+        current = snapshot["equity"] if snapshot else INITIAL_BALANCE
+        points.append((now, current))  # 曲線收在最新一次估值
+        if len(points) < 2:
+            await ctx.send(
+                f"📭 還沒有足夠的資產紀錄，每 {SAMPLE_SECONDS // 60} 分鐘記錄一次，請稍後再來看看。"
+            )
+            return
+
+        timestamps = [datetime.fromtimestamp(t, tz=timezone.utc) for t, _ in points]
+        values = [v for _, v in points]
+        title = f"💎 {ctx.author.display_name}  |  ${current:,.2f}"
+        async with ctx.typing():
+            try:
+                buf = await SCHEDULER.run_in_thread(
+                    "render", charts.render_line, timestamps, values, title=title, label="總資產",
+                )
+            except Overloaded as exc:
+                await ctx.send(exc.message)
+                return
+
+        change = current - values[0]
+        roi = (current / INITIAL_BALANCE - 1) * 100
+        embed = discord.Embed(
+            title=f"📈 {ctx.author.display_name}'s Equity Curve",
+            color=0x00E676 if change >= 0 else 0xFF1744,
+            timestamp=datetime.now(tz=timezone.utc),
+        )
+        embed.add_field(name="💎 Current Equity", value=f"`${current:,.2f}` USDT", inline=True)
+        embed.add_field(name=f"Δ {days}d", value=f"`${change:+,.2f}`", inline=True)
+        embed.add_field(name="Total ROI", value=f"`{roi:+.2f}%`", inline=True)
+        embed.set_image(url="attachment://equity.png")
+        embed.set_footer(text=f"最近 {days} 天 · 解析度 {tier} · {len(points)} 點 | Paper Degen — Mock Trading")
+        await ctx.send(embed=embed, file=discord.File(buf, filename="equity.png"))
+
     # ── Command: /portfolio ──────────────────────────────────────────
     @commands.hybrid_command(name="portfolio", aliases=["p", "持倉"])
     async def portfolio(self, ctx: commands.Context) -> None:
@@ -294,45 +1228,82 @@ class Game(commands.Cog, name="🎮 模擬交易"):
         )
 
         total_value = balance  # start with cash
+        orders = self.db.get_open_orders(user_id)
 
-        if holdings:
+        # 價格取自上一輪估值（mark_to_market），還沒被估值過、或估值已停擺太久的幣種才即時查價
+        symbols = sorted({h["symbol"] for h in holdings} | {o["symbol"] for o in orders if o["side"] == "sell"})
+        cutoff = time.time() - PORTFOLIO_MAX_STALENESS
+        marks = {s: m for s, m in self.db.get_mark_prices(symbols).items() if m[1] >= cutoff}
+        prices = {s: price for s, (price, _) in marks.items()}
+        priced_at = [t for _, t in marks.values()]
+        missing = [s for s in symbols if s not in prices]
+        if missing:
             async with ctx.typing():
-                lines = []
-                for h in holdings:
+                for symbol in missing:
                     try:
-                        price = await self._get_price(h["symbol"])
-                    except Exception:
-                        price = h["avg_price"]  # fallback
-
-                    market_val = h["quantity"] * price
-                    cost_basis = h["quantity"] * h["avg_price"]
-                    pnl = market_val - cost_basis
-                    pnl_pct = ((price / h["avg_price"]) - 1) * 100 if h["avg_price"] else 0
-                    total_value += market_val
-
-                    emoji = "🟢" if pnl >= 0 else "🔴"
-                    lines.append(
-                        f"{emoji} **{h['symbol']}**\n"
-                        f"   Qty: `{h['quantity']:,.6f}` | Avg: `${h['avg_price']:,.4f}`\n"
-                        f"   Price: `${price:,.4f}` | Value: `${market_val:,.2f}`\n"
-                        f"   PNL: `${pnl:+,.2f}` ({pnl_pct:+.2f}%)"
-                    )
-
-                embed.add_field(
-                    name="📦 Holding Details",
-                    value="\n\n".join(lines) if lines else "(No Holdings)",
-                    inline=False,
+                        quote = await self._get_price(symbol, max_age=PORTFOLIO_MAX_STALENESS)
+                    except Exception as exc:
+                        logger.warning("No price for %s, valuing at cost: %s", symbol, exc)
+                        continue  # 下面以均價估算，並標示出來
+                    prices[symbol] = quote.price
+                    if quote.stale:
+                        priced_at.append(quote.at)
+
+        if holdings:
+            lines = []
+            for h in holdings:
+                price = prices.get(h["symbol"], h["avg_price"])
+                priced = "" if h["symbol"] in prices else "（無報價，以均價計）"
+                market_val = h["quantity"] * price
+                cost_basis = h["quantity"] * h["avg_price"]
+                pnl = market_val - cost_basis
+                pnl_pct = ((price / h["avg_price"]) - 1) * 100 if h["avg_price"] else 0
+                total_value += market_val
+
+                emoji = "🟢" if pnl >= 0 else "🔴"
+                lines.append(
+                    f"{emoji} **{h['symbol']}**\n"
+                    f"   Qty: `{h['quantity']:,.6f}` | Avg: `${h['avg_price']:,.4f}`\n"
+                    f"   Price: `${price:,.4f}`{priced} | Value: `${market_val:,.2f}`\n"
+                    f"   PNL: `${pnl:+,.2f}` ({pnl_pct:+.2f}%)"
                 )
+
+            embed.add_field(
+                name="📦 Holding Details",
+                value="\n\n".join(lines) if lines else "(No Holdings)",
+                inline=False,
+            )
         else:
             embed.add_field(name="📦 Holding Details", value="(No Holdings)", inline=False)
 
+        # 掛單凍結的資金 / 部位仍然是你的資產
+        if orders:
+            locked = sum(self.db.order_value(o, prices.get(o["symbol"])) for o in orders)
+            total_value += locked
+            embed.add_field(
+                name="📝 Open Orders",
+                value=f"`{len(orders)}` 張，凍結 `${locked:,.2f}` USDT（`/orders` 查看）",
+                inline=False,
+            )
+
         roi = ((total_value / INITIAL_BALANCE) - 1) * 100
         roi_emoji = "📈" if roi >= 0 else "📉"
+        stats = self.db.get_stats(user_id)
 
         embed.add_field(name="💵 Cash Balance", value=f"`${balance:,.2f}` USDT", inline=True)
         embed.add_field(name="💎 Total Asset Value", value=f"`${total_value:,.2f}` USDT", inline=True)
         embed.add_field(name=f"{roi_emoji} Total ROI", value=f"`{roi:+.2f}%`", inline=True)
-        embed.set_footer(text="Paper Degen — Mock Trading | Initial $10,000 USDT")
+        embed.add_field(
+            name="🧾 Realized PNL",
+            value=f"`${stats['realized_pnl']:+,.2f}`（{stats['trade_count']:,} 筆成交，`/history`）",
+            inline=False,
+        )
+        footer = "Paper Degen — Mock Trading | Initial $10,000 USDT"
+        if priced_at:
+            oldest = min(priced_at)
+            as_of = datetime.fromtimestamp(oldest, tz=timezone.utc)
+            footer += f" | Prices as of {as_of:%H:%M:%S} UTC（{format_age(time.time() - oldest)}前）"
+        embed.set_footer(text=footer)
 
         await ctx.send(embed=embed)
 
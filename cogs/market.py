@@ -3,31 +3,47 @@ Market Analysis Cog — !analyze [symbol], !chart [symbol]
 Fetches OHLCV data via ccxt and generates sarcastic AI commentary with Gemini.
 """
 
-import io
 import os
+import time
+import asyncio
 import logging
 from datetime import datetime, timezone
+from typing import Literal
 
 import ccxt.async_support as ccxt
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-from google import genai
-from google.genai import types
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
 
+from core import charts
+from core.candles import HISTORY_DAYS, HOUR_MS, CandleStore
+from core.exchange import CircuitOpen, acquire_exchange, release_exchange
+from core.markets import MARKETS, REFRESH_HOURS, UnknownSymbol
+from core.quotes import format_age
+from core.metrics import LLM_LATENCY, LLM_RETRIES, STALE_QUOTES
+from core.ratelimit import LIMITER
+from core.scheduler import SCHEDULER, Overloaded, Priority
+
+
 def is_retryable_error(exception):
     """Check if the exception is a rate limit or server error."""
     msg = str(exception).lower()
     return "429" in msg or "500" in msg or "503" in msg or "resource_exhausted" in msg
 
-import matplotlib
-matplotlib.use("Agg")  # headless backend
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+
+def count_llm_retry(retry_state) -> None:
+    """tenacity before_sleep hook: one tick per Gemini retry."""
+    LLM_RETRIES.inc(model=retry_state.args[0].model_name)
+
 
 logger = logging.getLogger("quant_sniper.market")
 
+# /chart、/analyze 可選的週期；全部由本地 1h K 線重採樣而來
+Timeframe = Literal["1h", "4h", "1d", "1w"]
+# 交易所異常時，本地最後一根收盤 K 線最多可以舊到這個秒數，仍拿來畫圖 / 分析
+CANDLE_MAX_STALENESS = float(os.getenv("CANDLE_MAX_STALENESS_SECONDS", "10800"))
+
 # ── Gemini system prompt ─────────────────────────────────────────────
 SYSTEM_PROMPT = """You are "Quant Sniper," a sarcastic, humorous, and seasoned Wall Street veteran.
 Your task is to provide a brief but sharp market analysis based on the provided OHLCV data.
@@ -50,45 +66,127 @@ class Market(commands.Cog, name="📊 市場分析"):
 
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.exchange = ccxt.binance({"enableRateLimit": True})
+        self.exchange = acquire_exchange()
+        self.candles = CandleStore()  # 已收盤的 1h K 線，回測只向交易所補最新的幾根
 
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise EnvironmentError("GEMINI_API_KEY is not set in .env")
 
-        self.client = genai.Client(api_key=api_key)
+        self.api_key = api_key
+        self.client = None  # genai.Client，第一次 /analyze 時才建立（google-genai import 很慢）
         self.model_name = "gemini-2.5-flash"
+        self._warmup: asyncio.Task | None = None
+        self.refresh_markets.change_interval(hours=REFRESH_HOURS)
+        self.refresh_markets.start()
+
+    def _llm(self):
+        if self.client is None:
+            from google import genai
+            self.client = genai.Client(api_key=self.api_key)
+        return self.client
+
+    async def cog_load(self) -> None:
+        self._warmup = asyncio.create_task(self._warm_up())
 
     async def cog_unload(self) -> None:
-        await self.exchange.close()
+        if self._warmup:
+            self._warmup.cancel()
+        self.refresh_markets.cancel()
+        await release_exchange(self.exchange)
+
+    async def _warm_up(self) -> None:
+        """連上 Discord 之後才在背景執行緒載入 matplotlib、建好圖表模板並載入 genai，避免第一個 /chart 卡住 event loop。"""
+        await self.bot.wait_until_ready()
+        await asyncio.to_thread(charts.warm_up)
+        await asyncio.to_thread(self._llm)
+
+    # ── Background task: refresh the local markets index ─────────────
+    @tasks.loop(hours=6)
+    async def refresh_markets(self) -> None:
+        if time.time() - MARKETS.loaded_at < REFRESH_HOURS * 1800:
+            return  # 磁碟快取還很新（例如剛重啟），不必馬上重抓
+        try:
+            count = await SCHEDULER.run(
+                "exchange", MARKETS.refresh, self.exchange, priority=Priority.LOW
+            )
+        except Exception as exc:
+            # 沿用磁碟上的舊資料，下一輪再試
+            logger.warning("Markets refresh failed (%d cached): %s", len(MARKETS), exc)
+            if not MARKETS.loaded:
+                self.refresh_markets.change_interval(minutes=1)  # 完全沒資料時別等 6 小時
+            return
+        logger.info("Markets index refreshed: %d symbols", count)
+        self.refresh_markets.change_interval(hours=REFRESH_HOURS)
 
     @retry(
         retry=retry_if_exception(is_retryable_error),
         wait=wait_exponential(multiplier=1, min=2, max=10),
         stop=stop_after_attempt(3),
+        before_sleep=count_llm_retry,
         reraise=True
     )
     async def _generate_content_with_retry(self, data_str: str) -> str:
         """Call Gemini API with retry logic."""
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=data_str,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT,
-            ),
-        )
+        from google.genai import types
+
+        client = self._llm()
+        LIMITER.charge("llm")  # 每次嘗試（包含重試）都算一次 Gemini 請求
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await client.aio.models.generate_content(
+                model=self.model_name,
+                contents=data_str,
+                config=types.GenerateContentConfig(
+                    system_instruction=SYSTEM_PROMPT,
+                ),
+            )
+            status = "ok"
+        except Exception as exc:
+            msg = str(exc).lower()
+            if "429" in msg or "resource_exhausted" in msg:
+                LIMITER.throttled("llm")
+            raise
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - start, model=self.model_name, status=status)
+        LIMITER.succeeded("llm")
         return response.text.strip()
 
     # ── Helper: fetch OHLCV ──────────────────────────────────────────
-    async def _fetch_ohlcv(self, symbol: str, limit: int = 24) -> list:
-        """Fetch 1h candles for *symbol*."""
-        ohlcv = await self.exchange.fetch_ohlcv(symbol, timeframe="1h", limit=limit)
-        return ohlcv
+    async def _fetch_ohlcv(self, symbol: str, limit: int = 24, timeframe: str = "1h",
+                           max_age: float = CANDLE_MAX_STALENESS) -> tuple[list, float]:
+        """``(candles, age)``: the newest *limit* candles of *timeframe* for *symbol*.
+
+        Built from the local 1h store: one exchange call for any timeframe
+        once the history is cached (see core/candles.py), and the last candle
+        is the one still forming (*age* 0). If the exchange is unreachable or
+        the lane is full, the stored closed candles are served instead, as
+        long as the newest one closed at most *max_age* seconds ago; *age* is
+        then the seconds since it closed.
+        """
+        try:
+            ohlcv = await SCHEDULER.run("exchange", self.candles.fetch, self.exchange, symbol, timeframe, limit)
+            return ohlcv, 0.0
+        except (ccxt.NetworkError, Overloaded) as exc:
+            ohlcv = self.candles.stored(symbol, timeframe, limit)
+            # 4h / 1d / 1w 的最後一根是重採樣後的 bar，開盤時間早於最新的 1h K 線；年齡一律從 1h 算
+            newest = self.candles.span(symbol)[1]
+            age = time.time() - (newest + HOUR_MS) / 1000 if ohlcv and newest is not None else None
+            if age is None or age > max_age:
+                raise
+            STALE_QUOTES.inc(reason=type(exc).__name__)
+            logger.info("Serving stored %s %s candles %.0fs old: %s", symbol, timeframe, age, exc)
+            return ohlcv, max(0.0, age)
+
+    @staticmethod
+    def _stale_note(age: float) -> str:
+        return f"交易所連線異常，資料停在 {format_age(age)}前收盤的 K 線"
 
     @staticmethod
-    def _format_ohlcv(ohlcv: list, symbol: str) -> str:
+    def _format_ohlcv(ohlcv: list, symbol: str, timeframe: str = "1h") -> str:
         """Format OHLCV list into a readable string for the LLM."""
-        lines = [f"交易對：{symbol}", "時間 | 開盤 | 最高 | 最低 | 收盤 | 成交量"]
+        lines = [f"交易對：{symbol}（{timeframe} K 線）", "時間 | 開盤 | 最高 | 最低 | 收盤 | 成交量"]
         for candle in ohlcv:
             ts = datetime.fromtimestamp(candle[0] / 1000, tz=timezone.utc).strftime(
                 "%m-%d %H:%M"
@@ -144,20 +242,26 @@ class Market(commands.Cog, name="📊 市場分析"):
 
     # ── Command: /analyze ────────────────────────────────────────────
     @commands.hybrid_command(name="analyze", aliases=["a", "分析"])
-    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT")
-    async def analyze(self, ctx: commands.Context, symbol: str = "BNB/USDT") -> None:
-        """分析指定交易對的市場走勢（預設 BNB/USDT）。"""
-        symbol = symbol.upper()
-        if "/" not in symbol:
-            symbol = f"{symbol}/USDT"
+    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT", timeframe="K 線週期（預設 1h）")
+    async def analyze(self, ctx: commands.Context, symbol: str = "BNB/USDT",
+                      timeframe: Timeframe = "1h") -> None:
+        """分析指定交易對的市場走勢（預設 BNB/USDT、1h）。"""
+        try:
+            symbol = MARKETS.normalize(symbol)
+        except UnknownSymbol as exc:
+            await ctx.send(exc.message)
+            return
 
         async with ctx.typing():
             # 1) Fetch market data
             try:
-                ohlcv = await self._fetch_ohlcv(symbol)
+                ohlcv, stale_age = await self._fetch_ohlcv(symbol, timeframe=timeframe)
             except ccxt.BadSymbol:
                 await ctx.send(f"❌ 找不到交易對 `{symbol}`，請確認格式（例：BNB/USDT）。")
                 return
+            except (Overloaded, CircuitOpen) as exc:
+                await ctx.send(exc.message)
+                return
             except Exception as exc:
                 logger.error("OHLCV fetch error for %s: %s", symbol, exc)
                 await ctx.send("❌ 無法取得市場數據，請稍後再試。")
@@ -170,11 +274,13 @@ class Market(commands.Cog, name="📊 市場分析"):
             current_price = ohlcv[-1][4]  # latest close
 
             # 2) Generate AI commentary
-            data_str = self._format_ohlcv(ohlcv, symbol)
+            data_str = self._format_ohlcv(ohlcv, symbol, timeframe)
 
             try:
                 # Use the new helper method with retry
-                commentary = await self._generate_content_with_retry(data_str)
+                commentary = await SCHEDULER.run("llm", self._generate_content_with_retry, data_str)
+            except Overloaded:
+                commentary = "（AI 分析排隊的人太多了，這次先看盤就好 🚦 請稍後再試）"
             except Exception as exc:
                 logger.error("Gemini API error (after retries): %s", exc, exc_info=True)
                 if "429" in str(exc) or "RESOURCE_EXHAUSTED" in str(exc):
@@ -195,32 +301,40 @@ class Market(commands.Cog, name="📊 市場分析"):
 
             # 4) Build embed
             embed = discord.Embed(
-                title=f"📊 {symbol} Market Analysis",
+                title=f"📊 {symbol} Market Analysis ({timeframe})",
                 color=embed_color,
                 timestamp=datetime.now(tz=timezone.utc),
             )
             embed.add_field(name="💰 Current Price", value=f"`${current_price:,.4f}`", inline=True)
             embed.add_field(name="📈 Trend", value=trend, inline=True)
             embed.add_field(name="🤖 AI Sniper Analysis", value=commentary, inline=False)
+            if stale_age:
+                embed.add_field(name="⚠️ Delayed Data", value=self._stale_note(stale_age), inline=False)
             embed.set_footer(text="⚠️ For entertainment only. Not financial advice. | Paper Degen Bot")
 
             await ctx.send(embed=embed)
 
     # ── Command: /chart ──────────────────────────────────────────────
     @commands.hybrid_command(name="chart", aliases=["c", "圖表"])
-    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT")
-    async def chart(self, ctx: commands.Context, symbol: str = "BNB/USDT") -> None:
-        """生成價格走勢圖 + 技術指標（SMA、RSI）。"""
-        symbol = symbol.upper()
-        if "/" not in symbol:
-            symbol = f"{symbol}/USDT"
+    @app_commands.describe(symbol="幣種或交易對，例如 BNB 或 BTC/USDT", timeframe="K 線週期（預設 1h）")
+    async def chart(self, ctx: commands.Context, symbol: str = "BNB/USDT",
+                    timeframe: Timeframe = "1h") -> None:
+        """生成 K 線圖 + 成交量 + 技術指標（SMA、RSI）。"""
+        try:
+            symbol = MARKETS.normalize(symbol)
+        except UnknownSymbol as exc:
+            await ctx.send(exc.message)
+            return
 
         async with ctx.typing():
             try:
-                ohlcv = await self._fetch_ohlcv(symbol, limit=72)  # 3 days of 1h data
+                ohlcv, stale_age = await self._fetch_ohlcv(symbol, limit=72, timeframe=timeframe)  # 72 根 K 線
             except ccxt.BadSymbol:
                 await ctx.send(f"❌ 找不到交易對 `{symbol}`，請確認格式（例：BNB/USDT）。")
                 return
+            except (Overloaded, CircuitOpen) as exc:
+                await ctx.send(exc.message)
+                return
             except Exception as exc:
                 logger.error("Chart OHLCV fetch error for %s: %s", symbol, exc)
                 await ctx.send("❌ 無法取得市場數據，請稍後再試。")
@@ -231,77 +345,19 @@ class Market(commands.Cog, name="📊 市場分析"):
                 return
 
             # Extract data
-            timestamps = [datetime.fromtimestamp(c[0] / 1000, tz=timezone.utc) for c in ohlcv]
             closes = [c[4] for c in ohlcv]
-            volumes = [c[5] for c in ohlcv]
             sma20 = self._calc_sma(closes, 20)
             rsi = self._calc_rsi(closes, 14)
 
             current_price = closes[-1]
             rsi_current = rsi[-1]
 
-            # ── Build chart ──────────────────────────────────────────
-            fig, (ax_price, ax_rsi) = plt.subplots(
-                2, 1, figsize=(12, 7), height_ratios=[3, 1],
-                gridspec_kw={"hspace": 0.08},
-            )
-            fig.patch.set_facecolor("#1a1a2e")
-
-            # Price + SMA
-            ax_price.set_facecolor("#16213e")
-            ax_price.plot(timestamps, closes, color="#00E676", linewidth=1.5, label="收盤價")
-            sma_vals = [(t, v) for t, v in zip(timestamps, sma20) if v is not None]
-            if sma_vals:
-                ax_price.plot(
-                    [s[0] for s in sma_vals], [s[1] for s in sma_vals],
-                    color="#FFD600", linewidth=1, linestyle="--", label="SMA 20",
-                )
-            ax_price.fill_between(timestamps, closes, min(closes), alpha=0.1, color="#00E676")
-            # Auto-scale Y axis to data range with 5% padding
-            price_min, price_max = min(closes), max(closes)
-            price_margin = (price_max - price_min) * 0.05 or price_max * 0.01
-            ax_price.set_ylim(price_min - price_margin, price_max + price_margin)
-            ax_price.set_title(
-                f"📊 {symbol}  |  ${current_price:,.4f}",
-                color="white", fontsize=14, fontweight="bold", pad=12,
-            )
-            ax_price.legend(loc="upper left", fontsize=8, facecolor="#16213e", edgecolor="#333",
-                            labelcolor="white")
-            ax_price.tick_params(colors="white", labelsize=8)
-            ax_price.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d %H:%M"))
-            ax_price.tick_params(axis="x", labelbottom=False)
-            ax_price.grid(color="#333", alpha=0.5)
-            for spine in ax_price.spines.values():
-                spine.set_color("#333")
-
-            # RSI
-            ax_rsi.set_facecolor("#16213e")
-            rsi_vals = [(t, v) for t, v in zip(timestamps, rsi) if v is not None]
-            if rsi_vals:
-                rsi_times = [r[0] for r in rsi_vals]
-                rsi_data = [r[1] for r in rsi_vals]
-                ax_rsi.plot(rsi_times, rsi_data, color="#BB86FC", linewidth=1.2)
-                ax_rsi.axhline(y=70, color="#FF1744", linewidth=0.8, linestyle="--", alpha=0.7)
-                ax_rsi.axhline(y=30, color="#00E676", linewidth=0.8, linestyle="--", alpha=0.7)
-                ax_rsi.fill_between(rsi_times, rsi_data, 70,
-                                     where=[v > 70 for v in rsi_data], alpha=0.2, color="#FF1744")
-                ax_rsi.fill_between(rsi_times, rsi_data, 30,
-                                     where=[v < 30 for v in rsi_data], alpha=0.2, color="#00E676")
-            ax_rsi.set_ylabel("RSI", color="white", fontsize=9)
-            ax_rsi.set_ylim(0, 100)
-            ax_rsi.tick_params(colors="white", labelsize=8)
-            ax_rsi.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d %H:%M"))
-            fig.autofmt_xdate(rotation=30)
-            ax_rsi.grid(color="#333", alpha=0.5)
-            for spine in ax_rsi.spines.values():
-                spine.set_color("#333")
-
-            # Save to buffer
-            buf = io.BytesIO()
-            fig.savefig(buf, format="png", dpi=120, bbox_inches="tight",
-                        facecolor=fig.get_facecolor())
-            buf.seek(0)
-            plt.close(fig)
+            # ── Build chart（在 render 執行緒池中繪製，不卡 event loop） ──
+            try:
+                buf = await SCHEDULER.run_in_thread("render", charts.render_candles, symbol, ohlcv, sma20, rsi)
+            except Overloaded as exc:
+                await ctx.send(exc.message)
+                return
 
             # RSI status text
             if rsi_current is not None:
@@ -321,11 +377,97 @@ class Market(commands.Cog, name="📊 市場分析"):
             )
             embed.add_field(name="💰 當前價格", value=f"`${current_price:,.4f}`", inline=True)
             embed.add_field(name="📊 RSI(14)", value=rsi_text, inline=True)
+            if stale_age:
+                embed.add_field(name="⚠️ 資料延遲", value=self._stale_note(stale_age), inline=False)
             embed.set_image(url="attachment://chart.png")
-            embed.set_footer(text="1H 時間框架 · SMA 20 · RSI 14 | Paper Degen Bot")
+            embed.set_footer(text=f"{timeframe.upper()} 時間框架 · 成交量 · SMA 20 · RSI 14 | Paper Degen Bot")
 
             await ctx.send(embed=embed, file=discord.File(buf, filename="chart.png"))
 
+    # ── Command: /backtest ───────────────────────────────────────────
+    @commands.hybrid_command(name="backtest", aliases=["bt", "回測"])
+    @app_commands.describe(
+        symbol="幣種或交易對，例如 BNB 或 BTC/USDT",
+        strategy="sma：站上 SMA 20 做多；rsi：RSI 30 買 70 賣；breakout：突破 20 根高點",
+        days=f"回測天數（7–{HISTORY_DAYS}，預設 90）",
+    )
+    async def backtest(
+        self,
+        ctx: commands.Context,
+        symbol: str,
+        strategy: Literal["sma", "rsi", "breakout"],
+        days: int = 90,
+    ) -> None:
+        """用本地 1H K 線回測 /chart 的訊號（SMA、RSI）或突破策略。"""
+        from core import backtest  # numpy 載入要 ~0.1s，第一次回測才 import
+
+        try:
+            symbol = MARKETS.normalize(symbol)
+        except UnknownSymbol as exc:
+            await ctx.send(exc.message)
+            return
+        days = max(7, min(days, HISTORY_DAYS))
+        warmup_days = -(-backtest.WARMUP // 24)
+
+        async with ctx.typing():
+            # 本地已有完整區間就不打交易所；否則只補缺的那幾頁
+            if not self.candles.is_fresh(symbol, days + warmup_days):
+                try:
+                    await SCHEDULER.run("exchange", self.candles.sync, self.exchange, symbol, days + warmup_days)
+                except ccxt.BadSymbol:
+                    await ctx.send(f"❌ 找不到交易對 `{symbol}`，請確認格式（例：BNB/USDT）。")
+                    return
+                except (Overloaded, CircuitOpen) as exc:
+                    await ctx.send(exc.message)
+                    return
+                except Exception as exc:
+                    logger.error("Candle sync error for %s: %s", symbol, exc)
+                    await ctx.send("❌ 無法取得歷史 K 線，請稍後再試。")
+                    return
+
+            since = int(time.time() * 1000) - days * 24 * HOUR_MS
+            ohlcv = self.candles.load(symbol, since=since - backtest.WARMUP * HOUR_MS)
+            start = next((i for i, c in enumerate(ohlcv) if c[0] >= since), len(ohlcv))
+            if len(ohlcv) - start < 48:
+                await ctx.send(f"⚠️ `{symbol}` 的歷史 K 線不足以回測。")
+                return
+
+            started = time.perf_counter()
+            result = backtest.run(strategy, ohlcv, start=start)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            info = backtest.STRATEGIES[strategy]
+            timestamps = [datetime.fromtimestamp(t / 1000, tz=timezone.utc) for t in result.timestamps.tolist()]
+            try:
+                buf = await SCHEDULER.run_in_thread(
+                    "render", charts.render_line, timestamps,
+                    (result.equity * 10_000).tolist(), (result.benchmark * 10_000).tolist(),
+                    title=f"🧪 {symbol}  |  {info.label}", label="策略權益", reference_label="買入持有",
+                )
+            except Overloaded as exc:
+                await ctx.send(exc.message)
+                return
+
+        win_rate = f"`{result.win_rate * 100:.1f}%`" if result.win_rate is not None else "—"
+        embed = discord.Embed(
+            title=f"🧪 {symbol} 回測：{info.label}",
+            description=info.description,
+            color=0x00E676 if result.total_return >= result.benchmark_return else 0xFF1744,
+            timestamp=datetime.now(tz=timezone.utc),
+        )
+        embed.add_field(name="📈 Return", value=f"`{result.total_return * 100:+.2f}%`", inline=True)
+        embed.add_field(name="🪙 Buy & Hold", value=f"`{result.benchmark_return * 100:+.2f}%`", inline=True)
+        embed.add_field(name="📉 Max Drawdown", value=f"`{result.max_drawdown * 100:.2f}%`", inline=True)
+        embed.add_field(name="🎯 Win Rate", value=win_rate, inline=True)
+        embed.add_field(name="🔁 Trades", value=f"`{result.trades}`", inline=True)
+        embed.add_field(name="⏱️ Exposure", value=f"`{result.exposure * 100:.0f}%`", inline=True)
+        embed.set_image(url="attachment://backtest.png")
+        embed.set_footer(
+            text=f"{days} 天 · {len(result.equity)} 根 1H K 線 · 手續費 {backtest.FEE_RATE:.1%} · "
+                 f"計算 {elapsed_ms:.1f} ms | ⚠️ 過去績效不代表未來"
+        )
+        await ctx.send(embed=embed, file=discord.File(buf, filename="backtest.png"))
+
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(Market(bot))
@@ -0,0 +1,82 @@
+"""
+Metrics Cog — serves Prometheus text format on a local HTTP port.
+Records per-command latency and event-loop lag; the other counters are
+filled in by core/exchange.py, core/rpc.py and the cogs themselves.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from aiohttp import web
+from discord.ext import commands
+
+from core.metrics import COMMAND_LATENCY, LOOP_LAG, REGISTRY
+
+logger = logging.getLogger("quant_sniper.metrics")
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 = 不開 HTTP，只在記憶體裡累計
+LAG_INTERVAL = 0.5  # 秒
+
+
+class Metrics(commands.Cog, name="📈 監控指標"):
+    """Prometheus exporter for latency histograms and counters."""
+
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+        self._started: dict[int, float] = {}  # id(ctx) -> perf_counter
+        self._runner: web.AppRunner | None = None
+        self._lag_task: asyncio.Task | None = None
+
+    async def cog_load(self) -> None:
+        self._lag_task = asyncio.create_task(self._watch_loop_lag())
+        if METRICS_PORT:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle_metrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, METRICS_HOST, METRICS_PORT).start()
+            logger.info("Metrics on http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+
+    async def cog_unload(self) -> None:
+        if self._lag_task:
+            self._lag_task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    async def _watch_loop_lag(self) -> None:
+        """Sleep a fixed interval and record how late the loop woke us up."""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            LOOP_LAG.observe(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+    # ── Command latency ──────────────────────────────────────────────
+    def _finish(self, ctx: commands.Context, status: str) -> None:
+        start = self._started.pop(id(ctx), None)
+        if start is None or ctx.command is None:
+            return
+        COMMAND_LATENCY.observe(
+            time.perf_counter() - start, command=ctx.command.qualified_name, status=status
+        )
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx: commands.Context) -> None:
+        self._started[id(ctx)] = time.perf_counter()
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx: commands.Context) -> None:
+        self._finish(ctx, "ok")
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
+        self._finish(ctx, "error")
+
+
+async def setup(bot: commands.Bot) -> None:
+    await bot.add_cog(Metrics(bot))
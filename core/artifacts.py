@@ -0,0 +1,111 @@
+"""
+Compiled-contract artifact cache.
+以 (原始碼 hash, solc 版本, 編譯設定) 為 key 保存 ABI 與 bytecode，
+原始碼沒變時部署腳本與 Bot 都不需要重新編譯。
+"""
+
+import json
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger("quant_sniper.artifacts")
+
+CONTRACTS_DIR = Path(__file__).resolve().parent.parent / "contracts"
+BUILD_DIR = CONTRACTS_DIR / "build"
+
+SOLC_VERSION = "0.8.19"
+COMPILER_SETTINGS = {
+    "outputSelection": {
+        "*": {"*": ["abi", "metadata", "evm.bytecode", "evm.sourceMap"]}
+    }
+}
+
+
+def artifact_key(source: str, solc_version: str = SOLC_VERSION, settings: dict = COMPILER_SETTINGS) -> str:
+    """Content address for one compilation: source, compiler version and settings."""
+    h = hashlib.sha256()
+    h.update(source.encode("utf-8"))
+    h.update(b"\0" + solc_version.encode())
+    h.update(b"\0" + json.dumps(settings, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _artifact_path(name: str, key: str) -> Path:
+    return BUILD_DIR / f"{name}-{key[:16]}.json"
+
+
+def _read_source(name: str) -> str:
+    return (CONTRACTS_DIR / f"{name}.sol").read_text(encoding="utf-8")
+
+
+def load_artifact(name: str = "Leaderboard") -> dict | None:
+    """Return the cached artifact for the current source of *name*, if any."""
+    key = artifact_key(_read_source(name))
+    path = _artifact_path(name, key)
+    if not path.exists():
+        return None
+    artifact = json.loads(path.read_text(encoding="utf-8"))
+    return artifact if artifact.get("key") == key else None
+
+
+def compile_contract(name: str = "Leaderboard", force: bool = False) -> dict:
+    """Compile ``contracts/<name>.sol`` unless an up-to-date artifact is cached.
+
+    Returns ``{"abi", "bytecode", "key", "solc_version", "cached"}``.
+    """
+    source = _read_source(name)
+    key = artifact_key(source)
+    path = _artifact_path(name, key)
+
+    if not force and path.exists():
+        artifact = json.loads(path.read_text(encoding="utf-8"))
+        if artifact.get("key") == key:
+            logger.info("Using cached artifact %s", path.name)
+            return {**artifact, "cached": True}
+
+    # solcx 只有真的需要編譯時才載入
+    from solcx import compile_standard, get_installed_solc_versions, install_solc
+
+    if SOLC_VERSION not in {str(v) for v in get_installed_solc_versions()}:
+        logger.info(f"Installing solc v{SOLC_VERSION}...")
+        install_solc(SOLC_VERSION)
+
+    logger.info(f"Compiling {name}.sol...")
+    compiled = compile_standard(
+        {
+            "language": "Solidity",
+            "sources": {f"{name}.sol": {"content": source}},
+            "settings": COMPILER_SETTINGS,
+        },
+        solc_version=SOLC_VERSION,
+    )
+    output = compiled["contracts"][f"{name}.sol"][name]
+    artifact = {
+        "contract": name,
+        "key": key,
+        "solc_version": SOLC_VERSION,
+        "abi": output["abi"],
+        "bytecode": output["evm"]["bytecode"]["object"],
+    }
+
+    # 先寫暫存檔再 rename，避免並行部署讀到寫一半的檔案
+    BUILD_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(artifact), encoding="utf-8")
+    tmp.replace(path)
+    load_abi.cache_clear()
+    return {**artifact, "cached": False}
+
+
+@lru_cache(maxsize=None)
+def load_abi(name: str = "Leaderboard") -> list:
+    """ABI for *name*: the cached build artifact if present, else ``<name>_ABI.json``."""
+    artifact = load_artifact(name)
+    if artifact is not None:
+        return artifact["abi"]
+    fallback = CONTRACTS_DIR / f"{name}_ABI.json"
+    logger.info("No build artifact for %s, falling back to %s", name, fallback.name)
+    return json.loads(fallback.read_text(encoding="utf-8"))
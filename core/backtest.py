@@ -0,0 +1,166 @@
+"""
+Vectorized backtests of the signals ``/chart`` draws, plus a breakout rule.
+
+A strategy turns a candle series into a long / flat position for every
+candle. Returns, fees, the equity curve, drawdown and per-trade results are
+then a handful of NumPy array operations, so a few thousand candles take a
+few milliseconds. The only Python loop is Wilder's RSI smoothing, which is
+recursive and is kept identical to ``Market._calc_rsi``.
+
+A position is decided on a candle's close and held from the next candle on,
+so there is no look-ahead. Trading is long-only and all-in, the same as the
+paper trading game.
+"""
+
+from typing import Callable, NamedTuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FEE_RATE = 0.001   # 每次進場或出場 0.1%（Binance 現貨一般費率）
+WARMUP = 50        # 指標暖機需要的 K 線數，不計入回測區間
+
+
+class Strategy(NamedTuple):
+    label: str
+    description: str
+    signal: Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]  # (high, low, close) -> 0/1
+
+
+class Result(NamedTuple):
+    strategy: str
+    timestamps: np.ndarray   # ms
+    equity: np.ndarray       # 從 1.0 開始
+    benchmark: np.ndarray    # 買入持有，從 1.0 開始
+    total_return: float
+    benchmark_return: float
+    max_drawdown: float      # 負數，例如 -0.12
+    win_rate: float | None   # 沒有交易時為 None
+    trades: int
+    exposure: float          # 持倉時間比例
+
+
+# ── Indicators ───────────────────────────────────────────────────────
+def sma(x: np.ndarray, period: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        c = np.cumsum(np.insert(x, 0, 0.0))
+        out[period - 1:] = (c[period:] - c[:-period]) / period
+    return out
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    """Wilder's RSI, same values as ``Market._calc_rsi``."""
+    out = np.full(len(close), np.nan)
+    delta = np.diff(close)
+    if len(delta) < period:
+        return out
+    gains = np.maximum(delta, 0.0).tolist()
+    losses = np.maximum(-delta, 0.0).tolist()
+    avg_gain = sum(gains[:period]) / period
+    avg_loss = sum(losses[:period]) / period
+    avg_gains = [avg_gain]
+    avg_losses = [avg_loss]
+    for g, l in zip(gains[period:], losses[period:]):
+        avg_gain = (avg_gain * (period - 1) + g) / period
+        avg_loss = (avg_loss * (period - 1) + l) / period
+        avg_gains.append(avg_gain)
+        avg_losses.append(avg_loss)
+    g = np.array(avg_gains)
+    l = np.array(avg_losses)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(l == 0, 100.0, 100 - 100 / (1 + g / l))
+    out[period:] = values
+    return out
+
+
+def _rolling(x: np.ndarray, period: int, fn) -> np.ndarray:
+    """*fn* over the *period* candles before each candle (the current one excluded)."""
+    out = np.full(len(x), np.nan)
+    if len(x) > period:
+        out[period:] = fn(sliding_window_view(x[:-1], period), axis=1)
+    return out
+
+
+def _hold(enter: np.ndarray, exit_: np.ndarray) -> np.ndarray:
+    """Long from an *enter* candle until the next *exit_* candle (forward-filled state)."""
+    state = np.full(len(enter), np.nan)
+    state[exit_] = 0.0
+    state[enter] = 1.0
+    idx = np.where(np.isnan(state), 0, np.arange(len(state)))
+    np.maximum.accumulate(idx, out=idx)
+    held = state[idx]
+    return np.nan_to_num(held, nan=0.0)
+
+
+# ── Strategies ───────────────────────────────────────────────────────
+def _sma_cross(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    ma = sma(close, 20)
+    with np.errstate(invalid="ignore"):
+        return (close > ma).astype(np.float64)
+
+
+def _rsi_reversion(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    r = rsi(close, 14)
+    with np.errstate(invalid="ignore"):
+        return _hold(r < 30, r > 70)
+
+
+def _breakout(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    upper = _rolling(high, 20, np.max)
+    lower = _rolling(low, 10, np.min)
+    with np.errstate(invalid="ignore"):
+        return _hold(close > upper, close < lower)
+
+
+STRATEGIES = {
+    "sma": Strategy("SMA 20 Cross", "收盤站上 SMA 20 做多，跌破出場", _sma_cross),
+    "rsi": Strategy("RSI 14 Mean Reversion", "RSI < 30 買進，RSI > 70 賣出", _rsi_reversion),
+    "breakout": Strategy("20/10 Breakout", "突破前 20 根高點買進，跌破前 10 根低點出場", _breakout),
+}
+
+
+# ── Engine ───────────────────────────────────────────────────────────
+def run(strategy: str, ohlcv, start: int = WARMUP, fee_rate: float = FEE_RATE) -> Result:
+    """Backtest *strategy* on ``[ts, o, h, l, c, v]`` candles, trading only from index *start*.
+
+    Candles before *start* only warm up the indicators.
+    """
+    data = np.asarray(ohlcv, dtype=np.float64)
+    ts, high, low, close = data[:, 0], data[:, 2], data[:, 3], data[:, 4]
+    signal = STRATEGIES[strategy].signal(high, low, close)
+
+    close = close[start:]
+    # 第 i 根收盤決定部位，第 i+1 根才開始承擔報酬；回測起點一律空手
+    held = np.concatenate(([0.0], signal[start:-1]))
+    ret = np.concatenate(([0.0], close[1:] / close[:-1] - 1))
+    turns = np.abs(np.diff(held, prepend=0.0))
+    bar = held * ret - turns * fee_rate
+    equity = np.cumprod(1 + bar)
+    benchmark = close / close[0]
+
+    peak = np.maximum.accumulate(equity)
+    max_drawdown = float((equity / peak - 1).min())
+
+    # 每筆交易 = 一段連續持倉，加上出場那根的手續費
+    entries = (held == 1) & (turns > 0)
+    trade_id = np.cumsum(entries)
+    in_trade = (held == 1) | ((turns > 0) & (held == 0))
+    trades = int(entries.sum())
+    win_rate = None
+    if trades:
+        growth = np.bincount(trade_id[in_trade], weights=np.log1p(bar[in_trade]), minlength=trades + 1)[1:]
+        win_rate = float((growth > 0).mean())
+
+    return Result(
+        strategy=strategy,
+        timestamps=ts[start:],
+        equity=equity,
+        benchmark=benchmark,
+        total_return=float(equity[-1] - 1),
+        benchmark_return=float(benchmark[-1] - 1),
+        max_drawdown=max_drawdown,
+        win_rate=win_rate,
+        trades=trades,
+        exposure=float(held.mean()),
+    )
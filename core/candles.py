@@ -0,0 +1,238 @@
+"""
+Local store of closed 1h OHLCV candles, per symbol, in the shared SQLite file,
+plus a resampler for higher timeframes.
+
+A closed candle never changes, so the exchange only has to be asked for the
+hours added since the last sync (usually zero or one page). Months of history
+can then be read back locally in a few milliseconds. The candle that is still
+forming is never stored. ``fetch`` gets it from the same call that picks up
+the newest closed candles.
+
+4h / 1d / 1w bars are built locally from the 1h base. Buckets are aligned to
+UTC, and weeks start on Monday 00:00 like Binance's, so a weekly chart costs
+the same single exchange call as an hourly one. Resampled closed bars are
+cached until a new base candle is stored.
+
+``sync`` and ``fetch`` may page through ``fetch_ohlcv`` several times on a
+cold start, so callers run them through ``SCHEDULER.run("exchange", ...)`` as
+one job.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from pathlib import Path
+
+from core.state import DB_PATH, connect
+
+logger = logging.getLogger("quant_sniper.candles")
+
+BASE_TIMEFRAME = "1h"
+HOUR_MS = 3_600_000
+HISTORY_DAYS = int(os.getenv("CANDLE_HISTORY_DAYS", "180"))
+PAGE_LIMIT = 1000  # Binance fetch_ohlcv 單次上限
+
+TIMEFRAMES = {"1h": HOUR_MS, "4h": 4 * HOUR_MS, "1d": 24 * HOUR_MS, "1w": 7 * 24 * HOUR_MS}
+_WEEK_OFFSET = 4 * 24 * HOUR_MS  # 1970-01-01 是星期四，往後 4 天才是星期一
+
+
+def bucket_start(ts: int, timeframe: str) -> int:
+    """Open time of the *timeframe* bar containing *ts* (UTC; weeks start Monday)."""
+    step = TIMEFRAMES[timeframe]
+    offset = _WEEK_OFFSET if timeframe == "1w" else 0
+    return (ts - offset) // step * step + offset
+
+
+def _merge(bar: list[float], candle: list[float]) -> None:
+    bar[2] = max(bar[2], candle[2])
+    bar[3] = min(bar[3], candle[3])
+    bar[4] = candle[4]
+    bar[5] += candle[5]
+
+
+def resample(candles: list[list[float]], timeframe: str) -> list[list[float]]:
+    """Aggregate consecutive 1h candles into *timeframe* bars.
+
+    Open comes from the first candle, close from the last, high/low are the
+    extremes and volume is summed. A leading bucket that the input only
+    partly covers is dropped, because its open would be wrong. The trailing
+    bucket is kept even when its period has not ended yet.
+    """
+    if timeframe == BASE_TIMEFRAME or not candles:
+        return [list(c) for c in candles]
+    bars: list[list[float]] = []
+    current = None
+    for c in candles:
+        start = bucket_start(int(c[0]), timeframe)
+        if start != current:
+            current = start
+            bars.append([start, c[1], c[2], c[3], c[4], c[5]])
+        else:
+            _merge(bars[-1], c)
+    if bars and int(candles[0][0]) != bars[0][0]:
+        bars.pop(0)
+    return bars
+
+
+def last_closed_hour(now_ms: int | None = None) -> int:
+    """Open time (ms) of the most recent fully closed 1h candle."""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    return now_ms // HOUR_MS * HOUR_MS - HOUR_MS
+
+
+class CandleStore:
+    def __init__(self, db_path: Path = DB_PATH) -> None:
+        self.conn = connect(db_path)
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._complete_from: dict[str, int] = {}  # 交易所沒有更早資料的幣種（上市較晚）
+        # (symbol, timeframe) -> (最後一根 1h 的時間, 涵蓋起點, 重採樣結果)
+        self._resampled: dict[tuple[str, str], tuple[int, int, list[list[float]]]] = {}
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS candles (
+                    symbol TEXT NOT NULL,
+                    ts     INTEGER NOT NULL,
+                    open   REAL NOT NULL,
+                    high   REAL NOT NULL,
+                    low    REAL NOT NULL,
+                    close  REAL NOT NULL,
+                    volume REAL NOT NULL,
+                    PRIMARY KEY (symbol, ts)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def span(self, symbol: str) -> tuple[int | None, int | None]:
+        """``(first_ts, last_ts)`` stored for *symbol*, in ms."""
+        row = self.conn.execute(
+            "SELECT MIN(ts), MAX(ts) FROM candles WHERE symbol = ?", (symbol,)
+        ).fetchone()
+        return row[0], row[1]
+
+    def load(self, symbol: str, limit: int | None = None, since: int | None = None) -> list[list[float]]:
+        """Stored candles ``[ts, o, h, l, c, v]``, oldest first; *limit* keeps the newest ones."""
+        rows = self.conn.execute(
+            "SELECT ts, open, high, low, close, volume FROM candles "
+            "WHERE symbol = ? AND ts >= ? ORDER BY ts DESC LIMIT ?",
+            (symbol, since or 0, -1 if limit is None else limit),
+        ).fetchall()
+        return [list(r) for r in reversed(rows)]
+
+    def save(self, symbol: str, candles: list[list[float]]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO candles (symbol, ts, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(symbol, ts) DO NOTHING
+                """,
+                [(symbol, int(c[0]), *c[1:6]) for c in candles],
+            )
+
+    def is_fresh(self, symbol: str, days: int = HISTORY_DAYS) -> bool:
+        """True when every closed candle of the last *days* is stored, i.e. ``sync`` has nothing to fetch."""
+        since = last_closed_hour() - days * 24 * HOUR_MS
+        first, last = self.span(symbol)
+        if first is None or last < last_closed_hour():
+            return False
+        return first <= since or self._complete_from.get(symbol) == first
+
+    async def sync(self, exchange, symbol: str, days: int = HISTORY_DAYS) -> int:
+        """Fetch the closed candles of the last *days* that are not stored yet; returns how many were added."""
+        lock = self._locks.setdefault(symbol, asyncio.Lock())
+        async with lock:
+            added, _ = await self._sync_locked(exchange, symbol, days, live=False)
+        return added
+
+    async def fetch(self, exchange, symbol: str, timeframe: str = BASE_TIMEFRAME,
+                    limit: int = 72) -> list[list[float]]:
+        """The newest *limit* bars of *timeframe*, the last one still forming.
+
+        Once the history is stored this is one ``fetch_ohlcv`` call. That call
+        returns the closed hours since the last sync and the live candle.
+        """
+        days = self._days_for(timeframe, limit)
+        lock = self._locks.setdefault(symbol, asyncio.Lock())
+        async with lock:
+            _, live = await self._sync_locked(exchange, symbol, days, live=True)
+        bars = self._stored_bars(symbol, timeframe, days)
+        for candle in live:
+            if bars and bucket_start(int(candle[0]), timeframe) == bars[-1][0]:
+                bars[-1] = list(bars[-1])
+                _merge(bars[-1], candle)
+            else:
+                bars.append([bucket_start(int(candle[0]), timeframe), *candle[1:6]])
+        return bars[-limit:]
+
+    def stored(self, symbol: str, timeframe: str = BASE_TIMEFRAME, limit: int = 72) -> list[list[float]]:
+        """The newest *limit* bars built from stored closed candles only, without calling the exchange."""
+        return self._stored_bars(symbol, timeframe, self._days_for(timeframe, limit))[-limit:]
+
+    @staticmethod
+    def _days_for(timeframe: str, limit: int) -> int:
+        # 多抓一根：最前面那根可能只涵蓋一半而被丟掉
+        return -(-(limit + 1) * TIMEFRAMES[timeframe] // (24 * HOUR_MS)) + 1
+
+    def _stored_bars(self, symbol: str, timeframe: str, days: int) -> list[list[float]]:
+        since = bucket_start(last_closed_hour() - days * 24 * HOUR_MS, timeframe) + TIMEFRAMES[timeframe]
+        return self.resampled(symbol, timeframe, since)
+
+    def resampled(self, symbol: str, timeframe: str, since: int) -> list[list[float]]:
+        """Stored candles from *since* resampled to *timeframe*, cached until a new candle is stored."""
+        if timeframe == BASE_TIMEFRAME:
+            return self.load(symbol, since=since)
+        _, last = self.span(symbol)
+        key = (symbol, timeframe)
+        cached = self._resampled.get(key)
+        if cached and cached[0] == last and cached[1] <= since:
+            return [b for b in cached[2] if b[0] >= since]
+        bars = resample(self.load(symbol, since=since), timeframe)
+        self._resampled[key] = (last, since, bars)
+        return list(bars)
+
+    async def _sync_locked(self, exchange, symbol: str, days: int,
+                           live: bool) -> tuple[int, list[list[float]]]:
+        """Store missing closed candles; with *live*, always ask for the tail and also return the forming candle."""
+        end = last_closed_hour()
+        want = end - days * 24 * HOUR_MS
+        first, last = self.span(symbol)
+        added = 0
+        if first is not None and first > want and self._complete_from.get(symbol) != first:
+            added += (await self._fetch_range(exchange, symbol, want, first - HOUR_MS))[0]  # 往前補歷史
+        tail = want if last is None else last + HOUR_MS
+        forming: list[list[float]] = []
+        if tail <= end or live:
+            # 已經是最新時仍要這一次呼叫：回傳的最後一根就是還在形成的 K 線
+            stored, forming = await self._fetch_range(exchange, symbol, tail, end, keep_forming=live)
+            added += stored
+        first, _ = self.span(symbol)
+        if first is not None and first > want:
+            self._complete_from[symbol] = first
+        return added, forming
+
+    async def _fetch_range(self, exchange, symbol: str, start: int, stop: int,
+                           keep_forming: bool = False) -> tuple[int, list[list[float]]]:
+        """Page the closed candles in [start, stop] into the store.
+
+        Returns ``(stored, forming)``, where ``forming`` holds the candle after
+        *stop* if *keep_forming* is set and the exchange returned it.
+        """
+        since = start
+        added = 0
+        forming: list[list[float]] = []
+        while True:
+            batch = await exchange.fetch_ohlcv(symbol, timeframe=BASE_TIMEFRAME, since=since, limit=PAGE_LIMIT)
+            closed = [c for c in batch if since <= c[0] <= stop]
+            if closed:
+                self.save(symbol, closed)
+                added += len(closed)
+            if keep_forming:
+                forming = [c for c in batch if c[0] > stop][-1:]
+            if not batch or batch[-1][0] >= stop or len(batch) < PAGE_LIMIT:
+                break
+            since = batch[-1][0] + HOUR_MS
+        if added:
+            logger.debug("Stored %d %s candles for %s", added, BASE_TIMEFRAME, symbol)
+        return added, forming
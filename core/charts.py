@@ -0,0 +1,289 @@
+"""
+Chart rendering on matplotlib's object-oriented API (``Figure`` + Agg canvas).
+
+``pyplot`` keeps every open figure in global state, so it can't be used from
+several render threads at once. It also made each chart restyle its axes,
+spines, grid and legend from scratch. Here every layout is a
+``_Template``: a figure that is styled once and whose artists (candle
+bodies and wicks, volume bars, lines, fills) already exist. A render only
+swaps in the new data and limits and draws the canvas once. The margins
+are fixed, so no ``bbox_inches="tight"`` pre-draw is needed.
+
+Templates are pooled per layout. A render thread takes one out, draws, and
+puts it back, so two threads never touch the same figure. The pool grows
+to the ``render`` lane's concurrency (core/scheduler.py) and no further.
+
+Layouts:
+
+* ``render_candles`` — candlesticks + SMA, volume, and RSI panes (``/chart``);
+* ``render_line`` — a value line with an optional dashed reference line
+  (``/backtest``, ``/equity``).
+"""
+
+import io
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+BG = "#1a1a2e"
+PANE = "#16213e"
+EDGE = "#333"
+UP = "#00E676"
+DOWN = "#FF1744"
+SMA = "#FFD600"
+RSI = "#BB86FC"
+DPI = 120
+PNG_COMPRESS_LEVEL = 1   # zlib 預設 6 的編碼時間是繪圖的一倍，檔案只小 20%
+
+_mpl: SimpleNamespace | None = None
+_pools: dict[str, list] = {}
+_pool_lock = threading.Lock()
+
+
+def _load():
+    """Import matplotlib on first use (~0.5s, not worth paying at startup); no pyplot."""
+    global _mpl
+    if _mpl is None:
+        import numpy as np
+        import matplotlib.dates as mdates
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection, PolyCollection
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Patch
+        from matplotlib.ticker import MaxNLocator
+        _mpl = SimpleNamespace(
+            np=np, mdates=mdates, FigureCanvasAgg=FigureCanvasAgg, LineCollection=LineCollection,
+            PolyCollection=PolyCollection, Figure=Figure, Patch=Patch, MaxNLocator=MaxNLocator,
+            epoch=mdates.date2num(datetime(1970, 1, 1, tzinfo=timezone.utc)),
+        )
+    return _mpl
+
+
+def date_format(timestamps: list[datetime]) -> str:
+    span = (timestamps[-1] - timestamps[0]).total_seconds() if len(timestamps) > 1 else 0
+    if span > 366 * 86400:
+        return "%Y-%m"
+    if span > 4 * 86400:
+        return "%m/%d"
+    return "%m/%d %H:%M"
+
+
+def _style(ax) -> None:
+    ax.set_facecolor(PANE)
+    ax.tick_params(colors="white", labelsize=8)
+    ax.grid(color=EDGE, alpha=0.5)
+    for spine in ax.spines.values():
+        spine.set_color(EDGE)
+
+
+def _padded(lo: float, hi: float) -> tuple[float, float]:
+    """Y range with 5% padding (1% of the value for a flat series)."""
+    margin = (hi - lo) * 0.05 or abs(hi) * 0.01 or 1.0
+    return lo - margin, hi + margin
+
+
+class _Template:
+    """A pre-styled figure whose artists are updated in place for each render."""
+
+    def __init__(self, figsize: tuple[float, float]) -> None:
+        mpl = _load()
+        self.fig = mpl.Figure(figsize=figsize, dpi=DPI, facecolor=BG)
+        self.canvas = mpl.FigureCanvasAgg(self.fig)
+        self._legend_labels: tuple[str, ...] | None = None
+
+    @staticmethod
+    def _date_axis(ax) -> None:
+        ax.xaxis.set_major_locator(_mpl.mdates.AutoDateLocator(maxticks=10))
+        ax.xaxis.set_major_formatter(_mpl.mdates.DateFormatter("%m/%d"))
+
+    @staticmethod
+    def _set_dates(axes, timestamps: list[datetime]) -> None:
+        formatter = _mpl.mdates.DateFormatter(date_format(timestamps))
+        for ax in axes:
+            ax.xaxis.set_major_formatter(formatter)
+        # x 軸的刻度標籤只畫在最下面那格
+        axes[-1].tick_params(axis="x", labelrotation=30)
+        for label in axes[-1].get_xticklabels():
+            label.set_horizontalalignment("right")
+
+    def _legend(self, ax, handles: list, labels: tuple[str, ...]) -> None:
+        # 標籤沒變就沿用原本的圖例
+        if labels == self._legend_labels:
+            return
+        shown = [(h, l) for h, l in zip(handles, labels) if l]
+        ax.legend([h for h, _ in shown], [l for _, l in shown], loc="upper left", fontsize=8,
+                  facecolor=PANE, edgecolor=EDGE, labelcolor="white")
+        self._legend_labels = labels
+
+    def png(self) -> io.BytesIO:
+        buf = io.BytesIO()
+        self.canvas.print_png(buf, pil_kwargs={"compress_level": PNG_COMPRESS_LEVEL})
+        buf.seek(0)
+        return buf
+
+
+class _CandleTemplate(_Template):
+    def __init__(self) -> None:
+        super().__init__((12, 8))
+        mpl = _mpl
+        self.ax_price, self.ax_volume, self.ax_rsi = self.fig.subplots(
+            3, 1, sharex=True, height_ratios=[3, 1, 1], gridspec_kw={"hspace": 0.06},
+        )
+        self.fig.subplots_adjust(left=0.07, right=0.98, top=0.93, bottom=0.1)
+        for ax in (self.ax_price, self.ax_volume, self.ax_rsi):
+            _style(ax)
+        self._date_axis(self.ax_rsi)
+
+        self.wicks = mpl.LineCollection([], linewidths=0.8)
+        self.bodies = mpl.PolyCollection([], linewidths=0)
+        self.ax_price.add_collection(self.wicks)
+        self.ax_price.add_collection(self.bodies)
+        (self.sma,) = self.ax_price.plot([], [], color=SMA, linewidth=1, linestyle="--")
+        self.title = self.ax_price.set_title("", color="white", fontsize=14, fontweight="bold", pad=12)
+
+        self.volume = mpl.PolyCollection([], linewidths=0, alpha=0.6)
+        self.ax_volume.add_collection(self.volume)
+        self.ax_volume.set_ylabel("Vol", color="white", fontsize=9)
+        self.ax_volume.yaxis.set_major_locator(mpl.MaxNLocator(3))
+        self.ax_volume.ticklabel_format(axis="y", style="sci", scilimits=(-3, 4))
+
+        (self.rsi,) = self.ax_rsi.plot([], [], color=RSI, linewidth=1.2)
+        self.rsi_high = mpl.PolyCollection([], facecolors=DOWN, alpha=0.2, linewidths=0)
+        self.rsi_low = mpl.PolyCollection([], facecolors=UP, alpha=0.2, linewidths=0)
+        self.ax_rsi.add_collection(self.rsi_high)
+        self.ax_rsi.add_collection(self.rsi_low)
+        self.ax_rsi.axhline(y=70, color=DOWN, linewidth=0.8, linestyle="--", alpha=0.7)
+        self.ax_rsi.axhline(y=30, color=UP, linewidth=0.8, linestyle="--", alpha=0.7)
+        self.ax_rsi.set_ylabel("RSI", color="white", fontsize=9)
+        self.ax_rsi.set_ylim(0, 100)
+
+        # 圖例用固定的代理 artist：陰線 / 陽線顏色不會影響圖例
+        self._handles = [mpl.Patch(facecolor=UP), self.sma]
+
+    def render(self, title: str, ohlcv: list[list[float]], sma: list[float | None],
+               rsi: list[float | None], sma_label: str) -> io.BytesIO:
+        np = _mpl.np
+        ts_ms, o, h, l, c, v = np.asarray(ohlcv, dtype=float).T[:6]
+        x = ts_ms / 86_400_000 + _mpl.epoch
+        step = float(np.median(np.diff(x))) if len(x) > 1 else 1 / 24
+        half = step * 0.35
+        left, right = x - half, x + half
+        colors = np.where(c >= o, UP, DOWN)
+
+        self.wicks.set_segments(np.stack([np.column_stack([x, l]), np.column_stack([x, h])], axis=1))
+        self.wicks.set_colors(colors)
+        top, bottom = np.maximum(o, c), np.minimum(o, c)
+        bottom = np.where(top - bottom == 0, bottom - (h.max() - l.min()) * 0.001, bottom)  # 十字線也看得到
+        self.bodies.set_verts(self._boxes(left, right, bottom, top))
+        self.bodies.set_facecolors(colors)
+        self.sma.set_data(x, np.array([np.nan if s is None else s for s in sma], dtype=float))
+
+        self.volume.set_verts(self._boxes(left, right, np.zeros_like(v), v))
+        self.volume.set_facecolors(colors)
+
+        r = np.array([np.nan if s is None else s for s in rsi], dtype=float)
+        self.rsi.set_data(x, r)
+        valid = ~np.isnan(r)
+        self.rsi_high.set_verts(self._band(x[valid], np.maximum(r[valid], 70), 70))
+        self.rsi_low.set_verts(self._band(x[valid], np.minimum(r[valid], 30), 30))
+
+        self.title.set_text(title)
+        self.ax_price.set_xlim(x[0] - step, x[-1] + step)
+        self.ax_price.set_ylim(*_padded(float(l.min()), float(h.max())))
+        self.ax_volume.set_ylim(0, float(v.max()) * 1.1 or 1.0)
+        self._legend(self.ax_price, self._handles, ("OHLC", sma_label))
+        span = [datetime.fromtimestamp(ts_ms[0] / 1000, tz=timezone.utc),
+                datetime.fromtimestamp(ts_ms[-1] / 1000, tz=timezone.utc)]
+        self._set_dates([self.ax_price, self.ax_volume, self.ax_rsi], span)
+        return self.png()
+
+    @staticmethod
+    def _boxes(left, right, bottom, top):
+        np = _mpl.np
+        return np.stack([np.column_stack([left, bottom]), np.column_stack([left, top]),
+                         np.column_stack([right, top]), np.column_stack([right, bottom])], axis=1)
+
+    @staticmethod
+    def _band(x, y, base: float) -> list:
+        """One polygon between *y* and the horizontal line *base* (zero height where they meet)."""
+        np = _mpl.np
+        if len(x) < 2:
+            return []
+        return [np.concatenate([np.column_stack([x, y]), np.column_stack([x[::-1], np.full(len(x), base)])])]
+
+
+class _LineTemplate(_Template):
+    def __init__(self) -> None:
+        super().__init__((12, 5))
+        self.ax = self.fig.subplots()
+        self.fig.subplots_adjust(left=0.08, right=0.98, top=0.9, bottom=0.16)
+        _style(self.ax)
+        self._date_axis(self.ax)
+        (self.line,) = self.ax.plot([], [], color=UP, linewidth=1.5)
+        (self.reference,) = self.ax.plot([], [], color=SMA, linewidth=1, linestyle="--")
+        self.fill = _mpl.PolyCollection([], facecolors=UP, alpha=0.1, linewidths=0)
+        self.ax.add_collection(self.fill)
+        self.title = self.ax.set_title("", color="white", fontsize=14, fontweight="bold", pad=12)
+
+    def render(self, title: str, timestamps: list[datetime], values: list[float],
+               reference: list[float | None] | None, label: str, reference_label: str) -> io.BytesIO:
+        np = _mpl.np
+        x = _mpl.mdates.date2num(timestamps)
+        y = np.asarray(values, dtype=float)
+        ref = np.array([np.nan if r is None else r for r in (reference or [None] * len(y))], dtype=float)
+        self.line.set_data(x, y)
+        self.reference.set_data(x, ref)
+        floor = float(y.min())
+        self.fill.set_verts([np.concatenate([np.column_stack([x, y]), [[x[-1], floor], [x[0], floor]]])])
+
+        self.title.set_text(title)
+        self.ax.set_xlim(x[0], x[-1] if x[-1] > x[0] else x[0] + 1 / 24)
+        # 縱軸依資料範圍（不含參考線）自動縮放
+        self.ax.set_ylim(*_padded(floor, float(y.max())))
+        has_ref = bool(np.isfinite(ref).any())
+        self._legend(self.ax, [self.line, self.reference], (label, reference_label if has_ref else ""))
+        self._set_dates([self.ax], timestamps)
+        return self.png()
+
+
+_LAYOUTS = {"candles": _CandleTemplate, "line": _LineTemplate}
+
+
+def _checkout(layout: str) -> _Template:
+    with _pool_lock:
+        pool = _pools.setdefault(layout, [])
+        if pool:
+            return pool.pop()
+    return _LAYOUTS[layout]()
+
+
+def _checkin(layout: str, template: _Template) -> None:
+    with _pool_lock:
+        _pools[layout].append(template)
+
+
+def warm_up() -> None:
+    """Import matplotlib and pre-build one template of each layout (call from a worker thread)."""
+    for layout in _LAYOUTS:
+        _checkin(layout, _checkout(layout))
+
+
+def render_candles(symbol: str, ohlcv: list[list[float]], sma: list[float | None],
+                   rsi: list[float | None], title: str | None = None,
+                   sma_label: str = "SMA 20") -> io.BytesIO:
+    """Candlestick + SMA, volume and RSI panes as a PNG buffer. Safe to call from several threads."""
+    template = _checkout("candles")
+    try:
+        return template.render(title or f"📊 {symbol}  |  ${ohlcv[-1][4]:,.4f}", ohlcv, sma, rsi, sma_label)
+    finally:
+        _checkin("candles", template)
+
+
+def render_line(timestamps: list[datetime], values: list[float], reference: list[float | None] | None = None,
+                title: str = "", label: str = "收盤價", reference_label: str = "SMA 20") -> io.BytesIO:
+    """A value line (+ dashed *reference*) as a PNG buffer. Safe to call from several threads."""
+    template = _checkout("line")
+    try:
+        return template.render(title, timestamps, values, reference, label, reference_label)
+    finally:
+        _checkin("line", template)
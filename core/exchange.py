@@ -0,0 +1,194 @@
+"""
+Exchange client factory — every cog gets its ccxt client from here so that
+calls are timed and errors counted in one place. The shared client is a
+``VenueRouter`` (core/venues.py) over every venue in ``EXCHANGE_VENUES``.
+
+Each client also carries a circuit breaker. After
+``EXCHANGE_BREAKER_FAILURES`` network errors or timeouts in a row it opens,
+and for ``EXCHANGE_BREAKER_COOLDOWN`` seconds every call fails at once with
+``CircuitOpen`` instead of waiting out the ccxt timeout. After that, a single
+probe call is let through: success closes the breaker, failure opens it for
+another cooldown. Callers that can live with an older price fall back to
+``core.quotes``.
+"""
+
+import os
+import time
+import logging
+
+import ccxt.async_support as ccxt
+
+from core.metrics import EXCHANGE_BREAKER_STATE, EXCHANGE_ERRORS, EXCHANGE_LATENCY
+from core.ratelimit import EXCHANGE_WEIGHTS, LIMITER
+from core.venues import VENUES, Venue, VenueRouter, load_symbol_map
+
+logger = logging.getLogger("quant_sniper.exchange")
+
+# 需要計時的 ccxt 方法（其餘屬性直接轉交）
+INSTRUMENTED_METHODS = {
+    "fetch_ticker", "fetch_tickers", "fetch_ohlcv", "load_markets", "fetch_order_book",
+}
+
+BREAKER_FAILURES = int(os.getenv("EXCHANGE_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("EXCHANGE_BREAKER_COOLDOWN", "15"))
+
+
+class CircuitOpen(ccxt.ExchangeNotAvailable):
+    """Raised instead of calling an exchange whose breaker is open; ``message`` is safe to show to users."""
+
+    def __init__(self, name: str, retry_after: float) -> None:
+        self.retry_after = retry_after
+        self.message = f"🔌 交易所連線異常，暫停查價中，請 {max(1, round(retry_after))} 秒後再試。"
+        super().__init__(f"{name} circuit open, retry in {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN) -> None:
+        self.name = name
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        EXCHANGE_BREAKER_STATE.set(self.state, exchange=name)
+
+    def _set(self, state: int) -> None:
+        if state != self.state:
+            logger.warning("Exchange %s circuit %s", self.name, ("closed", "half-open", "open")[state])
+            self.state = state
+            EXCHANGE_BREAKER_STATE.set(state, exchange=self.name)
+
+    def allows(self) -> bool:
+        """Whether a call would be let through now (without claiming the half-open probe)."""
+        if self.state == self.OPEN:
+            return time.monotonic() >= self.opened_at + self.cooldown
+        return self.state == self.CLOSED or not self._probing
+
+    def before_call(self) -> None:
+        """Raise ``CircuitOpen`` unless a call may go out now."""
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.cooldown - now
+            if remaining > 0:
+                raise CircuitOpen(self.name, remaining)
+            self._set(self.HALF_OPEN)
+        if self._probing:
+            raise CircuitOpen(self.name, 1.0)  # 只放一個探測請求，其他的等它的結果
+        self._probing = True
+
+    def record(self, ok: bool | None) -> None:
+        """Outcome of a call: True / False, or None if it was cancelled before finishing."""
+        self._probing = False
+        if ok is None:
+            return
+        if ok:
+            self.failures = 0
+            self._set(self.CLOSED)
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._set(self.OPEN)
+
+
+def _weight(method: str, args: tuple, kwargs: dict) -> float:
+    """Binance request weight of one call; ``fetch_tickers`` depends on how many symbols."""
+    if method == "fetch_tickers":
+        symbols = args[0] if args else kwargs.get("symbols")
+        if symbols:
+            return 2 if len(symbols) <= 20 else 40 if len(symbols) <= 100 else 80
+    return EXCHANGE_WEIGHTS.get(method, 1)
+
+
+class InstrumentedExchange:
+    """Transparent proxy around a ccxt async exchange that records latency / errors
+    and reports request weight and 429s to the shared rate limiter.
+
+    Only the primary venue draws from the ``exchange`` upstream quota
+    (*upstream*); backup venues pass None and rely on ccxt's own throttling.
+    """
+
+    def __init__(self, exchange, upstream: str | None = "exchange") -> None:
+        self._exchange = exchange
+        self._upstream = upstream
+        self.breaker = CircuitBreaker(getattr(exchange, "id", "exchange"))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._exchange, name)
+        if name not in INSTRUMENTED_METHODS:
+            return attr
+
+        async def timed(*args, **kwargs):
+            self.breaker.before_call()
+            if self._upstream:
+                LIMITER.charge(self._upstream, _weight(name, args, kwargs))
+            start = time.perf_counter()
+            ok = None
+            try:
+                result = await attr(*args, **kwargs)
+                ok = True
+            except Exception as exc:
+                # 交易所有回應的錯誤（例如 BadSymbol）代表連線正常，不算故障
+                ok = not isinstance(exc, (ccxt.NetworkError, TimeoutError))
+                EXCHANGE_ERRORS.inc(method=name, error=type(exc).__name__)
+                if self._upstream and isinstance(exc, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)):
+                    LIMITER.throttled(self._upstream)
+                raise
+            finally:
+                self.breaker.record(ok)
+                EXCHANGE_LATENCY.observe(time.perf_counter() - start, method=name)
+            if self._upstream:
+                LIMITER.succeeded(self._upstream)
+            return result
+
+        return timed
+
+
+def create_exchange(exchange_id: str = "binance", upstream: str | None = "exchange") -> InstrumentedExchange:
+    """Build one rate-limited async ccxt client."""
+    exchange_cls = getattr(ccxt, exchange_id)
+    return InstrumentedExchange(exchange_cls({"enableRateLimit": True}), upstream)
+
+
+def create_router(venue_ids: list[str] = VENUES) -> VenueRouter:
+    """The client used by the cogs: every configured venue behind one ``VenueRouter``."""
+    symbol_map = load_symbol_map()
+    return VenueRouter([
+        Venue(vid, create_exchange(vid, "exchange" if i == 0 else None), symbol_map.get(vid))
+        for i, vid in enumerate(venue_ids)
+    ])
+
+
+# ── Process-wide shared client ───────────────────────────────────────
+# 所有 cog 共用一個 client：只建構一次、共用連線池與 rate limiter
+_shared: VenueRouter | None = None
+_users = 0
+
+
+def acquire_exchange() -> VenueRouter:
+    """Return the shared client, creating it on first use; pair with ``release_exchange``."""
+    global _shared, _users
+    if _shared is None:
+        _shared = create_router()
+    _users += 1
+    return _shared
+
+
+async def release_exchange(exchange) -> None:
+    """Drop one reference; the shared client is closed when the last cog lets go.
+
+    Anything that is not the shared client (e.g. a test stand-in) is closed directly.
+    """
+    global _shared, _users
+    if exchange is not _shared:
+        await exchange.close()
+        return
+    _users -= 1
+    if _users <= 0:
+        _shared, _users = None, 0
+        await exchange.close()
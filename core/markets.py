@@ -0,0 +1,224 @@
+"""
+Local index of exchange market metadata (symbols, precision, limits).
+
+Commands used to turn ``bnb`` into ``BNB/USDT`` and find out the pair does not
+exist only after a ``fetch_ticker`` round trip ended in ``ccxt.BadSymbol``.
+The index is built from one ``load_markets`` call, refreshed periodically by
+the Market cog and written to disk so a restart can validate symbols before
+the first refresh finishes. Lookups are plain dict hits; only a miss pays for
+``difflib`` suggestions.
+
+Until the index has been loaded at least once (fresh install, exchange down)
+``normalize`` falls back to the old "append /USDT" behaviour and lets the
+exchange decide.
+"""
+
+import os
+import json
+import math
+import time
+import difflib
+import logging
+from decimal import Decimal
+from pathlib import Path
+from typing import NamedTuple
+
+logger = logging.getLogger("quant_sniper.markets")
+
+CACHE_PATH = Path(os.getenv(
+    "MARKETS_CACHE_PATH",
+    Path(__file__).resolve().parent.parent / "data" / "markets.json",
+))
+REFRESH_HOURS = float(os.getenv("MARKETS_REFRESH_HOURS", "6"))
+QUOTE = "USDT"
+
+# ccxt precisionMode 常數（避免為了兩個數字 import ccxt）
+DECIMAL_PLACES = 2
+TICK_SIZE = 4
+
+# 使用者常見的寫法：BTCUSDT、btc-usdt、BTC_USDT
+_SEPARATORS = str.maketrans({"-": "/", "_": "/", " ": ""})
+
+
+class Market(NamedTuple):
+    symbol: str
+    base: str
+    quote: str
+    active: bool
+    amount_step: float | None   # 最小數量單位（例：0.001）
+    price_step: float | None    # 最小價格跳動
+    min_amount: float | None
+    min_cost: float | None      # 最小下單金額（quote 計價）
+
+
+class UnknownSymbol(ValueError):
+    """Raised by ``normalize``; ``message`` is the instant reply, with suggestions."""
+
+    def __init__(self, raw: str, suggestions: list[str], inactive: bool = False) -> None:
+        self.raw = raw
+        self.suggestions = suggestions
+        if inactive:
+            self.message = f"❌ `{raw}` 目前已暫停交易。"
+        elif suggestions:
+            hint = "、".join(f"`{s}`" for s in suggestions)
+            self.message = f"❌ 找不到交易對 `{raw}`。你是不是要找：{hint}？"
+        else:
+            self.message = f"❌ 找不到交易對 `{raw}`，請確認格式（例：BNB/USDT）。"
+        super().__init__(self.message)
+
+
+def _step(value, precision_mode: int) -> float | None:
+    if value is None:
+        return None
+    if precision_mode == DECIMAL_PLACES:
+        return 10.0 ** -int(value)
+    return float(value)
+
+
+def _floor_to_step(value: float, step: float | None) -> float:
+    if not step:
+        return value
+    # 1e-9 的容差吃掉 0.3 / 0.1 = 2.9999999999999996 這類浮點誤差
+    units = math.floor(value / step + 1e-9)
+    decimals = max(0, -Decimal(repr(step)).normalize().as_tuple().exponent)
+    return round(units * step, decimals)
+
+
+def _round_to_step(value: float, step: float | None) -> float:
+    if not step:
+        return value
+    decimals = max(0, -Decimal(repr(step)).normalize().as_tuple().exponent)
+    return round(round(value / step) * step, decimals)
+
+
+class MarketIndex:
+    def __init__(self, cache_path: Path = CACHE_PATH) -> None:
+        self.cache_path = cache_path
+        self.markets: dict[str, Market] = {}
+        self.loaded_at = 0.0
+        self._compact: dict[str, str] = {}   # "BTCUSDT" -> "BTC/USDT"
+        self._bases: list[str] = []          # difflib 候選（只含 USDT 交易對的 base）
+        self._suggestions: dict[str, list[str]] = {}  # difflib 一次約 1ms，常見錯字記起來
+        self.load_cache()
+
+    def __len__(self) -> int:
+        return len(self.markets)
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.markets)
+
+    # ── Building ─────────────────────────────────────────────────────
+    def _rebuild(self, markets: dict[str, Market], loaded_at: float) -> None:
+        # 先建好再一次換掉，查詢中途不會看到半套資料
+        compact = {s.replace("/", ""): s for s in markets}
+        bases = sorted({m.base for m in markets.values() if m.quote == QUOTE and m.active})
+        self.markets, self._compact, self._bases = markets, compact, bases
+        self._suggestions = {}
+        self.loaded_at = loaded_at
+
+    def load_cache(self) -> bool:
+        try:
+            raw = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            markets = {s: Market(s, *fields) for s, fields in raw["markets"].items()}
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            if not isinstance(exc, FileNotFoundError):
+                logger.warning("Ignoring unreadable markets cache %s: %s", self.cache_path, exc)
+            return False
+        self._rebuild(markets, raw.get("loaded_at", 0.0))
+        logger.info("Loaded %d markets from cache (%.1fh old)", len(markets),
+                    (time.time() - self.loaded_at) / 3600)
+        return True
+
+    def _save_cache(self) -> None:
+        payload = {
+            "loaded_at": self.loaded_at,
+            "markets": {s: list(m)[1:] for s, m in self.markets.items()},
+        }
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.cache_path)  # 原子替換，其他程序不會讀到寫一半的檔案
+
+    async def refresh(self, exchange) -> int:
+        """Reload from ``exchange.load_markets`` (spot pairs only) and persist; returns the count."""
+        raw = await exchange.load_markets(True)
+        mode = getattr(exchange, "precisionMode", TICK_SIZE)
+        markets = {}
+        for symbol, m in raw.items():
+            if not m.get("spot", True):
+                continue
+            precision = m.get("precision") or {}
+            limits = m.get("limits") or {}
+            markets[symbol] = Market(
+                symbol, m["base"], m["quote"], m.get("active") is not False,
+                _step(precision.get("amount"), mode), _step(precision.get("price"), mode),
+                (limits.get("amount") or {}).get("min"), (limits.get("cost") or {}).get("min"),
+            )
+        self._rebuild(markets, time.time())
+        try:
+            self._save_cache()
+        except OSError as exc:
+            logger.warning("Could not persist markets cache: %s", exc)
+        return len(markets)
+
+    # ── Lookup ───────────────────────────────────────────────────────
+    def normalize(self, raw: str) -> str:
+        """Canonical ``BASE/QUOTE`` for user input, or raise ``UnknownSymbol``."""
+        text = raw.strip().upper().translate(_SEPARATORS)
+        symbol = text if "/" in text else f"{text}/{QUOTE}"
+        if not self.markets:
+            return symbol
+
+        market = self.markets.get(symbol)
+        if market is None and "/" not in text:
+            market = self.markets.get(self._compact.get(text, ""))  # BTCUSDT
+        if market is None:
+            raise UnknownSymbol(raw, self.suggest(text))
+        if not market.active:
+            raise UnknownSymbol(market.symbol, [], inactive=True)
+        return market.symbol
+
+    def suggest(self, text: str, n: int = 3) -> list[str]:
+        cached = self._suggestions.get(text)
+        if cached is not None:
+            return cached
+        base, _, quote = text.partition("/")
+        if quote and quote != QUOTE:
+            pool = [s for s in self.markets if s.endswith(f"/{quote}")]
+            found = difflib.get_close_matches(text, pool, n=n, cutoff=0.6)
+        else:
+            found = [f"{b}/{QUOTE}" for b in difflib.get_close_matches(base, self._bases, n=n, cutoff=0.6)]
+        if len(self._suggestions) >= 1024:
+            self._suggestions.clear()
+        self._suggestions[text] = found
+        return found
+
+    def get(self, symbol: str) -> Market | None:
+        return self.markets.get(symbol)
+
+    # ── Precision ────────────────────────────────────────────────────
+    def amount_to_precision(self, symbol: str, amount: float) -> float:
+        """Round a quantity down to the market's lot size (never sells / buys more than asked)."""
+        market = self.markets.get(symbol)
+        return _floor_to_step(amount, market.amount_step) if market else amount
+
+    def price_to_precision(self, symbol: str, price: float) -> float:
+        market = self.markets.get(symbol)
+        return _round_to_step(price, market.price_step) if market else price
+
+    def check_order(self, symbol: str, quantity: float, price: float) -> str | None:
+        """Reason the order is below the market's minimums, or None if it is fine."""
+        market = self.markets.get(symbol)
+        if quantity <= 0:
+            return "❌ 數量小於這個交易對的最小單位。"
+        if market is None:
+            return None
+        if market.min_amount and quantity < market.min_amount:
+            return f"❌ 數量太小，`{symbol}` 最少要 `{market.min_amount:g}`。"
+        if market.min_cost and quantity * price < market.min_cost:
+            return f"❌ 金額太小，`{symbol}` 最少要 `{market.min_cost:g}` {market.quote}。"
+        return None
+
+
+MARKETS = MarketIndex()
@@ -0,0 +1,217 @@
+"""
+In-process metrics — counters, gauges and latency histograms with Prometheus
+text exposition. 沒有外部相依；由 cogs/metrics.py 透過 HTTP 對外提供。
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+# 秒；涵蓋 SQLite 的 sub-ms 到 LLM 的數十秒
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] | list[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count], sum
+        self._series: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(c), t[0]) for k, (c, t) in self._series.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"duplicate metric {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ── Metric definitions ───────────────────────────────────────────────
+COMMAND_LATENCY = Histogram(
+    "paper_degen_command_seconds", "Hybrid command latency.", ["command", "status"]
+)
+EXCHANGE_LATENCY = Histogram(
+    "paper_degen_exchange_seconds", "ccxt call latency per method.", ["method"]
+)
+EXCHANGE_ERRORS = Counter(
+    "paper_degen_exchange_errors_total", "ccxt call errors per method.", ["method", "error"]
+)
+EXCHANGE_BREAKER_STATE = Gauge(
+    "paper_degen_exchange_breaker_state", "Exchange circuit breaker: 0 closed, 1 half-open, 2 open.", ["exchange"]
+)
+VENUE_HEDGES = Counter(
+    "paper_degen_venue_hedges_total", "Ticker reads hedged to a backup venue after the lead was slow.", ["venue"]
+)
+VENUE_OUTLIERS = Counter(
+    "paper_degen_venue_outliers_total", "Venue quotes rejected by the cross-venue outlier check.", ["venue"]
+)
+STALE_QUOTES = Counter(
+    "paper_degen_stale_quotes_total", "Last known quotes served because a live fetch failed or was slow.", ["reason"]
+)
+LLM_LATENCY = Histogram(
+    "paper_degen_llm_seconds", "Gemini generate_content latency per attempt.", ["model", "status"]
+)
+LLM_RETRIES = Counter(
+    "paper_degen_llm_retries_total", "Gemini calls retried after a retryable error.", ["model"]
+)
+RPC_LATENCY = Histogram(
+    "paper_degen_rpc_seconds", "web3 JSON-RPC latency per method and endpoint.", ["method", "endpoint", "status"]
+)
+SQLITE_TX_LATENCY = Histogram(
+    "paper_degen_sqlite_tx_seconds", "SQLite transaction time.", ["op"]
+)
+ALERT_CYCLE_LATENCY = Histogram(
+    "paper_degen_alert_cycle_seconds", "check_alerts loop iteration time."
+)
+ALERTS_ACTIVE = Gauge(
+    "paper_degen_alerts_active", "Alerts waiting to trigger."
+)
+NOTIFY_QUEUE_DEPTH = Gauge(
+    "paper_degen_notify_queue_depth", "Outgoing notification messages waiting for a send slot."
+)
+NOTIFY_WAIT = Histogram(
+    "paper_degen_notify_wait_seconds", "Time from queueing a notification to sending it."
+)
+LOOP_LAG = Histogram(
+    "paper_degen_event_loop_lag_seconds", "How late the event loop woke a sleeping task.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+SCHED_QUEUE_DEPTH = Gauge(
+    "paper_degen_scheduler_queue_depth", "Requests waiting for a scheduler slot.", ["kind"]
+)
+SCHED_REJECTED = Counter(
+    "paper_degen_scheduler_rejected_total", "Requests shed because a scheduler queue was full.", ["kind"]
+)
+SCHED_WAIT = Histogram(
+    "paper_degen_scheduler_wait_seconds", "Time spent queued before a scheduler slot was granted.", ["kind"]
+)
+RATE_LIMITED = Counter(
+    "paper_degen_rate_limited_total", "Commands refused by the rate limiter.", ["command", "scope"]
+)
+UPSTREAM_SCALE = Gauge(
+    "paper_degen_upstream_scale", "AIMD multiplier applied to an upstream quota's refill rate.", ["upstream"]
+)
+VALUATION_CYCLE_LATENCY = Histogram(
+    "paper_degen_valuation_cycle_seconds", "mark_to_market loop iteration time (read, quote, value, write)."
+)
@@ -0,0 +1,151 @@
+"""
+Batched contract reads — aggregate many view calls into one RPC round trip.
+優先使用 Multicall3 (`aggregate3`)；若該鏈沒有部署 Multicall3，改用 JSON-RPC batch。
+"""
+
+import os
+import logging
+from typing import Any
+
+from eth_utils import get_abi_output_types
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+
+logger = logging.getLogger("quant_sniper.multicall")
+
+# Multicall3 在 BSC / opBNB（含 testnet）都部署在同一個地址
+MULTICALL3_ADDRESS = os.getenv(
+    "MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11"
+)
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+# 單次 eth_call 的 calldata / gas 有上限，太大的批次拆成多段
+DEFAULT_CHUNK_SIZE = 200
+
+
+class BatchReader:
+    """Run many read-only calls against one contract in as few RPC requests as possible."""
+
+    def __init__(
+        self,
+        w3: Web3,
+        multicall_address: str | None = MULTICALL3_ADDRESS,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        self.w3 = w3
+        self.chunk_size = chunk_size
+        self.multicall = None
+        if multicall_address:
+            self.multicall = w3.eth.contract(
+                address=Web3.to_checksum_address(multicall_address),
+                abi=MULTICALL3_ABI,
+            )
+        # None = 尚未探測；確認沒有部署（或呼叫 revert）後永久改走 JSON-RPC batch
+        self._multicall_ok: bool | None = None
+
+    def call_many(
+        self, contract, fn_name: str, args_list: list[tuple]
+    ) -> list[Any | None]:
+        """Call ``contract.fn_name(*args)`` for each args tuple.
+
+        Returns one entry per input, in order. Calls that revert come back as ``None``.
+        """
+        results: list[Any | None] = []
+        for start in range(0, len(args_list), self.chunk_size):
+            chunk = args_list[start : start + self.chunk_size]
+            results.extend(self._call_chunk(contract, fn_name, chunk))
+        return results
+
+    def _call_chunk(self, contract, fn_name: str, chunk: list[tuple]) -> list[Any | None]:
+        if self.multicall is not None and self._multicall_ok is not False:
+            try:
+                results = self._multicall(contract, fn_name, chunk)
+                self._multicall_ok = True
+                return results
+            except Exception as exc:
+                if self._multicall_ok is not None or not self._multicall_missing(exc):
+                    # 逾時、限流等暫時性錯誤：保持未探測狀態，下次再試 Multicall3
+                    raise
+                logger.warning("Multicall3 不可用，改用 JSON-RPC batch: %s", exc)
+                self._multicall_ok = False
+        return self._json_rpc_batch(contract, fn_name, chunk)
+
+    def _multicall_missing(self, exc: Exception) -> bool:
+        """True if the probe failed because Multicall3 is not deployed or its call reverted."""
+        if isinstance(exc, ContractLogicError):
+            return True
+        # get_code 本身失敗時例外會往上拋，同樣視為暫時性錯誤
+        return not self.w3.eth.get_code(self.multicall.address)
+
+    def _multicall(self, contract, fn_name: str, chunk: list[tuple]) -> list[Any | None]:
+        fn_abi = contract.get_function_by_name(fn_name).abi
+        output_types = get_abi_output_types(fn_abi)
+        calls = [
+            (contract.address, True, contract.encode_abi(fn_name, args=list(args)))
+            for args in chunk
+        ]
+        raw = self.multicall.functions.aggregate3(calls).call()
+
+        results: list[Any | None] = []
+        for success, data in raw:
+            if not success or not data:
+                results.append(None)
+                continue
+            decoded = self.w3.codec.decode(output_types, data)
+            results.append(decoded[0] if len(decoded) == 1 else tuple(decoded))
+        return results
+
+    def _json_rpc_batch(self, contract, fn_name: str, chunk: list[tuple]) -> list[Any | None]:
+        # 直接送原始 eth_call batch：web3 的 batch_requests() 只要有一筆 revert 就整批拋錯
+        fn_abi = contract.get_function_by_name(fn_name).abi
+        output_types = get_abi_output_types(fn_abi)
+        requests = [
+            (
+                "eth_call",
+                [{"to": contract.address, "data": contract.encode_abi(fn_name, args=list(args))}, "latest"],
+            )
+            for args in chunk
+        ]
+        responses = self.w3.provider.make_batch_request(requests)
+        if not isinstance(responses, list):
+            raise RuntimeError(f"JSON-RPC batch 失敗：{responses.get('error')}")
+
+        results: list[Any | None] = []
+        for resp in responses:
+            data = resp.get("result")
+            if "error" in resp or not data or data == "0x":
+                results.append(None)
+                continue
+            decoded = self.w3.codec.decode(output_types, bytes.fromhex(data[2:]))
+            results.append(decoded[0] if len(decoded) == 1 else tuple(decoded))
+        return results
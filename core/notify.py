@@ -0,0 +1,126 @@
+"""
+Rate-limit-aware outgoing message queue.
+
+Discord allows about 5 messages per 5 seconds per channel and 50 requests per
+second per bot. If a burst goes out in a tight loop, discord.py can only
+sleep through the 429s it gets back, so a later message waits behind every
+retry. ``SendQueue`` paces sends itself instead. Each channel has a FIFO and
+its own worker, which waits on a token bucket for that channel and on one
+shared bucket for the bot. Channels are drained concurrently, so a busy
+channel never holds up a quiet one.
+
+Messages are sent with ``get_partial_messageable``. That is a REST call, so
+no cache lookup or ``fetch_channel`` is needed, and it works for channels
+handled by another shard.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+import discord
+from discord.ext import commands
+
+from core.metrics import NOTIFY_QUEUE_DEPTH, NOTIFY_WAIT
+from core.ratelimit import TokenBucket
+
+logger = logging.getLogger("quant_sniper.notify")
+
+# 比 Discord 的上限保守一點，留給指令回覆
+CHANNEL_BURST = float(os.getenv("NOTIFY_CHANNEL_BURST", "5"))
+CHANNEL_PER_SEC = float(os.getenv("NOTIFY_CHANNEL_PER_SEC", "1"))
+GLOBAL_BURST = float(os.getenv("NOTIFY_GLOBAL_BURST", "25"))
+GLOBAL_PER_SEC = float(os.getenv("NOTIFY_GLOBAL_PER_SEC", "25"))
+
+
+class SendQueue:
+    def __init__(
+        self,
+        bot: commands.Bot,
+        channel_burst: float = CHANNEL_BURST,
+        channel_per_sec: float = CHANNEL_PER_SEC,
+        global_burst: float = GLOBAL_BURST,
+        global_per_sec: float = GLOBAL_PER_SEC,
+    ) -> None:
+        self.bot = bot
+        self.channel_burst = channel_burst
+        self.channel_per_sec = channel_per_sec
+        now = time.monotonic()
+        self._global = TokenBucket(global_burst, global_per_sec, now)
+        self._buckets: dict[int, TokenBucket] = {}
+        self._pending: dict[int, deque] = {}             # channel id -> (enqueued_at, kwargs)
+        self._workers: dict[int, asyncio.Task] = {}
+        self._depth = 0
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def enqueue(self, channel_id: int, **kwargs) -> None:
+        """Queue ``channel.send(**kwargs)``; returns immediately."""
+        self._pending.setdefault(channel_id, deque()).append((time.monotonic(), kwargs))
+        self._depth += 1
+        NOTIFY_QUEUE_DEPTH.set(self._depth)
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def join(self) -> None:
+        """Wait until every queued message has been sent (or dropped)."""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    async def close(self) -> None:
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+        self._pending.clear()
+        self._depth = 0
+        NOTIFY_QUEUE_DEPTH.set(0)
+
+    async def _take_token(self, channel_id: int) -> None:
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(
+                self.channel_burst, self.channel_per_sec, time.monotonic()
+            )
+        while True:
+            now = time.monotonic()
+            wait = max(bucket.wait_time(1, now), self._global.wait_time(1, now))
+            if wait <= 0:
+                bucket.tokens -= 1
+                self._global.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    async def _drain(self, channel_id: int) -> None:
+        queue = self._pending[channel_id]
+        channel = self.bot.get_partial_messageable(channel_id)
+        try:
+            while queue:
+                await self._take_token(channel_id)
+                enqueued_at, kwargs = queue.popleft()
+                self._depth -= 1
+                NOTIFY_QUEUE_DEPTH.set(self._depth)
+                try:
+                    await channel.send(**kwargs)
+                except (discord.Forbidden, discord.NotFound) as exc:
+                    # 頻道被刪或沒權限：後面的訊息也送不出去
+                    logger.warning("Dropping %d queued messages for channel %s: %s",
+                                   len(queue) + 1, channel_id, exc)
+                    self._depth -= len(queue)
+                    NOTIFY_QUEUE_DEPTH.set(self._depth)
+                    queue.clear()
+                except Exception as exc:
+                    logger.error("Failed to send to channel %s: %s", channel_id, exc)
+                NOTIFY_WAIT.observe(time.monotonic() - enqueued_at)
+        finally:
+            del self._workers[channel_id]
+            if not queue:
+                del self._pending[channel_id]
+            # 閒置後 bucket 會補滿，留著也沒用
+            bucket = self._buckets.get(channel_id)
+            if bucket is not None and bucket.wait_time(self.channel_burst, time.monotonic()) <= 0:
+                del self._buckets[channel_id]
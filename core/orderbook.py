@@ -0,0 +1,147 @@
+"""
+In-memory matching index for resting limit / stop orders.
+
+Each symbol keeps two lists sorted by trigger price with ``bisect``:
+
+* ``below`` — orders that fire once the price falls to or under the trigger
+  (limit buys, stop-losses);
+* ``above`` — orders that fire once the price rises to or over it
+  (limit sells, take-profits).
+
+A new price only touches the crossed end of each list, so a tick costs
+O(log n + crossed) no matter how many orders rest on the book. The database
+stays the source of truth: the engine hands back candidate ids and the
+ledger's fill transaction decides which of them still exist.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from math import inf
+
+
+def _merge_sorted(side: list, items: list) -> None:
+    """Merge *items* into the sorted list *side* in place with O(n) copying and O(k log n) compares."""
+    items.sort()
+    if not side or items[0] >= side[-1]:
+        side.extend(items)
+        return
+    merged: list = []
+    lo = 0
+    for item in items:
+        i = bisect_left(side, item, lo)
+        merged += side[lo:i]
+        merged.append(item)
+        lo = i
+    merged += side[lo:]
+    side[:] = merged
+
+
+class OrderBook:
+    """Resting trigger orders for one symbol, as ``(price, order_id)`` tuples."""
+
+    __slots__ = ("below", "above")
+
+    def __init__(self) -> None:
+        self.below: list[tuple[float, int]] = []
+        self.above: list[tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.below) + len(self.above)
+
+    def add(self, order_id: int, direction: str, price: float) -> None:
+        # 同價位依 id 排序 = 先掛先成交
+        insort(self.below if direction == "below" else self.above, (price, order_id))
+
+    def remove(self, order_id: int, direction: str, price: float) -> bool:
+        side = self.below if direction == "below" else self.above
+        i = bisect_left(side, (price, order_id))
+        if i < len(side) and side[i] == (price, order_id):
+            del side[i]
+            return True
+        return False
+
+    def pop_crossed(self, price: float) -> list[int]:
+        """Remove and return the ids of every order triggered at *price*."""
+        crossed = []
+        i = bisect_left(self.below, (price, -inf))       # 觸發價 >= 現價
+        if i < len(self.below):
+            crossed += [oid for _, oid in reversed(self.below[i:])]  # 離現價最近的先成交
+            del self.below[i:]
+        j = bisect_right(self.above, (price, inf))       # 觸發價 <= 現價
+        if j:
+            crossed += [oid for _, oid in reversed(self.above[:j])]
+            del self.above[:j]
+        return crossed
+
+
+class MatchingEngine:
+    def __init__(self) -> None:
+        self.books: dict[str, OrderBook] = {}
+        self._orders: dict[int, tuple[str, str, float]] = {}  # id -> (symbol, direction, price)
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._orders
+
+    def add(self, order_id: int, symbol: str, direction: str, price: float) -> None:
+        if order_id in self._orders:
+            return
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook()
+        book.add(order_id, direction, price)
+        self._orders[order_id] = (symbol, direction, price)
+
+    def add_many(self, orders: list[tuple[int, str, str, float]]) -> None:
+        """Bulk insert ``(id, symbol, direction, price)`` rows, e.g. when rebuilding from the database.
+
+        One merge per touched side instead of an O(n) ``insort`` per order.
+        """
+        if len(orders) < 64:
+            for order_id, symbol, direction, price in orders:
+                self.add(order_id, symbol, direction, price)
+            return
+        pending: dict[tuple[str, str], list[tuple[float, int]]] = {}
+        for order_id, symbol, direction, price in orders:
+            if order_id in self._orders:
+                continue
+            pending.setdefault((symbol, direction), []).append((price, order_id))
+            self._orders[order_id] = (symbol, direction, price)
+        for (symbol, direction), items in pending.items():
+            book = self.books.get(symbol)
+            if book is None:
+                book = self.books[symbol] = OrderBook()
+            _merge_sorted(book.below if direction == "below" else book.above, items)
+
+    def remove(self, order_id: int) -> bool:
+        entry = self._orders.pop(order_id, None)
+        if entry is None:
+            return False
+        symbol, direction, price = entry
+        book = self.books[symbol]
+        book.remove(order_id, direction, price)
+        if not book:
+            del self.books[symbol]
+        return True
+
+    def crossed(self, symbol: str, price: float) -> list[int]:
+        """Take the orders on *symbol* triggered at *price* off the book."""
+        return [row[0] for row in self.crossed_orders(symbol, price)]
+
+    def crossed_orders(self, symbol: str, price: float) -> list[tuple[int, str, str, float]]:
+        """Like ``crossed``, but returns ``(id, symbol, direction, price)`` rows so ``add_many`` can put them back."""
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+        rows = [(oid, *self._orders.pop(oid)) for oid in book.pop_crossed(price)]
+        if not book:
+            del self.books[symbol]
+        return rows
+
+    def symbols(self) -> list[str]:
+        return list(self.books)
+
+    def clear(self) -> None:
+        self.books.clear()
+        self._orders.clear()
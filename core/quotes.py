@@ -0,0 +1,110 @@
+"""
+Last-known quotes with stale-while-revalidate serving.
+
+Every price the bot sees is remembered with the time it arrived: single
+tickers fetched here, and the bulk ``fetch_tickers`` of the matching and
+valuation loops via ``update``. A caller asks ``quote`` for a symbol and says
+how old a price it is willing to accept (``max_age``):
+
+* a live fetch is always started, and concurrent callers for the same
+  symbol share it;
+* if it answers within ``wait`` seconds, the caller gets the live price;
+* otherwise, or if it fails (exchange down, circuit breaker open, lane
+  full), a remembered price no older than ``max_age`` is returned, marked
+  ``stale`` so the reply can show its age. The live fetch keeps running in
+  the background and refreshes the cache for the next caller.
+
+With no usable cached price, the caller waits for the live result or gets
+its error. ``max_age=0`` therefore means "live or fail".
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import NamedTuple
+
+from core.metrics import STALE_QUOTES
+from core.scheduler import SCHEDULER, Priority
+
+logger = logging.getLogger("quant_sniper.quotes")
+
+QUOTE_WAIT = float(os.getenv("QUOTE_WAIT_SECONDS", "2"))  # 有舊報價可用時，最多等即時報價這麼久
+
+
+class Quote(NamedTuple):
+    price: float
+    at: float             # unix 秒，收到報價的時間
+    stale: bool = False   # True：即時查價失敗或太慢，這是最後已知的報價
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.at)
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 90:
+        return f"{seconds:.0f} 秒"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} 分鐘"
+    return f"{seconds / 3600:.1f} 小時"
+
+
+class QuoteBook:
+    def __init__(self) -> None:
+        self._quotes: dict[str, Quote] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def get(self, symbol: str, max_age: float) -> Quote | None:
+        """The remembered quote for *symbol* if it is at most *max_age* seconds old."""
+        quote = self._quotes.get(symbol)
+        if quote is None or quote.age > max_age:
+            return None
+        return quote._replace(stale=True)
+
+    def record(self, symbol: str, price: float, at: float | None = None) -> None:
+        at = time.time() if at is None else at
+        current = self._quotes.get(symbol)
+        if current is None or current.at <= at:
+            self._quotes[symbol] = Quote(price, at)
+
+    def update(self, tickers: dict[str, dict], at: float | None = None) -> None:
+        """Remember the ``last`` price of every ticker in a ``fetch_tickers`` result."""
+        at = time.time() if at is None else at
+        for symbol, ticker in tickers.items():
+            if ticker.get("last"):
+                self.record(symbol, ticker["last"], at)
+
+    async def quote(self, exchange, symbol: str, max_age: float = 0.0, wait: float = QUOTE_WAIT,
+                    priority: Priority = Priority.HIGH) -> Quote:
+        """Live price of *symbol*, or one at most *max_age* seconds old if the exchange can't deliver."""
+        fallback = self.get(symbol, max_age) if max_age > 0 else None
+        task = self._inflight.get(symbol)
+        if task is None:
+            task = self._inflight[symbol] = asyncio.create_task(self._fetch(exchange, symbol, priority))
+            task.add_done_callback(lambda t: self._done(symbol, t))
+        if fallback is None:
+            return await asyncio.shield(task)
+
+        done, _ = await asyncio.wait({task}, timeout=wait)
+        if done and task.exception() is None:
+            return task.result()
+        reason = "slow" if not done else type(task.exception()).__name__
+        STALE_QUOTES.inc(reason=reason)
+        logger.info("Serving %s quote %.0fs old (%s)", symbol, fallback.age, reason)
+        return fallback
+
+    async def _fetch(self, exchange, symbol: str, priority: Priority) -> Quote:
+        ticker = await SCHEDULER.run("exchange", exchange.fetch_ticker, symbol, priority=priority)
+        quote = Quote(ticker["last"], time.time())
+        self.record(symbol, quote.price, quote.at)
+        return quote
+
+    def _done(self, symbol: str, task: asyncio.Task) -> None:
+        if self._inflight.get(symbol) is task:
+            del self._inflight[symbol]
+        if not task.cancelled():
+            task.exception()  # 沒有人等的背景查價失敗時，不要讓 asyncio 抱怨沒人取例外
+
+
+QUOTES = QuoteBook()
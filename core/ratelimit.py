@@ -0,0 +1,230 @@
+"""
+Adaptive per-user / per-guild rate limiting in front of the shared upstream
+quotas (Binance request weight, Gemini requests).
+
+Three kinds of token bucket take part in admitting a command:
+
+* a bucket per user and per guild, charged the command's cost in "units";
+* one bucket per upstream, charged by the clients themselves
+  (``core/exchange.py`` per ccxt call, the Market cog per Gemini attempt),
+  so background loops draw from the same budget as interactive commands.
+
+Admission is instant: if any bucket would go short the command is refused
+with the time until it would fit. When an upstream answers 429 its
+``scale`` is halved, which slows the refill of that upstream's bucket and of
+every user/guild bucket for commands that touch it; it creeps back up while
+calls succeed (AIMD).
+"""
+
+import os
+import time
+import threading
+from typing import NamedTuple
+
+from discord.ext import commands
+
+from core.metrics import RATE_LIMITED, UPSTREAM_SCALE
+
+# ── Budgets ──────────────────────────────────────────────────────────
+USER_BURST = float(os.getenv("RATE_USER_BURST", "12"))
+USER_PER_MIN = float(os.getenv("RATE_USER_PER_MIN", "12"))
+GUILD_BURST = float(os.getenv("RATE_GUILD_BURST", "60"))
+GUILD_PER_MIN = float(os.getenv("RATE_GUILD_PER_MIN", "90"))
+
+# 我們只用 Binance 6000 weight/min 的一部分，留給同 IP 的其他程序
+UPSTREAM_PER_MIN = {
+    "exchange": float(os.getenv("EXCHANGE_WEIGHT_PER_MIN", "1200")),
+    "llm": float(os.getenv("LLM_REQUESTS_PER_MIN", "15")),
+}
+
+# Binance REST request weight per ccxt method（fetch_tickers 不帶 symbols 時是全市場）
+EXCHANGE_WEIGHTS = {
+    "fetch_ticker": 2,
+    "fetch_tickers": 80,
+    "fetch_ohlcv": 2,
+    "fetch_order_book": 5,
+    "load_markets": 20,
+}
+
+
+class CommandCost(NamedTuple):
+    units: float                   # 從使用者 / 伺服器 bucket 扣的量
+    upstream: dict[str, float]     # 預期對上游額度的用量
+
+
+DEFAULT_COST = CommandCost(1, {})
+COMMAND_COSTS = {
+    "analyze": CommandCost(6, {"exchange": 2, "llm": 1}),
+    "chart": CommandCost(3, {"exchange": 2}),
+    "backtest": CommandCost(4, {"exchange": 2}),  # 本地 K 線齊全時不打交易所
+    "buy": CommandCost(1, {"exchange": 2}),
+    "sell": CommandCost(1, {"exchange": 2}),
+    "limitbuy": CommandCost(1, {"exchange": 2}),
+    "limitsell": CommandCost(1, {"exchange": 2}),
+    "stoploss": CommandCost(1, {"exchange": 2}),
+    "takeprofit": CommandCost(1, {"exchange": 2}),
+    "orders": CommandCost(1, {}),
+    "cancel": CommandCost(1, {}),
+    "history": CommandCost(1, {}),
+    "rank": CommandCost(1, {}),
+    "equity": CommandCost(3, {}),  # 只讀本地紀錄，但要畫圖
+    "portfolio": CommandCost(2, {"exchange": 2}),  # 價格來自估值快照，只有新幣種才查價
+    "alert": CommandCost(1, {"exchange": 2}),
+    "submit": CommandCost(3, {}),
+    "leaderboard": CommandCost(2, {}),
+    "standings": CommandCost(2, {}),
+    "help": CommandCost(0, {}),
+    "profile": CommandCost(0, {}),
+}
+
+
+class RateLimited(commands.CommandError):
+    """Raised from the before-invoke hook; ``message`` is the instant reply."""
+
+    def __init__(self, scope: str, retry_after: float) -> None:
+        self.scope = scope
+        self.retry_after = retry_after
+        seconds = max(1, round(retry_after))
+        if scope == "user":
+            self.message = f"⏳ 慢一點！請 {seconds} 秒後再試。"
+        elif scope == "guild":
+            self.message = f"⏳ 這個伺服器的請求太多了，請 {seconds} 秒後再試。"
+        else:
+            self.message = f"⏳ 交易所 / AI 額度暫時用完了，請 {seconds} 秒後再試。"
+        super().__init__(self.message)
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float) -> None:
+        self.capacity = capacity
+        self.rate = rate  # tokens / second at scale 1.0
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float, scale: float = 1.0) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate * scale)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, scale: float = 1.0) -> float:
+        """Seconds until *amount* fits (0 if it already does)."""
+        self.refill(now, scale)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.rate * scale)
+
+
+class UpstreamQuota:
+    """Shared budget for one upstream with an AIMD multiplier on its refill rate."""
+
+    MIN_SCALE = 0.1
+    DECREASE = 0.5
+    INCREASE = 0.05          # 每次成功呼叫回升的量
+    COOLDOWN = 10.0          # 連續 429 只算一次
+
+    def __init__(self, name: str, per_minute: float, now: float) -> None:
+        self.name = name
+        self.bucket = TokenBucket(per_minute, per_minute / 60, now)
+        self.scale = 1.0
+        self._last_decrease = 0.0
+        UPSTREAM_SCALE.set(self.scale, upstream=name)
+
+    def charge(self, amount: float, now: float) -> None:
+        # 可以扣成負數：背景工作用掉的額度會讓互動指令等久一點
+        self.bucket.refill(now, self.scale)
+        self.bucket.tokens -= amount
+
+    def throttled(self, now: float) -> None:
+        if now - self._last_decrease < self.COOLDOWN:
+            return
+        self._last_decrease = now
+        self.bucket.refill(now, self.scale)
+        self.scale = max(self.MIN_SCALE, self.scale * self.DECREASE)
+        UPSTREAM_SCALE.set(self.scale, upstream=self.name)
+
+    def succeeded(self, now: float) -> None:
+        if self.scale < 1.0:
+            self.bucket.refill(now, self.scale)
+            self.scale = min(1.0, self.scale + self.INCREASE)
+            UPSTREAM_SCALE.set(self.scale, upstream=self.name)
+
+
+class RateLimiter:
+    MAX_KEYS = 50_000  # 超過就清掉已經補滿（閒置）的 bucket
+
+    def __init__(self) -> None:
+        now = time.monotonic()
+        self.upstreams = {name: UpstreamQuota(name, pm, now) for name, pm in UPSTREAM_PER_MIN.items()}
+        self.users: dict[int, TokenBucket] = {}
+        self.guilds: dict[int, TokenBucket] = {}
+        # 用量可能從 worker 執行緒回報，統一上鎖
+        self._lock = threading.Lock()
+
+    def _bucket(self, table: dict, key: int, capacity: float, per_min: float, now: float) -> TokenBucket:
+        bucket = table.get(key)
+        if bucket is None:
+            if len(table) >= self.MAX_KEYS:
+                self._prune(table, now)
+            bucket = table[key] = TokenBucket(capacity, per_min / 60, now)
+        return bucket
+
+    @staticmethod
+    def _prune(table: dict, now: float) -> None:
+        for key in [k for k, b in table.items() if b.tokens + (now - b.updated) * b.rate >= b.capacity]:
+            del table[key]
+
+    # ── Admission ────────────────────────────────────────────────────
+    def admit(self, command: str, user_id: int, guild_id: int | None) -> None:
+        """Charge the user/guild buckets for *command* or raise ``RateLimited``."""
+        cost = COMMAND_COSTS.get(command, DEFAULT_COST)
+        if cost.units <= 0 and not cost.upstream:
+            return
+        now = time.monotonic()
+        with self._lock:
+            scale = min((self.upstreams[u].scale for u in cost.upstream if u in self.upstreams), default=1.0)
+            checks = [("user", self._bucket(self.users, user_id, USER_BURST, USER_PER_MIN, now))]
+            if guild_id is not None:
+                checks.append(("guild", self._bucket(self.guilds, guild_id, GUILD_BURST, GUILD_PER_MIN, now)))
+
+            for scope, bucket in checks:
+                wait = bucket.wait_time(cost.units, now, scale)
+                if wait > 0:
+                    RATE_LIMITED.inc(command=command, scope=scope)
+                    raise RateLimited(scope, wait)
+            for name, amount in cost.upstream.items():
+                quota = self.upstreams.get(name)
+                if quota is None:
+                    continue
+                wait = quota.bucket.wait_time(amount, now, quota.scale)
+                if wait > 0:
+                    RATE_LIMITED.inc(command=command, scope=name)
+                    raise RateLimited(name, wait)
+
+            for _, bucket in checks:
+                bucket.tokens -= cost.units
+
+    # ── Upstream accounting (called by the clients) ──────────────────
+    def charge(self, upstream: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self.upstreams[upstream].charge(amount, time.monotonic())
+
+    def throttled(self, upstream: str) -> None:
+        with self._lock:
+            self.upstreams[upstream].throttled(time.monotonic())
+
+    def succeeded(self, upstream: str) -> None:
+        with self._lock:
+            self.upstreams[upstream].succeeded(time.monotonic())
+
+
+LIMITER = RateLimiter()
+
+
+async def rate_limit_hook(ctx: commands.Context) -> None:
+    """``bot.before_invoke`` hook: runs only for commands actually being invoked."""
+    if ctx.command is None:
+        return
+    LIMITER.admit(
+        ctx.command.qualified_name, ctx.author.id, ctx.guild.id if ctx.guild else None
+    )
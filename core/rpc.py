@@ -0,0 +1,336 @@
+"""
+Shared RPC client — endpoint pool with health checks, latency-weighted routing,
+hedged reads and automatic failover.
+Bot (cogs/chain.py) 與各部署腳本共用；每個網路可設定多個 RPC endpoint。
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any
+
+from web3 import Web3
+from web3.middleware import ExtraDataToPOAMiddleware
+from web3.providers.base import BaseProvider, JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from core.metrics import RPC_LATENCY
+
+logger = logging.getLogger("quant_sniper.rpc")
+
+# ── Network presets ──────────────────────────────────────────────────
+# `env` 可填單一 URL 或以逗號分隔的多個 URL
+NETWORKS: dict[str, dict[str, Any]] = {
+    "opbnb": {
+        "name": "opBNB Testnet",
+        "chain_id": 5611,
+        "env": ("OPBNB_RPC_URLS", "OPBNB_RPC_URL"),
+        "defaults": ["https://opbnb-testnet-rpc.bnbchain.org"],
+    },
+    "bsc": {
+        "name": "BSC Testnet",
+        "chain_id": 97,
+        "env": ("BSC_RPC_URLS", "BSC_RPC_URL"),
+        "defaults": [
+            "https://data-seed-prebsc-1-s1.bnbchain.org:8545",
+            "https://data-seed-prebsc-2-s1.bnbchain.org:8545",
+        ],
+    },
+    "local": {
+        "name": "Local EVM",
+        "chain_id": 31337,
+        "env": ("LOCAL_RPC_URLS", "LOCAL_RPC_URL"),
+        "defaults": ["http://127.0.0.1:8545"],
+    },
+}
+
+# 會改變鏈上狀態的方法：不做 hedge，只做 failover
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+GAS_PRICE_TTL = float(os.getenv("RPC_GAS_PRICE_TTL", "15"))
+REQUEST_TIMEOUT = float(os.getenv("RPC_REQUEST_TIMEOUT", "10"))
+
+
+def endpoints_for(network: str) -> list[str]:
+    """Resolve the endpoint list for *network* from env, falling back to presets."""
+    preset = NETWORKS[network]
+    for key in preset["env"]:
+        value = os.getenv(key)
+        if value:
+            return [u.strip() for u in value.split(",") if u.strip()]
+    return list(preset["defaults"])
+
+
+# ── Per-endpoint health ──────────────────────────────────────────────
+class Endpoint:
+    """One upstream node plus its rolling latency / error statistics."""
+
+    WINDOW = 50          # 最近 N 次請求
+    FAILS_TO_EJECT = 3   # 連續失敗幾次後暫時剔除
+    COOLDOWN = 30.0      # 剔除秒數，之後允許探測
+
+    def __init__(self, name: str, provider: BaseProvider) -> None:
+        self.name = name
+        self.provider = provider
+        self.latencies: deque[float] = deque(maxlen=self.WINDOW)
+        self.outcomes: deque[bool] = deque(maxlen=self.WINDOW)
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.block_number: int | None = None
+        self._lock = threading.Lock()
+
+    # -- stats --
+    def record(self, ok: bool, latency: float) -> None:
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+                self.down_until = 0.0
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.FAILS_TO_EJECT:
+                    self.down_until = time.monotonic() + self.COOLDOWN
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def latency_quantile(self, q: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def score(self) -> float:
+        """Lower is better: median latency inflated by recent error rate."""
+        median = self.latency_quantile(0.5)
+        # 尚未有樣本的節點給一個中等分數，讓它有機會被選到
+        base = median if median is not None else 0.25
+        return base * (1 + 4 * self.error_rate)
+
+    def snapshot(self) -> dict:
+        return {
+            "endpoint": self.name,
+            "healthy": self.healthy,
+            "p50": self.latency_quantile(0.5),
+            "p90": self.latency_quantile(0.9),
+            "error_rate": self.error_rate,
+            "block_number": self.block_number,
+        }
+
+
+class AllEndpointsFailed(ConnectionError):
+    """Raised when every endpoint in the pool failed the request."""
+
+
+# ── Pooled provider ──────────────────────────────────────────────────
+class PooledProvider(JSONBaseProvider):
+    """A web3 provider that spreads requests over several endpoints.
+
+    Reads go to the fastest healthy endpoint; if it hasn't answered within the
+    hedge delay, the same read is sent to the next-best endpoint and the first
+    answer wins. Writes are sent to one endpoint at a time with failover.
+    ``endpoints`` may be URLs or ready-made providers (e.g. local stand-in nodes).
+    """
+
+    def __init__(
+        self,
+        endpoints: list[str | BaseProvider],
+        hedge_quantile: float = 0.9,
+        min_hedge_delay: float = 0.05,
+        max_lag_blocks: int = 20,
+        request_timeout: float = REQUEST_TIMEOUT,
+    ) -> None:
+        super().__init__()
+        if not endpoints:
+            raise ValueError("PooledProvider needs at least one endpoint")
+        self.endpoints: list[Endpoint] = []
+        for ep in endpoints:
+            if isinstance(ep, str):
+                provider = Web3.HTTPProvider(
+                    ep,
+                    request_kwargs={"timeout": request_timeout},
+                    exception_retry_configuration=None,
+                )
+                self.endpoints.append(Endpoint(ep, provider))
+            else:
+                self.endpoints.append(Endpoint(type(ep).__name__, ep))
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_lag_blocks = max_lag_blocks
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(4, 2 * len(self.endpoints)), thread_name_prefix="rpc"
+        )
+        # chain id 不會變；gas price 短暫快取即可
+        self._chain_id: RPCResponse | None = None
+        self._gas_price: tuple[float, RPCResponse] | None = None
+
+    def __str__(self) -> str:
+        return f"PooledProvider({', '.join(e.name for e in self.endpoints)})"
+
+    # -- routing --
+    def ranked(self) -> list[Endpoint]:
+        """Healthy endpoints by score, then ejected ones (as a last resort)."""
+        healthy = sorted((e for e in self.endpoints if e.healthy), key=lambda e: e.score)
+        ejected = sorted((e for e in self.endpoints if not e.healthy), key=lambda e: e.down_until)
+        return healthy + ejected
+
+    def _hedge_delay(self, endpoint: Endpoint) -> float:
+        q = endpoint.latency_quantile(self.hedge_quantile)
+        return max(self.min_hedge_delay, q if q is not None else 0.5)
+
+    def _timed_request(self, endpoint: Endpoint, method: RPCEndpoint, params: Any) -> RPCResponse:
+        start = time.perf_counter()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception:
+            elapsed = time.perf_counter() - start
+            endpoint.record(False, elapsed)
+            RPC_LATENCY.observe(elapsed, method=method, endpoint=endpoint.name, status="error")
+            raise
+        # JSON-RPC error（例如 revert）是正常回應；只有節點本身的錯誤才算失敗
+        error = response.get("error") if isinstance(response, dict) else None
+        node_fault = isinstance(error, dict) and error.get("code") in (-32005, 429)
+        elapsed = time.perf_counter() - start
+        endpoint.record(not node_fault, elapsed)
+        RPC_LATENCY.observe(elapsed, method=method, endpoint=endpoint.name, status="error" if node_fault else "ok")
+        if node_fault:
+            raise ConnectionError(f"{endpoint.name}: {error.get('message')}")
+        return response
+
+    # -- provider API --
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method == "eth_chainId" and self._chain_id is not None:
+            return self._chain_id
+        if method == "eth_gasPrice" and self._gas_price is not None:
+            fetched_at, cached = self._gas_price
+            if time.monotonic() - fetched_at < GAS_PRICE_TTL:
+                return cached
+
+        if method in WRITE_METHODS:
+            response = self._failover(method, params)
+        else:
+            response = self._hedged(method, params)
+
+        if "error" not in response:
+            if method == "eth_chainId":
+                self._chain_id = response
+            elif method == "eth_gasPrice":
+                self._gas_price = (time.monotonic(), response)
+        return response
+
+    def _failover(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        errors = []
+        for attempt, endpoint in enumerate(self.ranked()):
+            try:
+                response = self._timed_request(endpoint, method, params)
+            except Exception as exc:
+                errors.append(f"{endpoint.name}: {exc}")
+                logger.warning("RPC %s 失敗於 %s，改用下一個節點: %s", method, endpoint.name, exc)
+                continue
+            # 前一個節點可能已經廣播成功只是逾時；重送時節點會回 already known
+            if (
+                attempt > 0
+                and method == "eth_sendRawTransaction"
+                and "already known" in str(response.get("error", "")).lower()
+            ):
+                return {"jsonrpc": "2.0", "id": response.get("id"), "result": Web3.to_hex(Web3.keccak(hexstr=params[0]))}
+            return response
+        raise AllEndpointsFailed(f"{method} failed on all endpoints: {errors}")
+
+    def _hedged(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        candidates = self.ranked()
+        pending = {}
+        errors = []
+        next_idx = 0
+
+        def launch() -> None:
+            nonlocal next_idx
+            endpoint = candidates[next_idx]
+            next_idx += 1
+            pending[self._executor.submit(self._timed_request, endpoint, method, params)] = endpoint
+
+        launch()
+        while pending:
+            # 還有備援節點時，等 hedge delay 就再送一份；否則等到任一結果回來
+            lead = next(iter(pending.values()))
+            timeout = self._hedge_delay(lead) if next_idx < len(candidates) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.debug("RPC %s 在 %s 太慢，hedge 到 %s", method, lead.name, candidates[next_idx].name)
+                launch()
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as exc:
+                    errors.append(f"{endpoint.name}: {exc}")
+            # 失敗的請求立刻由下一個節點接手
+            if next_idx < len(candidates):
+                launch()
+        raise AllEndpointsFailed(f"{method} failed on all endpoints: {errors}")
+
+    def make_batch_request(self, requests: list[tuple[RPCEndpoint, Any]]) -> list[RPCResponse] | RPCResponse:
+        errors = []
+        for endpoint in self.ranked():
+            start = time.perf_counter()
+            try:
+                if isinstance(endpoint.provider, JSONBaseProvider):
+                    response = endpoint.provider.make_batch_request(requests)
+                else:
+                    # 非 JSON-RPC 的替身節點（例如 EthereumTesterProvider）逐筆模擬
+                    response = [endpoint.provider.make_request(m, p) for m, p in requests]
+            except Exception as exc:
+                endpoint.record(False, time.perf_counter() - start)
+                RPC_LATENCY.observe(time.perf_counter() - start, method="batch", endpoint=endpoint.name, status="error")
+                errors.append(f"{endpoint.name}: {exc}")
+                continue
+            endpoint.record(True, time.perf_counter() - start)
+            RPC_LATENCY.observe(time.perf_counter() - start, method="batch", endpoint=endpoint.name, status="ok")
+            return response
+        raise AllEndpointsFailed(f"batch request failed on all endpoints: {errors}")
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(e.healthy and e.provider.is_connected() for e in self.endpoints)
+
+    # -- health checks --
+    def check_health(self) -> list[dict]:
+        """Probe every endpoint with ``eth_blockNumber`` and eject lagging nodes."""
+        futures = {
+            self._executor.submit(self._timed_request, e, RPCEndpoint("eth_blockNumber"), []): e
+            for e in self.endpoints
+        }
+        for future, endpoint in futures.items():
+            try:
+                result = future.result(timeout=REQUEST_TIMEOUT)["result"]
+                endpoint.block_number = int(result, 16) if isinstance(result, str) else int(result)
+            except Exception as exc:
+                logger.warning("RPC 健康檢查失敗 %s: %s", endpoint.name, exc)
+
+        heights = [e.block_number for e in self.endpoints if e.block_number is not None]
+        if heights:
+            tip = max(heights)
+            for e in self.endpoints:
+                if e.block_number is not None and tip - e.block_number > self.max_lag_blocks:
+                    logger.warning("RPC 節點 %s 落後 %d 個區塊，暫時剔除", e.name, tip - e.block_number)
+                    e.down_until = time.monotonic() + e.COOLDOWN
+        return [e.snapshot() for e in self.endpoints]
+
+
+def make_web3(network: str, endpoints: list[str | BaseProvider] | None = None) -> Web3:
+    """Build a POA-aware ``Web3`` backed by a :class:`PooledProvider` for *network*."""
+    w3 = Web3(PooledProvider(endpoints or endpoints_for(network)))
+    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    return w3
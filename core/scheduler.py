@@ -0,0 +1,144 @@
+"""
+Bounded work scheduler — every piece of slow work goes through a lane for its
+kind (exchange I/O, LLM, chart rendering, chain I/O).
+
+Each lane has a concurrency cap and a bounded priority queue. When the queue
+is full a new request is rejected immediately (``Overloaded``) unless it
+outranks something already waiting, in which case the lowest-priority waiter
+is shed instead. A burst of /chart or /analyze therefore fills its own lane
+and gets a friendly "try again" while /buy and the alert loop keep flowing.
+
+Limits are ``SCHED_<KIND>=concurrency:queue`` in the environment, e.g.
+``SCHED_LLM=2:10``.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from enum import IntEnum
+
+from core.metrics import SCHED_QUEUE_DEPTH, SCHED_REJECTED, SCHED_WAIT
+
+logger = logging.getLogger("quant_sniper.scheduler")
+
+
+class Priority(IntEnum):
+    HIGH = 0     # 交易、警報檢查：使用者在等、而且很快
+    NORMAL = 1   # 一般查詢、圖表、AI 分析
+    LOW = 2      # 可以晚點做的背景工作
+
+
+# kind -> (concurrency, queue size)
+DEFAULT_LIMITS = {
+    "exchange": (8, 100),
+    "llm": (3, 20),
+    "render": (2, 10),
+    "chain": (4, 20),
+}
+
+MESSAGES = {
+    "exchange": "🚦 行情查詢太擁擠了，請幾秒後再試。",
+    "llm": "🚦 AI 分析排隊的人太多了，請稍後再試。",
+    "render": "🚦 圖表產生器忙線中，請稍後再試。",
+    "chain": "🚦 鏈上請求排隊中的太多了，請稍後再試。",
+}
+
+
+class Overloaded(Exception):
+    """Raised when a lane's queue is full; ``message`` is safe to show to users."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.message = MESSAGES.get(kind, "🚦 系統忙碌中，請稍後再試。")
+        super().__init__(f"{kind} lane is full")
+
+
+class _Lane:
+    def __init__(self, kind: str, concurrency: int, max_queue: int) -> None:
+        self.kind = kind
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []  # heap: (priority, seq, future)
+        self._seq = itertools.count()
+
+    def _depth_changed(self) -> None:
+        SCHED_QUEUE_DEPTH.set(len(self._waiters), kind=self.kind)
+
+    def _reject(self) -> Overloaded:
+        SCHED_REJECTED.inc(kind=self.kind)
+        return Overloaded(self.kind)
+
+    async def acquire(self, priority: Priority) -> None:
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            victim = max(self._waiters, default=None)  # 優先度最低、最晚進來的
+            if victim is None or victim[0] <= priority:
+                raise self._reject()
+            self._waiters.remove(victim)
+            heapq.heapify(self._waiters)
+            victim[2].set_exception(self._reject())
+
+        entry = (int(priority), next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        self._depth_changed()
+        future = entry[2]
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()  # 名額已經交給我們了，轉交下一位
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._depth_changed()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # 名額直接轉交，active 不變
+                self._depth_changed()
+                return
+        self.active -= 1
+        self._depth_changed()
+
+
+class WorkScheduler:
+    def __init__(self, limits: dict[str, tuple[int, int]]) -> None:
+        self.lanes = {kind: _Lane(kind, c, q) for kind, (c, q) in limits.items()}
+
+    @classmethod
+    def from_env(cls) -> "WorkScheduler":
+        limits = dict(DEFAULT_LIMITS)
+        for kind in limits:
+            raw = os.getenv(f"SCHED_{kind.upper()}")
+            if raw:
+                concurrency, _, queue = raw.partition(":")
+                limits[kind] = (int(concurrency), int(queue or limits[kind][1]))
+        return cls(limits)
+
+    async def run(self, kind: str, fn, *args, priority: Priority = Priority.NORMAL, **kwargs):
+        """Await ``fn(*args, **kwargs)`` once *kind* has a free slot."""
+        lane = self.lanes[kind]
+        start = time.perf_counter()
+        await lane.acquire(priority)
+        SCHED_WAIT.observe(time.perf_counter() - start, kind=kind)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            lane.release()
+
+    async def run_in_thread(self, kind: str, fn, *args, priority: Priority = Priority.NORMAL, **kwargs):
+        """Like ``run`` for blocking callables (rendering, web3); runs them in a worker thread."""
+        return await self.run(kind, asyncio.to_thread, fn, *args, priority=priority, **kwargs)
+
+
+SCHEDULER = WorkScheduler.from_env()
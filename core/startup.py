@@ -0,0 +1,80 @@
+"""
+Startup helpers — phase timing and skipping redundant slash-command syncs.
+
+``bot.tree.sync()`` is a rate-limited HTTP call that rewrites every global
+command; doing it on every connect slows rolling deploys for nothing. The
+command tree is hashed and the hash stored next to the database; sync only
+runs when the hash (or the application) changes.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+
+from discord import app_commands
+
+logger = logging.getLogger("quant_sniper.startup")
+
+FINGERPRINT_PATH = Path(os.getenv(
+    "COMMAND_TREE_FINGERPRINT_PATH",
+    Path(__file__).resolve().parent.parent / "data" / "command_tree.sha256",
+))
+
+
+class StartupTimer:
+    """Records named phases relative to process start and logs them as one report."""
+
+    def __init__(self, t0: float | None = None) -> None:
+        self.t0 = self._last = time.perf_counter() if t0 is None else t0
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, name: str, seconds: float) -> None:
+        """Record a phase timed by the caller (may overlap others, e.g. concurrent cog loads)."""
+        self.phases.append((name, seconds))
+
+    def lap(self, name: str) -> None:
+        """Record the time since the previous lap (or process start) as *name*."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def since_start(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def report(self) -> str:
+        width = max((len(n) for n, _ in self.phases), default=0)
+        lines = ["Startup timing:"]
+        lines += [f"  {name:<{width}}  {secs * 1000:>8.1f} ms" for name, secs in self.phases]
+        lines.append(f"  {'total':<{width}}  {self.since_start() * 1000:>8.1f} ms")
+        return "\n".join(lines)
+
+
+def command_tree_fingerprint(tree: app_commands.CommandTree, application_id: int | None) -> str:
+    """sha256 over the JSON payload ``tree.sync()`` would upload."""
+    payload = sorted(
+        (cmd.to_dict(tree) for cmd in tree.get_commands()),
+        key=lambda d: (d.get("type", 1), d["name"]),
+    )
+    blob = json.dumps({"application_id": application_id, "commands": payload}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+async def sync_tree_if_changed(tree: app_commands.CommandTree, application_id: int | None,
+                               force: bool = False) -> int | None:
+    """Sync global commands when the tree changed; returns the synced count or None if skipped."""
+    fingerprint = command_tree_fingerprint(tree, application_id)
+    try:
+        stored = FINGERPRINT_PATH.read_text(encoding="utf-8").strip()
+    except OSError:
+        stored = None
+    if stored == fingerprint and not force:
+        logger.info("Command tree unchanged (%s…), skipping sync", fingerprint[:12])
+        return None
+
+    synced = await tree.sync()
+    FINGERPRINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    FINGERPRINT_PATH.write_text(fingerprint + "\n", encoding="utf-8")
+    return len(synced)
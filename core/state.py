@@ -0,0 +1,86 @@
+"""
+Shared state for multi-process (sharded) deployments.
+
+Every worker process opens the same SQLite file in WAL mode: readers never
+block the single writer, and ``busy_timeout`` makes concurrent writers wait
+instead of failing. Singleton background jobs coordinate through a lease
+row — whoever holds an unexpired lease is the leader for that job.
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import logging
+from pathlib import Path
+
+logger = logging.getLogger("quant_sniper.state")
+
+DB_DIR = Path(__file__).resolve().parent.parent / "data"
+DB_PATH = Path(os.getenv("TRADING_DB_PATH", DB_DIR / "trading.db"))
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# 這個程序在 lease 表裡的名字
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def connect(db_path: Path = DB_PATH) -> sqlite3.Connection:
+    """Open the shared database with settings safe for several processes."""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下 NORMAL 仍可保證一致性，只是斷電可能少最後幾筆
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class LeaderLease:
+    """Time-based lease in SQLite; ``try_acquire()`` both takes and renews it.
+
+    A holder that stops renewing (crash, hang) loses the lease after ``ttl``
+    seconds and another process picks it up on its next attempt.
+    """
+
+    def __init__(self, name: str, ttl: float = 90.0, holder: str = WORKER_ID,
+                 db_path: Path = DB_PATH) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder
+        self.conn = connect(db_path)
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS leases (
+                    name       TEXT PRIMARY KEY,
+                    holder     TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+        self.is_leader = False
+
+    def try_acquire(self) -> bool:
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+                """,
+                (self.name, self.holder, now + self.ttl, now),
+            )
+            row = self.conn.execute("SELECT holder FROM leases WHERE name = ?", (self.name,)).fetchone()
+        leader = row is not None and row["holder"] == self.holder
+        if leader != self.is_leader:
+            logger.info("%s lease %s: %s", self.name, "acquired" if leader else "lost", self.holder)
+        self.is_leader = leader
+        return leader
+
+    def release(self) -> None:
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder)
+            )
+        self.is_leader = False
@@ -0,0 +1,152 @@
+"""
+Per-user equity history at three resolutions.
+
+The mark-to-market job passes every valuation to ``EquitySampler``. At most
+once per ``EQUITY_SAMPLE_SECONDS`` it writes the equity of each user into all
+three tiers of ``equity_history``:
+
+* raw: one point per sample, kept ``EQUITY_RAW_RETENTION_HOURS``;
+* hourly: the last sample of each UTC hour, kept ``EQUITY_HOURLY_RETENTION_DAYS``;
+* daily: the last sample of each UTC day, kept ``EQUITY_DAILY_RETENTION_DAYS``.
+
+The coarser tiers are downsampled as rows are written: one UPSERT per bucket,
+where the last value wins. Each tier therefore covers its full retention
+window, and a curve is read from a single tier. A one-year curve is about 365
+daily rows rather than 100k samples.
+
+Users whose equity has not changed since the last sample are skipped, and
+readers carry the previous point forward. Pruning therefore keeps each
+user's newest expired row in every tier. Rows are keyed by ``users.rowid``
+in a WITHOUT ROWID table. The table itself is created by ``TradingDB``.
+"""
+
+import os
+import time
+import sqlite3
+from typing import NamedTuple
+
+SAMPLE_SECONDS = int(os.getenv("EQUITY_SAMPLE_SECONDS", "300"))
+RAW_RETENTION_HOURS = float(os.getenv("EQUITY_RAW_RETENTION_HOURS", "48"))
+HOURLY_RETENTION_DAYS = float(os.getenv("EQUITY_HOURLY_RETENTION_DAYS", "90"))
+DAILY_RETENTION_DAYS = float(os.getenv("EQUITY_DAILY_RETENTION_DAYS", "1825"))
+MAX_POINTS = 800  # 一條曲線最多讀這麼多列，超過就換更粗的層級
+PRUNE_INTERVAL = 3600
+WRITE_CHUNK = 20_000  # 每個交易寫這麼多列就提交，不讓成交等太久的寫入鎖
+
+
+class Tier(NamedTuple):
+    id: int
+    name: str
+    step: int           # 秒；bucket = ts // step（UTC 對齊）
+    retention: float    # 秒
+
+
+TIERS = (
+    Tier(0, "raw", SAMPLE_SECONDS, RAW_RETENTION_HOURS * 3600),
+    Tier(1, "1h", 3600, HOURLY_RETENTION_DAYS * 86400),
+    Tier(2, "1d", 86400, DAILY_RETENTION_DAYS * 86400),
+)
+
+
+def pick_tier(span: float) -> Tier:
+    """The finest tier that still covers *span* seconds within ``MAX_POINTS`` rows."""
+    for tier in TIERS:
+        # 多給一個 step 的餘裕：「最近 2 天」在讀取時會比保留期限多出幾毫秒
+        if span <= tier.retention + tier.step and span / tier.step <= MAX_POINTS + 1:
+            return tier
+    return TIERS[-1]
+
+
+def prune(conn: sqlite3.Connection, now: float | None = None) -> int:
+    """Drop rows past each tier's retention; returns the number deleted.
+
+    Each user's newest row before the cutoff is kept. A user whose equity
+    hasn't changed has no newer rows, and ``read_curve`` needs that row as
+    the seed of the flat line.
+    """
+    now = time.time() if now is None else now
+    deleted = 0
+    with conn:
+        for tier in TIERS:
+            cutoff = int((now - tier.retention) // tier.step)
+            deleted += conn.execute(
+                """
+                DELETE FROM equity_history WHERE tier = ? AND bucket < ?
+                AND (user_rowid, bucket) NOT IN (
+                    SELECT user_rowid, MAX(bucket) FROM equity_history
+                    WHERE tier = ? AND bucket < ? GROUP BY user_rowid
+                )
+                """,
+                (tier.id, cutoff, tier.id, cutoff),
+            ).rowcount
+    return deleted
+
+
+def read_curve(conn: sqlite3.Connection, user_rowid: int, since: float,
+               now: float | None = None) -> tuple[Tier, list[tuple[float, float]]]:
+    """``(tier, [(unix_ts, equity), ...])`` for one user from *since* to *now*.
+
+    The last point before *since* is carried forward to the start of the
+    window, so a user who has not traded for a while still gets a flat line.
+    """
+    now = time.time() if now is None else now
+    tier = pick_tier(now - since)
+    start = int(since // tier.step)
+    seed = conn.execute(
+        "SELECT equity FROM equity_history WHERE tier = ? AND user_rowid = ? AND bucket < ? "
+        "ORDER BY bucket DESC LIMIT 1",
+        (tier.id, user_rowid, start),
+    ).fetchone()
+    rows = conn.execute(
+        "SELECT bucket, equity FROM equity_history WHERE tier = ? AND user_rowid = ? AND bucket >= ? "
+        "ORDER BY bucket",
+        (tier.id, user_rowid, start),
+    ).fetchall()
+    points = [(since, seed[0])] if seed else []
+    points += [(max(bucket * tier.step, since), equity) for bucket, equity in rows]
+    return tier, points
+
+
+class EquitySampler:
+    """Turns the valuation job's output into ``equity_history`` rows.
+
+    Only the process holding the valuation lease should feed it; call
+    ``reset`` when the lease is lost, because another process may write
+    samples in the meantime.
+    """
+
+    def __init__(self) -> None:
+        self._last: dict[int, float] = {}   # user rowid -> 上次寫入的權益
+        self._last_bucket = -1
+        self._pruned_at = 0.0
+
+    def reset(self) -> None:
+        self._last.clear()
+        self._last_bucket = -1
+
+    def sample(self, conn: sqlite3.Connection, rowids: list[int], equity: list[float],
+               now: float | None = None) -> int | None:
+        """Write one sample if a new sample bucket has started; returns the users written, or None if not due."""
+        now = time.time() if now is None else now
+        bucket = int(now // SAMPLE_SECONDS)
+        if bucket == self._last_bucket:
+            return None
+        last = self._last
+        changed = [(r, e) for r, e in zip(rowids, equity) if last.get(r) != e]
+        # 每層各一列：同一個 bucket 內後寫的覆蓋先寫的，等於在寫入時就做完降採樣
+        rows = [(tier.id, r, int(now // tier.step), e) for tier in TIERS for r, e in changed]
+        for start in range(0, len(rows), WRITE_CHUNK):
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO equity_history (tier, user_rowid, bucket, equity) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(tier, user_rowid, bucket) DO UPDATE SET equity = excluded.equity
+                    """,
+                    rows[start:start + WRITE_CHUNK],
+                )
+        last.update(changed)
+        self._last_bucket = bucket
+        if now - self._pruned_at >= PRUNE_INTERVAL:
+            prune(conn, now)
+            self._pruned_at = now
+        return len(changed)
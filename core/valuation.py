@@ -0,0 +1,140 @@
+"""
+Bulk mark-to-market for every paper trader.
+
+One pass reads cash and every position (holdings plus holdings reserved by
+resting sell orders) in a single read transaction. Each distinct symbol is
+priced once, equity and ROI for all users come out of one vectorized NumPy
+pass, and the results are written to ``equity_snapshots``. ``mark_prices``
+keeps the prices used, so ``/portfolio`` can value holdings without calling
+the exchange.
+
+Positions come back keyed by the owner's ``users.rowid``, so lining them up
+with the cash column is a ``searchsorted`` instead of a dict lookup per row.
+The functions take their own connection so the Game cog can run the whole job
+in a worker thread; the tables are created by ``TradingDB``.
+"""
+
+import time
+import sqlite3
+from typing import NamedTuple
+
+import numpy as np
+
+# 持倉 + 賣單凍結的部位，都算使用者的資產
+_POSITIONS = """
+    SELECT user_id, symbol, quantity, avg_price FROM holdings WHERE quantity > 0
+    UNION ALL
+    SELECT user_id, symbol, quantity, avg_price FROM orders WHERE side = 'sell'
+"""
+
+
+class Inputs(NamedTuple):
+    user_ids: list[str]
+    rowids: np.ndarray       # users.rowid，遞增
+    cash: np.ndarray         # 現金 + 買單凍結的 USDT
+    symbols: list[str]
+    positions: np.ndarray    # (m, 4)：owner rowid, symbol index, quantity, avg_price
+    read_at: float
+
+
+class Valuation(NamedTuple):
+    user_ids: list[str]
+    rowids: np.ndarray
+    cash: np.ndarray
+    positions: np.ndarray    # 持倉 + 賣單凍結部位的市值
+    equity: np.ndarray
+    roi_bps: np.ndarray
+    as_of: float             # 讀取帳本的時間；估值反映的是這一刻的持倉
+
+
+def load_inputs(conn: sqlite3.Connection) -> Inputs:
+    """Read every user's cash and every position in one consistent snapshot."""
+    read_at = time.time()
+    conn.execute("BEGIN")  # 兩個查詢讀同一個快照，成交不會被算兩次或漏算
+    try:
+        users = conn.execute(
+            """
+            SELECT u.rowid, u.user_id, u.balance + COALESCE(SUM(o.reserved), 0.0)
+            FROM users u LEFT JOIN orders o ON o.user_id = u.user_id AND o.side = 'buy'
+            GROUP BY u.rowid ORDER BY u.rowid
+            """
+        ).fetchall()
+        rows = conn.execute(
+            f"SELECT u.rowid, p.symbol, p.quantity, p.avg_price FROM ({_POSITIONS}) p "
+            "JOIN users u ON u.user_id = p.user_id"
+        ).fetchall()
+    finally:
+        conn.commit()
+
+    # 幣種編號用 dict（比在 SQL 裡排序或 np.unique 排序字串快）
+    symbol_index: dict[str, int] = {}
+    positions = [(rowid, symbol_index.setdefault(symbol, len(symbol_index)), qty, avg)
+                 for rowid, symbol, qty, avg in rows]
+    return Inputs(
+        user_ids=[r[1] for r in users],
+        rowids=np.array([r[0] for r in users], dtype=np.int64),
+        cash=np.array([r[2] for r in users], dtype=np.float64),
+        symbols=list(symbol_index),
+        positions=np.array(positions, dtype=np.float64).reshape(-1, 4),
+        read_at=read_at,
+    )
+
+
+def value_portfolios(inputs: Inputs, prices: dict[str, float], initial_balance: float) -> Valuation:
+    """Equity / ROI for every user; symbols without a price fall back to their average cost."""
+    n = len(inputs.user_ids)
+    positions = np.zeros(n)
+
+    if len(inputs.positions):
+        owner_rowid, sym_idx, qty, avg = inputs.positions.T
+        owners = np.searchsorted(inputs.rowids, owner_rowid.astype(np.int64))
+        px = np.array([prices.get(s, np.nan) for s in inputs.symbols], dtype=np.float64)[sym_idx.astype(np.intp)]
+        px = np.where(np.isnan(px), avg, px)
+        positions = np.bincount(owners, weights=qty * px, minlength=n)
+
+    equity = inputs.cash + positions
+    roi_bps = np.rint((equity / initial_balance - 1) * 10_000).astype(np.int64)
+    return Valuation(inputs.user_ids, inputs.rowids, inputs.cash, positions, equity, roi_bps, inputs.read_at)
+
+
+def write_snapshot(conn: sqlite3.Connection, valuation: Valuation,
+                   prices: dict[str, float], valued_at: float | None = None) -> None:
+    """Store the valuation and the prices used, and copy equity into the guild rankings.
+
+    Rows are stamped with the time the ledger was read; a user whose row was
+    re-valued by a trade after that keeps the newer row.
+    """
+    valued_at = time.time() if valued_at is None else valued_at
+    rows = zip(
+        valuation.user_ids, valuation.cash.tolist(), valuation.positions.tolist(),
+        valuation.equity.tolist(), valuation.roi_bps.tolist(),
+        [valuation.as_of] * len(valuation.user_ids),
+    )
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO equity_snapshots (user_id, cash, positions, equity, roi_bps, valued_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                cash = excluded.cash, positions = excluded.positions, equity = excluded.equity,
+                roi_bps = excluded.roi_bps, valued_at = excluded.valued_at
+            WHERE excluded.valued_at >= equity_snapshots.valued_at
+            """,
+            rows,
+        )
+        # 只改有變動的列，伺服器排名索引不必每輪整個重寫
+        conn.execute(
+            """
+            UPDATE guild_members SET equity = s.equity, roi_bps = s.roi_bps
+            FROM equity_snapshots s
+            WHERE s.user_id = guild_members.user_id
+              AND (guild_members.equity != s.equity OR guild_members.roi_bps != s.roi_bps)
+            """
+        )
+        conn.executemany(
+            """
+            INSERT INTO mark_prices (symbol, price, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET price = excluded.price, updated_at = excluded.updated_at
+            """,
+            [(s, p, valued_at) for s, p in prices.items()],
+        )
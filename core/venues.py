@@ -0,0 +1,287 @@
+"""
+Price sourcing across several exchanges ("venues") with hedged ticker reads.
+
+``EXCHANGE_VENUES`` lists ccxt exchange ids, primary first
+(e.g. ``binance,okx,bybit``). ``VENUE_SYMBOLS`` is an optional JSON map from
+our unified symbols to each venue's own symbol. A ``*/QUOTE`` key renames the
+quote currency of every pair, and ``null`` marks a pair the venue doesn't list:
+
+    {"coinbase": {"*/USDT": "*/USD", "BNB/USDT": null}}
+
+``fetch_ticker`` asks the primary. If it hasn't answered within its own
+``HEDGE_QUANTILE`` latency, the same read goes to the next venue and the
+first sane answer wins. The extra reads are capped at ``HEDGE_BUDGET`` of all
+requests and spread over the backup venues in turn, so no venue sees
+retries. An answer more than ``VENUE_OUTLIER_BPS`` away from the last
+accepted price needs a second venue to confirm it; otherwise the answer
+closer to the reference is used. A venue whose circuit breaker is open is
+skipped. ``fetch_tickers``, which feeds order matching and
+mark-to-market, fails over between venues and screens every symbol
+against the same reference. OHLCV, order books and market metadata always
+come from the primary, so stored candles and precision rules stay from one
+venue.
+
+With a single venue (the default) this is a pass-through.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+
+import ccxt.async_support as ccxt
+
+from core.metrics import VENUE_HEDGES, VENUE_OUTLIERS
+
+logger = logging.getLogger("quant_sniper.venues")
+
+VENUES = [v.strip() for v in os.getenv("EXCHANGE_VENUES", "binance").split(",") if v.strip()]
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))       # 額外請求最多佔全部請求的比例
+OUTLIER_BPS = float(os.getenv("VENUE_OUTLIER_BPS", "150"))
+REFERENCE_MAX_AGE = 60.0     # 秒；比這更舊的已採用價格不拿來判斷離群
+MIN_HEDGE_DELAY = 0.02
+DEFAULT_HEDGE_DELAY = 0.25   # 樣本還不夠時的 hedge 延遲
+MIN_SAMPLES = 20
+BUDGET_BURST = 5.0
+
+
+def load_symbol_map() -> dict[str, dict[str, str | None]]:
+    raw = os.getenv("VENUE_SYMBOLS", "").strip()
+    return json.loads(raw) if raw else {}
+
+
+class Venue:
+    """One exchange client plus its symbol map and rolling ticker latency."""
+
+    WINDOW = 200
+
+    def __init__(self, name: str, client, symbols: dict[str, str | None] | None = None) -> None:
+        self.name = name
+        self.client = client
+        self.symbols = symbols or {}
+        self.latencies: deque[float] = deque(maxlen=self.WINDOW)
+        self.unsupported: set[str] = set()   # 這個交易所回過 BadSymbol 的交易對
+
+    def symbol_for(self, symbol: str) -> str | None:
+        """This venue's name for *symbol*, or None if it doesn't list it."""
+        if symbol in self.unsupported:
+            return None
+        if symbol in self.symbols:
+            return self.symbols[symbol]
+        base, _, quote = symbol.partition("/")
+        renamed = self.symbols.get(f"*/{quote}", symbol)
+        return renamed.replace("*", base) if renamed else None
+
+    @property
+    def available(self) -> bool:
+        breaker = getattr(self.client, "breaker", None)
+        return breaker is None or breaker.allows()
+
+    def latency_quantile(self, q: float) -> float | None:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        q = self.latency_quantile(HEDGE_QUANTILE)
+        return max(MIN_HEDGE_DELAY, q if q is not None else DEFAULT_HEDGE_DELAY)
+
+
+class VenueRouter:
+    """Drop-in for a ccxt client: hedged ``fetch_ticker``, failover ``fetch_tickers``, the rest from the primary."""
+
+    def __init__(self, venues: list[Venue], hedge_budget: float = HEDGE_BUDGET,
+                 outlier_bps: float = OUTLIER_BPS) -> None:
+        if not venues:
+            raise ValueError("VenueRouter needs at least one venue")
+        self.venues = venues
+        self.hedge_budget = hedge_budget
+        self.outlier = outlier_bps / 10_000
+        self._budget = BUDGET_BURST
+        self._turn = 0
+        self._accepted: dict[str, tuple[float, float]] = {}  # symbol -> (price, time.monotonic())
+        self._background: set[asyncio.Task] = set()
+
+    def __getattr__(self, name: str):
+        # fetch_ohlcv、load_markets、breaker… 都交給主要交易所
+        return getattr(self.venues[0].client, name)
+
+    @property
+    def primary(self):
+        return self.venues[0].client
+
+    async def close(self) -> None:
+        for task in self._background:
+            task.cancel()
+        for venue in self.venues:
+            await venue.client.close()
+
+    # -- routing --
+    def _candidates(self, symbol: str) -> list[Venue]:
+        listed = [v for v in self.venues if v.symbol_for(symbol)]
+        ready = [v for v in listed if v.available]
+        if not ready:
+            return listed[:1]  # 全部熔斷時照樣問主要交易所，讓它回報錯誤
+        # 備援輪流當第一順位，hedge 的負載平均分到各家
+        lead, backups = ready[0], ready[1:]
+        if backups:
+            self._turn = (self._turn + 1) % len(backups)
+            backups = backups[self._turn:] + backups[:self._turn]
+        return [lead, *backups]
+
+    async def _ask(self, venue: Venue, symbol: str) -> dict:
+        start = time.perf_counter()
+        ticker = await venue.client.fetch_ticker(venue.symbol_for(symbol))
+        venue.latencies.append(time.perf_counter() - start)
+        return dict(ticker, symbol=symbol, venue=venue.name)
+
+    def _sane(self, symbol: str, price: float) -> bool:
+        ref = self._accepted.get(symbol)
+        if ref is None or time.monotonic() - ref[1] > REFERENCE_MAX_AGE:
+            return True
+        return abs(price / ref[0] - 1) <= self.outlier
+
+    def _agree(self, a: float, b: float) -> bool:
+        return abs(a / b - 1) <= self.outlier
+
+    def _accept(self, symbol: str, ticker: dict) -> dict:
+        self._accepted[symbol] = (ticker["last"], time.monotonic())
+        return ticker
+
+    async def fetch_ticker(self, symbol: str, params: dict | None = None) -> dict:
+        candidates = self._candidates(symbol)
+        if not candidates:
+            raise ccxt.BadSymbol(f"no venue lists {symbol}")
+        self._budget = min(BUDGET_BURST, self._budget + self.hedge_budget)
+        pending: dict[asyncio.Task, Venue] = {}
+        answers: list[tuple[Venue, dict]] = []
+        errors: list[Exception] = []
+        next_idx = 0
+
+        def launch() -> None:
+            nonlocal next_idx
+            venue = candidates[next_idx]
+            next_idx += 1
+            pending[asyncio.create_task(self._ask(venue, symbol))] = venue
+
+        launch()
+        try:
+            while pending:
+                lead = candidates[0]
+                can_hedge = next_idx < len(candidates) and self._budget >= 1 and not answers
+                timeout = lead.hedge_delay() if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._budget -= 1
+                    VENUE_HEDGES.inc(venue=candidates[next_idx].name)
+                    launch()
+                    continue
+                for task in done:
+                    venue = pending.pop(task)
+                    exc = task.exception()
+                    if exc is not None:
+                        if isinstance(exc, ccxt.BadSymbol) and venue is not self.venues[0]:
+                            venue.unsupported.add(symbol)
+                        errors.append(exc)
+                        continue
+                    answers.append((venue, task.result()))
+                verdict = self._judge(symbol, answers, more=next_idx < len(candidates) or bool(pending))
+                if verdict is not None:
+                    return self._accept(symbol, verdict)
+                # 失敗或離群：立刻交給下一家（不佔 hedge 額度，原本那家不會被重送）
+                if not pending and next_idx < len(candidates):
+                    launch()
+            if answers:
+                return self._accept(symbol, self._judge(symbol, answers, more=False))
+            raise errors[0]
+        finally:
+            for task in pending:
+                # 輸掉的請求讓它跑完，延遲樣本照樣記錄
+                self._background.add(task)
+                task.add_done_callback(self._forget)
+
+    def _judge(self, symbol: str, answers: list[tuple[Venue, dict]], more: bool) -> dict | None:
+        """The answer to use, or None to wait for another venue."""
+        if not answers:
+            return None
+        venue, ticker = answers[-1]
+        if self._sane(symbol, ticker["last"]):
+            return ticker
+        if len(answers) > 1:
+            # 兩家互相印證就是行情真的動了，否則採用離參考價較近的那個
+            first = answers[0][1]
+            if self._agree(first["last"], ticker["last"]):
+                return first
+        if more:
+            return None
+        ref = self._accepted[symbol][0]
+        best_venue, best = min(answers, key=lambda a: abs(a[1]["last"] / ref - 1))
+        for v, t in answers:
+            if t is not best:
+                VENUE_OUTLIERS.inc(venue=v.name)
+                logger.warning("Ignoring %s quote %s from %s (reference %s, %s says %s)",
+                               symbol, t["last"], v.name, ref, best_venue.name, best["last"])
+        return best
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch_tickers(self, symbols: list[str] | None = None, params: dict | None = None) -> dict:
+        """Bulk tickers from the first available venue, failing over on network errors.
+
+        Each symbol goes through the same outlier check as ``fetch_ticker`` (see ``_screen``).
+        """
+        errors: list[Exception] = []
+        for venue in self._candidates(symbols[0]) if symbols else self.venues[:1]:
+            names = {venue.symbol_for(s): s for s in symbols} if symbols else None
+            if names is not None and None in names:
+                continue  # 這家缺某些交易對，整批交給下一家
+            try:
+                tickers = await venue.client.fetch_tickers(list(names) if names else None)
+            except ccxt.NetworkError as exc:
+                errors.append(exc)
+                continue
+            if names is None:
+                return tickers
+            return await self._screen(venue, {
+                names[k]: dict(t, symbol=names[k], venue=venue.name) for k, t in tickers.items() if k in names
+            })
+        if errors:
+            raise errors[0]
+        return await self.primary.fetch_tickers(symbols)
+
+    async def _screen(self, venue: Venue, tickers: dict[str, dict]) -> dict[str, dict]:
+        """Apply ``fetch_ticker``'s outlier check to a bulk result.
+
+        A symbol whose price is far from the last accepted one is asked again
+        through ``fetch_ticker``, which wants a second venue to confirm it.
+        If that fails the symbol is dropped. Matching and mark-to-market then
+        skip it for one cycle instead of filling orders at a bad print.
+        """
+        suspect = []
+        for symbol, ticker in tickers.items():
+            last = ticker.get("last")
+            if not last or self._sane(symbol, last):
+                if last:
+                    self._accept(symbol, ticker)
+                continue
+            suspect.append(symbol)
+            VENUE_OUTLIERS.inc(venue=venue.name)
+            logger.warning("Re-checking %s quote %s from %s bulk tickers (reference %s)",
+                           symbol, last, venue.name, self._accepted[symbol][0])
+        if not suspect:
+            return tickers
+        checked = await asyncio.gather(*(self.fetch_ticker(s) for s in suspect), return_exceptions=True)
+        for symbol, result in zip(suspect, checked):
+            if isinstance(result, BaseException):
+                logger.warning("Dropping %s from bulk tickers: %s", symbol, result)
+                del tickers[symbol]
+            else:
+                tickers[symbol] = result
+        return tickers
@@ -2,11 +2,10 @@
 import os
 import json
 import logging
-from pathlib import Path
 from dotenv import load_dotenv
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from solcx import compile_standard, install_solc
+
+from core.artifacts import compile_contract
+from core.rpc import NETWORKS, endpoints_for, make_web3
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)-8s | %(message)s")
@@ -16,16 +15,12 @@ logger = logging.getLogger("deploy_opbnb")
 load_dotenv()
 
 # Configuration
-OPBNB_RPC_URL = "https://opbnb-testnet-rpc.bnbchain.org"
-CHAIN_ID = 5611
-SOLC_VERSION = "0.8.19"
-CONTRACT_PATH = Path("contracts/Leaderboard.sol")
+CHAIN_ID = NETWORKS["opbnb"]["chain_id"]
 
 def deploy():
     # 1. Setup Web3
-    logger.info(f"Connecting to opBNB Testnet: {OPBNB_RPC_URL}")
-    w3 = Web3(Web3.HTTPProvider(OPBNB_RPC_URL))
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    logger.info(f"Connecting to opBNB Testnet: {', '.join(endpoints_for('opbnb'))}")
+    w3 = make_web3("opbnb")
 
     if not w3.is_connected():
         logger.error("Failed to connect to opBNB RPC.")
@@ -49,29 +44,10 @@ def deploy():
         logger.warning("Faucet: https://testnet.bnbchain.org/faucet-smart/opbnb")
         return
 
-    # 3. Install & Compile Solidity
-    logger.info(f"Installing solc v{SOLC_VERSION}...")
-    install_solc(SOLC_VERSION)
-
-    logger.info(f"Compiling {CONTRACT_PATH}...")
-    with open(CONTRACT_PATH, "r", encoding="utf-8") as f:
-        contract_source = f.read()
-
-    compiled_sol = compile_standard(
-        {
-            "language": "Solidity",
-            "sources": {"Leaderboard.sol": {"content": contract_source}},
-            "settings": {
-                "outputSelection": {
-                    "*": {"*": ["abi", "metadata", "evm.bytecode", "evm.sourceMap"]}
-                }
-            },
-        },
-        solc_version=SOLC_VERSION,
-    )
-
-    bytecode = compiled_sol["contracts"]["Leaderboard.sol"]["Leaderboard"]["evm"]["bytecode"]["object"]
-    abi = compiled_sol["contracts"]["Leaderboard.sol"]["Leaderboard"]["abi"]
+    # 3. Compile Solidity (cached by source hash / solc version / settings)
+    artifact = compile_contract("Leaderboard")
+    bytecode = artifact["bytecode"]
+    abi = artifact["abi"]
 
     # 4. Deploy
     logger.info("Deploying contract...")
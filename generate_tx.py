@@ -1,62 +1,289 @@
+"""
+Leaderboard load generator — submit N synthetic scores as fast as the node allows.
+
+Nonces are assigned up front, transactions are built and signed locally in a
+worker pool and broadcast with configurable concurrency; receipts are polled in
+JSON-RPC batches. Reports throughput, confirmation-latency percentiles and gas.
+Nodes that reject future nonces instead of queueing them need --concurrency 1.
+A send that still fails after --send-retries leaves a nonce gap that every later
+transaction would wait behind, so sending stops there and the gap is reported.
+
+Examples:
+    # local node (anvil / hardhat), deploy a fresh contract from the artifact cache
+    python generate_tx.py --network local --deploy --count 2000 --concurrency 32
+
+    # opBNB testnet, existing contract from .env
+    python generate_tx.py --network opbnb --count 50
+"""
+
 import os
-from web3 import Web3
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from dotenv import load_dotenv
+from web3 import Web3
 
 load_dotenv()
 
-# Setup Web3 Provider
-RPC_URL = os.getenv("OPBNB_RPC_URL", "https://opbnb-testnet-rpc.bnbchain.org")
-web3 = Web3(Web3.HTTPProvider(RPC_URL))
-
-# Contract Info
-CONTRACT_ADDRESS = os.getenv("OPBNB_CONTRACT_ADDRESS", "0x52708366F7A11c166Bb94d398951719F032CB945")
-PRIVATE_KEY = os.getenv("BOT_WALLET_PRIVATE_KEY")
-
-if not PRIVATE_KEY:
-    raise ValueError("Private key missing.")
-
-account = web3.eth.account.from_key(PRIVATE_KEY)
-
-# ABI (Only what we need)
-ABI = [
-    {
-        "inputs": [
-            {"internalType": "string", "name": "discordId", "type": "string"},
-            {"internalType": "int256", "name": "roiBps", "type": "int256"}
-        ],
-        "name": "submitScore",
-        "outputs": [],
-        "stateMutability": "nonpayable",
-        "type": "function"
-    }
-]
-
-contract = web3.eth.contract(address=Web3.to_checksum_address(CONTRACT_ADDRESS), abi=ABI)
-
-def send_tx(discord_id, roi):
-    nonce = web3.eth.get_transaction_count(account.address)
-    
-    # Needs a higher gas limit slightly for submitting new strings
-    tx = contract.functions.submitScore(discord_id, roi).build_transaction({
-        'chainId': 5611, # opBNB testnet chain id
-        'gas': 300000,
-        'gasPrice': web3.eth.gas_price,
-        'nonce': nonce,
+from core.artifacts import compile_contract, load_abi
+from core.rpc import make_web3
+
+# anvil / hardhat 預設的第一個測試帳號，只用於本地節點
+LOCAL_DEV_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def to_int(value) -> int:
+    """Receipt fields are hex strings from HTTP nodes but ints from in-process stand-ins."""
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def deploy_contract(web3: Web3, account, private_key: str) -> str:
+    artifact = compile_contract("Leaderboard")
+    factory = web3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+    tx = factory.constructor().build_transaction({
+        "from": account.address,
+        "nonce": web3.eth.get_transaction_count(account.address, "pending"),
+        "gasPrice": web3.eth.gas_price,
+        "chainId": web3.eth.chain_id,
     })
+    signed = web3.eth.account.sign_transaction(tx, private_key=private_key)
+    receipt = web3.eth.wait_for_transaction_receipt(web3.eth.send_raw_transaction(signed.raw_transaction))
+    print(f"Deployed Leaderboard at {receipt.contractAddress}")
+    return receipt.contractAddress
+
+
+class LoadRun:
+    """One load-generation run: sign → broadcast → confirm, all pipelined."""
+
+    def __init__(self, web3: Web3, contract, account, private_key: str, args) -> None:
+        self.web3 = web3
+        self.contract = contract
+        self.account = account
+        self.private_key = private_key
+        self.args = args
+
+        self.sent_at: dict[str, float] = {}
+        self.nonces: dict[str, int] = {}
+        self.latencies: list[float] = []
+        self.gas_used: list[int] = []
+        self.reverted = 0
+        self.rng = random.Random(args.seed)
+        self._confirmed: set[str] = set()
+        self.send_errors: list[str] = []
+        self.poll_errors: list[str] = []
+        # 第一個重試後仍送不出去的 nonce；之後的交易都會卡在它後面
+        self.nonce_gap: int | None = None
+        self.skipped = 0
+        self._stranded: set[str] = set()
+        self._lock = threading.Lock()
+        self._done_sending = threading.Event()
+
+    def _build_and_sign(self, i: int, roi: int, nonce: int, gas_price: int, chain_id: int, run_id: str) -> bytes:
+        # 直接組 calldata，避免 build_transaction 每筆都打 RPC（estimate / nonce / chainId）
+        tx = {
+            "to": self.contract.address,
+            "data": self.contract.encode_abi("submitScore", args=[f"LOADGEN_{run_id}_{i}", roi]),
+            "gas": self.args.gas,
+            "gasPrice": gas_price,
+            "nonce": nonce,
+            "chainId": chain_id,
+            "value": 0,
+        }
+        return self.web3.eth.account.sign_transaction(tx, private_key=self.private_key).raw_transaction
+
+    def _broadcast(self, nonce: int, raw: bytes) -> None:
+        for attempt in range(self.args.send_retries + 1):
+            with self._lock:
+                if self.nonce_gap is not None and nonce > self.nonce_gap:
+                    self.skipped += 1
+                    return
+            try:
+                tx_hash = self.web3.to_hex(self.web3.eth.send_raw_transaction(raw))
+                break
+            except Exception as exc:
+                if attempt and "already known" in str(exc).lower():
+                    # 前一次其實已送達節點（例如回應逾時），交易雜湊可以自己算
+                    tx_hash = self.web3.to_hex(Web3.keccak(raw))
+                    break
+                with self._lock:
+                    self.send_errors.append(str(exc))
+                if attempt < self.args.send_retries:
+                    time.sleep(0.2 * (attempt + 1))
+        else:
+            # 重送同一筆已簽好的交易仍失敗：停止送出，避免後面的交易都卡在缺口後面
+            with self._lock:
+                if self.nonce_gap is None or nonce < self.nonce_gap:
+                    self.nonce_gap = nonce
+            return
+        with self._lock:
+            self.sent_at[tx_hash] = time.perf_counter()
+            self.nonces[tx_hash] = nonce
+
+    def _poll_receipts(self) -> None:
+        pending: dict[str, float] = {}
+        deadline = None
+        while True:
+            with self._lock:
+                for h, t in self.sent_at.items():
+                    if h not in pending and h not in self._confirmed and h not in self._stranded:
+                        pending[h] = t
+            if self._done_sending.is_set():
+                if self.nonce_gap is not None:
+                    # 缺口之後已送出的交易不會上鏈，不必等到 timeout
+                    for h in [h for h in pending if self.nonces[h] > self.nonce_gap]:
+                        del pending[h]
+                        self._stranded.add(h)
+                if not pending:
+                    return
+                deadline = deadline or time.perf_counter() + self.args.timeout
+                if time.perf_counter() > deadline:
+                    print(f"⚠️ {len(pending)} transaction(s) unconfirmed after {self.args.timeout}s")
+                    return
+
+            hashes = list(pending)[:500]
+            if hashes:
+                try:
+                    responses = self.web3.provider.make_batch_request(
+                        [("eth_getTransactionReceipt", [h]) for h in hashes]
+                    )
+                except Exception as exc:
+                    # 逾時 / 5xx 只是這一輪查不到；執行緒一死，報表就只剩當下已確認的筆數
+                    self.poll_errors.append(str(exc))
+                    print(f"⚠️ Receipt poll failed: {exc}")
+                    time.sleep(self.args.poll_interval)
+                    continue
+                now = time.perf_counter()
+                for h, resp in zip(hashes, responses if isinstance(responses, list) else []):
+                    receipt = resp.get("result")
+                    if not receipt:
+                        continue
+                    self._confirmed.add(h)
+                    self.latencies.append(now - pending.pop(h))
+                    self.gas_used.append(to_int(receipt.get("gasUsed", receipt.get("gas_used", 0))))
+                    if to_int(receipt["status"]) != 1:
+                        self.reverted += 1
+            time.sleep(self.args.poll_interval)
+
+    def run(self) -> dict:
+        web3, args = self.web3, self.args
+        base_nonce = web3.eth.get_transaction_count(self.account.address, "pending")
+        gas_price = int(web3.eth.gas_price * args.gas_price_multiplier)
+        chain_id = web3.eth.chain_id
+        run_id = f"{int(time.time()):x}"
+
+        poller = threading.Thread(target=self._poll_receipts, name="receipts", daemon=True)
+        start = time.perf_counter()
+        poller.start()
+
+        # 簽名與廣播各自一個 pool：簽好一筆就立刻交給廣播端
+        with ThreadPoolExecutor(max_workers=args.signers, thread_name_prefix="sign") as signers, \
+                ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="send") as senders:
+            # 亂數在這裡依序抽完：各簽名執行緒搶 rng 的順序不固定，--seed 就無法重現
+            rois = [self.rng.randint(-5_000, 20_000) for _ in range(args.count)]
+            signed = [
+                signers.submit(self._build_and_sign, i, rois[i], base_nonce + i, gas_price, chain_id, run_id)
+                for i in range(args.count)
+            ]
+            for i, future in enumerate(signed):
+                if self.nonce_gap is not None:
+                    for rest in signed[i:]:
+                        rest.cancel()
+                    with self._lock:
+                        self.skipped += args.count - i
+                    break
+                senders.submit(self._broadcast, base_nonce + i, future.result())
+        send_elapsed = time.perf_counter() - start
+        self._done_sending.set()
+        poller.join()
+        total_elapsed = time.perf_counter() - start
+        if self.nonce_gap is not None:
+            print(f"⚠️ Nonce {self.nonce_gap} could not be sent after {args.send_retries} retries; "
+                  f"stopped sending ({self.skipped} skipped, {len(self._stranded)} stuck behind the gap)")
+
+        confirmed = len(self.latencies)
+        return {
+            "network": args.network,
+            "count": args.count,
+            "concurrency": args.concurrency,
+            "sent": len(self.sent_at),
+            "send_errors": len(self.send_errors),
+            "poll_errors": len(self.poll_errors),
+            "nonce_gap": self.nonce_gap,
+            "skipped": self.skipped,
+            "stranded": len(self._stranded),
+            "confirmed": confirmed,
+            "reverted": self.reverted,
+            "send_seconds": round(send_elapsed, 3),
+            "total_seconds": round(total_elapsed, 3),
+            "send_tps": round(len(self.sent_at) / send_elapsed, 2) if send_elapsed else None,
+            "confirmed_tps": round(confirmed / total_elapsed, 2) if total_elapsed else None,
+            "latency_p50": round(percentile(self.latencies, 0.50), 3),
+            "latency_p90": round(percentile(self.latencies, 0.90), 3),
+            "latency_p99": round(percentile(self.latencies, 0.99), 3),
+            "latency_max": round(max(self.latencies), 3) if self.latencies else None,
+            "gas_total": sum(self.gas_used),
+            "gas_avg": round(sum(self.gas_used) / confirmed) if confirmed else None,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Leaderboard submitScore load generator")
+    parser.add_argument("--network", default="local", choices=["local", "opbnb", "bsc"])
+    parser.add_argument("--rpc", help="comma separated RPC URLs (overrides the network preset)")
+    parser.add_argument("--count", type=int, default=100, help="number of transactions")
+    parser.add_argument("--concurrency", type=int, default=16, help="parallel broadcasts")
+    parser.add_argument("--signers", type=int, default=4, help="signing worker threads")
+    parser.add_argument("--send-retries", type=int, default=3, help="resends of the same signed tx before stopping")
+    parser.add_argument("--gas", type=int, default=300_000, help="gas limit per tx")
+    parser.add_argument("--gas-price-multiplier", type=float, default=1.0)
+    parser.add_argument("--contract", help="Leaderboard address (default: from .env)")
+    parser.add_argument("--deploy", action="store_true", help="deploy a fresh Leaderboard first")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for receipts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    endpoints = args.rpc.split(",") if args.rpc else None
+    web3 = make_web3(args.network, endpoints)
+
+    private_key = os.getenv("BOT_WALLET_PRIVATE_KEY")
+    if args.network == "local":
+        private_key = os.getenv("LOCAL_PRIVATE_KEY", LOCAL_DEV_KEY)
+    if not private_key:
+        raise ValueError("Private key missing.")
+    account = web3.eth.account.from_key(private_key)
+
+    if args.deploy:
+        address = deploy_contract(web3, account, private_key)
+    else:
+        address = args.contract or os.getenv("OPBNB_CONTRACT_ADDRESS") or os.getenv("LEADERBOARD_CONTRACT_ADDRESS")
+    if not address:
+        raise ValueError("No contract address: pass --contract or --deploy.")
+    contract = web3.eth.contract(address=Web3.to_checksum_address(address), abi=load_abi("Leaderboard"))
+
+    print(f"Sending {args.count} submitScore tx(s) from {account.address} "
+          f"with concurrency {args.concurrency}...")
+    report = LoadRun(web3, contract, account, private_key, args).run()
+
+    width = max(len(k) for k in report)
+    for key, value in report.items():
+        print(f"{key:<{width}}  {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
 
-    signed_tx = web3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-    tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-    print(f"Transaction sent: {web3.to_hex(tx_hash)}")
-    
-    receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-    print(f"Transaction mined in block {receipt.blockNumber}")
-
-# Send 2 transactions
-try:
-    print("Sending transaction 1...")
-    send_tx("USER_HACKATHON_JUDGE_1", 1500) # 15% ROI
-    
-    print("\nSending transaction 2...")
-    send_tx("USER_HACKATHON_JUDGE_2", -500) # -5% ROI
-except Exception as e:
-    print(f"Error: {e}")
+if __name__ == "__main__":
+    main()
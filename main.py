@@ -3,6 +3,10 @@ Paper Degen — AI Trading Assistant Discord Bot
 Entry point: loads environment, initialises the bot, and registers cogs.
 """
 
+import time
+
+_T0 = time.perf_counter()  # 在任何重量級 import 之前，啟動報告從這裡起算
+
 import asyncio
 import os
 import logging
@@ -11,6 +15,11 @@ import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
+from core.ratelimit import RateLimited, rate_limit_hook
+from core.startup import StartupTimer, sync_tree_if_changed
+
+startup = StartupTimer(_T0)
+
 # ── Logging ──────────────────────────────────────────────────────────
 logging.basicConfig(
     level=logging.INFO,
@@ -23,6 +32,12 @@ load_dotenv()
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 COMMAND_PREFIX = os.getenv("COMMAND_PREFIX", "!")
+FORCE_TREE_SYNC = os.getenv("FORCE_TREE_SYNC", "").lower() in ("1", "true", "yes")
+
+# 分片模式（由 shard_launcher.py 設定）：SHARD_COUNT 為總分片數，SHARD_IDS 為本程序負責的分片
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()]
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
 
 if not DISCORD_TOKEN:
     raise EnvironmentError("DISCORD_TOKEN is not set in .env")
@@ -31,11 +46,23 @@ if not DISCORD_TOKEN:
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(
-    command_prefix=COMMAND_PREFIX,
-    intents=intents,
-    help_command=commands.DefaultHelpCommand(no_category="General"),
-)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix=COMMAND_PREFIX,
+        intents=intents,
+        help_command=commands.DefaultHelpCommand(no_category="General"),
+        shard_count=SHARD_COUNT,
+        shard_ids=SHARD_IDS or None,
+    )
+else:
+    bot = commands.Bot(
+        command_prefix=COMMAND_PREFIX,
+        intents=intents,
+        help_command=commands.DefaultHelpCommand(no_category="General"),
+    )
+
+# 每個指令實際執行前扣使用者 / 伺服器額度，不夠就立刻回覆 retry-after
+bot.before_invoke(rate_limit_hook)
 
 # ── Cog loader ───────────────────────────────────────────────────────
 COGS = [
@@ -43,30 +70,53 @@ COGS = [
     "cogs.game",
     "cogs.chain",
     "cogs.alert",
+    "cogs.metrics",
+    "cogs.admin",
 ]
 
 
+async def load_cog(cog: str) -> None:
+    start = time.perf_counter()
+    try:
+        await bot.load_extension(cog)
+        logger.info("Loaded cog: %s", cog)
+    except Exception as exc:
+        logger.error("Failed to load cog %s: %s", cog, exc)
+    startup.mark(f"load {cog}", time.perf_counter() - start)
+
+
 async def load_cogs() -> None:
-    for cog in COGS:
-        try:
-            await bot.load_extension(cog)
-            logger.info("Loaded cog: %s", cog)
-        except Exception as exc:
-            logger.error("Failed to load cog %s: %s", cog, exc)
+    # cog 之間互不相依；重的初始化（web3 等）在各自的 cog_load 裡丟到背景
+    await asyncio.gather(*(load_cog(cog) for cog in COGS))
+    startup.lap("load cogs (all)")
 
 
 # ── Events ───────────────────────────────────────────────────────────
+_first_ready = True
+
+
 @bot.event
 async def on_ready() -> None:
+    global _first_ready
     logger.info("Logged in as %s (ID: %s)", bot.user, bot.user.id)
     logger.info("Connected to %d guild(s)", len(bot.guilds))
-
-    # Sync slash commands to Discord
-    try:
-        synced = await bot.tree.sync()
-        logger.info("Synced %d slash command(s)", len(synced))
-    except Exception as exc:
-        logger.error("Failed to sync slash commands: %s", exc)
+    if SHARD_COUNT:
+        logger.info("Worker %d running shard(s) %s of %d", WORKER_INDEX, SHARD_IDS or "all", SHARD_COUNT)
+    # 重新連線時指令樹沒變，只有第一次 ready 需要檢查同步與輸出啟動報告
+    if _first_ready:
+        _first_ready = False
+        startup.lap("connect → ready")
+
+        # Sync slash commands to Discord（指令樹指紋沒變就跳過；多程序時只由 worker 0 同步）
+        if WORKER_INDEX == 0:
+            try:
+                synced = await sync_tree_if_changed(bot.tree, bot.application_id, force=FORCE_TREE_SYNC)
+                if synced is not None:
+                    logger.info("Synced %d slash command(s)", synced)
+            except Exception as exc:
+                logger.error("Failed to sync slash commands: %s", exc)
+        startup.lap("tree sync")
+        logger.info(startup.report())
 
     await bot.change_presence(
         activity=discord.Activity(
@@ -80,6 +130,11 @@ async def on_ready() -> None:
 async def on_command_error(ctx: commands.Context, error: commands.CommandError) -> None:
     if isinstance(error, commands.CommandNotFound):
         return
+    if isinstance(error, RateLimited):
+        await ctx.send(error.message, ephemeral=True)
+        return
+    if ctx.command is not None and ctx.command.has_error_handler():
+        return
     if isinstance(error, commands.MissingRequiredArgument):
         await ctx.send(f"⚠️ 缺少參數：`{error.param.name}`。請使用 `{COMMAND_PREFIX}help` 查看用法。")
         return
@@ -89,6 +144,7 @@ async def on_command_error(ctx: commands.Context, error: commands.CommandError)
 
 # ── Main ─────────────────────────────────────────────────────────────
 async def main() -> None:
+    startup.lap("imports")
     async with bot:
         await load_cogs()
         await bot.start(DISCORD_TOKEN)
@@ -0,0 +1,136 @@
+"""
+Sharded launcher — run the bot as several worker processes, each an
+AutoShardedBot owning a contiguous slice of the shards.
+
+Workers share the SQLite ledger / alert store (WAL mode, see core/state.py);
+singleton jobs such as check_alerts elect a leader through a lease row, so it
+does not matter which worker runs them. Crashed workers are restarted.
+
+Examples:
+    python shard_launcher.py --processes 4                 # shard count recommended by Discord
+    python shard_launcher.py --processes 2 --shards 8
+"""
+
+import os
+import sys
+import signal
+import asyncio
+import logging
+import argparse
+
+import aiohttp
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s")
+logger = logging.getLogger("quant_sniper.launcher")
+
+load_dotenv()
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+IDENTIFY_INTERVAL = 5.0  # Discord：每個 max_concurrency bucket 每 5 秒只能 IDENTIFY 一次
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+async def gateway_info(token: str) -> tuple[int, int]:
+    """Recommended shard count and identify concurrency from ``GET /gateway/bot``."""
+    headers = {"Authorization": f"Bot {token}"}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_BOT_URL, headers=headers) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+    return data["shards"], data["session_start_limit"]["max_concurrency"]
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """Contiguous, as-even-as-possible slices: 10 shards / 3 processes → 4, 3, 3."""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    slices, start = [], 0
+    for i in range(processes):
+        size = base + (1 if i < extra else 0)
+        slices.append(list(range(start, start + size)))
+        start += size
+    return slices
+
+
+class Supervisor:
+    def __init__(self, shard_count: int, slices: list[list[int]], max_concurrency: int,
+                 metrics_port: int) -> None:
+        self.shard_count = shard_count
+        self.slices = slices
+        self.max_concurrency = max(1, max_concurrency)
+        self.metrics_port = metrics_port
+        self.procs: dict[int, asyncio.subprocess.Process] = {}
+        self.stopping = False
+
+    def _env(self, index: int) -> dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "SHARD_COUNT": str(self.shard_count),
+            "SHARD_IDS": ",".join(map(str, self.slices[index])),
+            "WORKER_INDEX": str(index),
+            "WORKER_ID": f"worker-{index}",
+        })
+        if self.metrics_port:
+            env["METRICS_PORT"] = str(self.metrics_port + index)  # 每個 worker 各自一個 port
+        return env
+
+    async def _run_worker(self, index: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        backoff = 1.0
+        while not self.stopping:
+            logger.info("Starting worker %d (shards %s)", index, self.slices[index])
+            proc = await asyncio.create_subprocess_exec(sys.executable, MAIN, env=self._env(index))
+            self.procs[index] = proc
+            code = await proc.wait()
+            if self.stopping:
+                return
+            logger.warning("Worker %d exited with %s, restarting in %.0fs", index, code, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def stop(self) -> None:
+        self.stopping = True
+        for proc in self.procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+
+    async def run(self) -> None:
+        # 錯開啟動時間，避免多個程序同時 IDENTIFY 撞到 rate limit
+        tasks = []
+        elapsed = 0.0
+        for i, shard_ids in enumerate(self.slices):
+            tasks.append(asyncio.create_task(self._run_worker(i, elapsed)))
+            elapsed += IDENTIFY_INTERVAL * len(shard_ids) / self.max_concurrency
+        await asyncio.gather(*tasks)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Run Paper Degen as sharded worker processes")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "2")))
+    parser.add_argument("--shards", type=int, default=int(os.getenv("SHARD_COUNT", "0")),
+                        help="total shard count (default: Discord's recommendation)")
+    args = parser.parse_args()
+
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        raise EnvironmentError("DISCORD_TOKEN is not set in .env")
+
+    recommended, max_concurrency = await gateway_info(token)
+    shard_count = args.shards or recommended
+    slices = split_shards(shard_count, args.processes)
+    logger.info("%d shard(s) across %d process(es), identify concurrency %d",
+                shard_count, len(slices), max_concurrency)
+
+    supervisor = Supervisor(shard_count, slices, max_concurrency, int(os.getenv("METRICS_PORT", "9108")))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, supervisor.stop)
+        except NotImplementedError:  # Windows
+            pass
+    await supervisor.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())